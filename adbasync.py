@@ -0,0 +1,387 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import subprocess
+import collections
+import concurrent.futures
+from colorama import init, Fore, Style
+import adbclient
+
+init()
+
+# Adaptive timeouts: once an operation has been seen a few times, its timeout is
+# FACTOR x the slowest recent run (+1 s), kept between FLOOR and CEILING seconds, and
+# never below the caller's own timeout (fast devices must not cut short a slow one).
+TIMEOUT_FLOOR = 5.0
+TIMEOUT_CEILING = 300.0
+TIMEOUT_FACTOR = 4.0
+TIMEOUT_WINDOW = 50
+TIMEOUT_MIN_SAMPLES = 3
+
+
+class Cancelled(Exception):
+    """The operation's session was cancelled before or while it ran"""
+
+
+class AdaptiveTimeouts:
+    """Timeouts per operation name derived from measured durations instead of fixed guesses"""
+
+    def __init__(self, floor=TIMEOUT_FLOOR, ceiling=TIMEOUT_CEILING, factor=TIMEOUT_FACTOR,
+                 window=TIMEOUT_WINDOW, min_samples=TIMEOUT_MIN_SAMPLES):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.factor = factor
+        self.min_samples = min_samples
+        self.window = window
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.lock = threading.Lock()
+
+    def observe(self, op, seconds):
+        with self.lock:
+            self.samples[op].append(seconds)
+
+    def timeout_for(self, op, default):
+        """Measured timeout for op once enough runs have been seen, but never less than default"""
+        with self.lock:
+            samples = self.samples.get(op)
+            if not samples or len(samples) < self.min_samples:
+                return default
+            slowest = max(samples)
+        return max(default, min(self.ceiling, max(self.floor, slowest * self.factor + 1.0)))
+
+
+TIMEOUTS = AdaptiveTimeouts()
+
+# Listeners get one event dict per adb call start/finish (type "adb"); callers such as
+# phssl.py publish their own install step and fallback branch events on the same bus
+_listeners = []
+
+
+def subscribe(listener):
+    _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def emit(**event):
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception:
+            pass
+
+
+# -- transports -------------------------------------------------------------
+
+async def _request(reader, writer, service):
+    payload = service.encode()
+    writer.write(b"%04x" % len(payload) + payload)
+    await writer.drain()
+    status = await reader.readexactly(4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        length = int(await reader.readexactly(4), 16)
+        raise adbclient.AdbError((await reader.readexactly(length)).decode(errors="replace"))
+    raise adbclient.AdbError(f"unexpected adb server status {status!r}")
+
+
+async def _transport(serial):
+    client = adbclient.get_client()
+    try:
+        reader, writer = await asyncio.open_connection(client.host, client.port)
+    except OSError as e:
+        raise adbclient.AdbServerUnavailable(f"adb server {client.host}:{client.port}: {e}")
+    try:
+        await _request(reader, writer, f"host:transport:{serial}" if serial else "host:transport-any")
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+async def shell(serial, command, stdin=None):
+    """Run a shell command over the adb server socket, returns (exit_code, stdout_bytes, stderr_bytes)"""
+    features = await asyncio.to_thread(adbclient.get_client().features, serial)
+    adbclient.check_shell_stdin(features, stdin)
+    reader, writer = await _transport(serial)
+    try:
+        # Same framing as the blocking client (adbclient), only the socket reads are awaited
+        await _request(reader, writer, adbclient.shell_service(command, features))
+        if "shell_v2" not in features:
+            return adbclient.parse_shell_v1(await reader.read())
+        for packet in adbclient.shell_stdin_packets(stdin):
+            writer.write(packet)
+            await writer.drain()
+        decoder = adbclient.ShellV2Reader()
+        while not decoder.done:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            decoder.feed(chunk)
+        return decoder.result()
+    finally:
+        writer.close()
+
+
+async def wait_for_device(serial):
+    """'adb wait-for-device' on the event loop: OKAY once the request is accepted, again once the device is online"""
+    client = adbclient.get_client()
+    try:
+        reader, writer = await asyncio.open_connection(client.host, client.port)
+    except OSError as e:
+        raise adbclient.AdbServerUnavailable(f"adb server {client.host}:{client.port}: {e}")
+    try:
+        await _request(reader, writer, f"host-serial:{serial}:wait-for-any-device" if serial
+                       else "host:wait-for-any-device")
+        status = await reader.readexactly(4)
+        if status != b"OKAY":
+            raise adbclient.AdbError(f"wait-for-device: unexpected status {status!r}")
+    finally:
+        writer.close()
+
+
+async def run_subprocess(args, serial=None, input=None):
+    """Fork the adb binary without blocking the loop; the process is killed if the caller is cancelled"""
+    cmd = adbclient.adb_command(args, serial)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        return subprocess.CompletedProcess(cmd, 127, "", "adb not found")
+    try:
+        out, err = await process.communicate(input)
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, out.decode(errors="replace"),
+                                       err.decode(errors="replace"))
+
+
+async def _dispatch(args, serial, input, timeout):
+    cmd = adbclient.adb_command(args, serial)
+    if adbclient.BACKEND != "subprocess" and args and adbclient._socket_capable(args):
+        try:
+            if args[0] == "shell":
+                try:
+                    code, out, err = await shell(serial, " ".join(args[1:]), input)
+                except adbclient.AdbServerUnavailable:
+                    raise
+                except (adbclient.AdbError, OSError, asyncio.IncompleteReadError) as e:
+                    return subprocess.CompletedProcess(cmd, 1, "", f"adb: {e}")
+                return subprocess.CompletedProcess(cmd, code, out.decode(errors="replace"), err.decode(errors="replace"))
+            if args[0] == "wait-for-device":
+                try:
+                    await wait_for_device(serial)
+                except adbclient.AdbServerUnavailable:
+                    raise
+                except (adbclient.AdbError, OSError, asyncio.IncompleteReadError) as e:
+                    return subprocess.CompletedProcess(cmd, 1, "", f"adb: {e}")
+                return subprocess.CompletedProcess(cmd, 0, "", "")
+            # Sync and one-shot services reuse the pooled blocking client in a worker thread
+            return await asyncio.to_thread(adbclient.run_socket, args, serial, timeout, input)
+        except adbclient.AdbServerUnavailable:
+            if adbclient.BACKEND == "socket":
+                return subprocess.CompletedProcess(cmd, 1, "", "adb server not reachable")
+    return await run_subprocess(args, serial, input)
+
+
+def payload_size(args, input):
+    """Bytes sent to the device by one command: stdin, or the local files of a push"""
+    if args and args[0] == "push":
+        total = 0
+        for local in args[1:-1]:
+            if os.path.isdir(local):
+                total += sum(os.path.getsize(os.path.join(root, name))
+                             for root, _, names in os.walk(local) for name in names)
+            elif os.path.isfile(local):
+                total += os.path.getsize(local)
+        return total
+    return len(input or b"")
+
+
+async def run(args, serial=None, timeout=10, input=None, op=None, deadline=None):
+    """Run one adb command on the event loop and return a CompletedProcess (rc 124 on timeout)
+
+    op names the operation for adaptive timeouts and progress events (default: args[0]).
+    deadline is an absolute time.monotonic() value no timeout may run past.
+    """
+    op = op or args[0]
+    timeout = TIMEOUTS.timeout_for(op, timeout)
+    if deadline is not None:
+        timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+    command = " ".join(args)[:120]
+    sent = payload_size(args, input)
+    emit(type="adb", serial=serial, op=op, state="start", timeout=timeout)
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(_dispatch(args, serial, input, timeout), timeout)
+    except asyncio.TimeoutError:
+        emit(type="adb", serial=serial, op=op, state="timeout", seconds=time.monotonic() - start,
+             returncode=124, command=command, bytes_out=sent, bytes_in=0)
+        return subprocess.CompletedProcess(adbclient.adb_command(args, serial), 124, "", "Command timed out")
+    except asyncio.CancelledError:
+        emit(type="adb", serial=serial, op=op, state="cancelled", seconds=time.monotonic() - start,
+             command=command, bytes_out=sent, bytes_in=0)
+        raise
+    seconds = time.monotonic() - start
+    if result.returncode != 124:
+        TIMEOUTS.observe(op, seconds)
+    emit(type="adb", serial=serial, op=op, state="done", seconds=seconds, returncode=result.returncode,
+         command=command, bytes_out=sent, bytes_in=len(result.stdout) + len(result.stderr))
+    return result
+
+
+async def run_devices(serials, job, limit=8, budget=None):
+    """Run job(serial) for every serial with at most limit at once; returns {serial: result or exception}
+
+    A device that runs past budget seconds is cancelled and gets an asyncio.TimeoutError.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def one(serial):
+        async with semaphore:
+            return await asyncio.wait_for(job(serial), budget) if budget else await job(serial)
+
+    results = await asyncio.gather(*(one(serial) for serial in serials), return_exceptions=True)
+    return dict(zip(serials, results))
+
+
+# -- bridge for synchronous callers -----------------------------------------
+
+class Session:
+    """Cancellation handle for the operations one synchronous worker submits"""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.cancelled = False
+        self.current = None
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.current is not None:
+                self.current.cancel()
+
+
+class LoopThread:
+    """An event loop in a daemon thread that blocking code submits adb operations to"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="adbasync", daemon=True)
+        self.thread.start()
+
+    def call(self, coro, session=None):
+        if session is not None and session.cancelled:
+            coro.close()
+            raise Cancelled(session.name or "session cancelled")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if session is not None:
+            with session.lock:
+                session.current = future
+                if session.cancelled:
+                    future.cancel()
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise Cancelled(session.name if session else "cancelled")
+        finally:
+            if session is not None:
+                with session.lock:
+                    session.current = None
+
+
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def get_loop_thread():
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = LoopThread()
+        return _loop_thread
+
+
+def run_sync(args, serial=None, timeout=10, input=None, op=None, deadline=None, session=None):
+    """Blocking wrapper around run() for synchronous code; raises Cancelled when session is cancelled"""
+    return get_loop_thread().call(run(args, serial, timeout, input, op, deadline), session)
+
+
+# -- live progress ------------------------------------------------------------
+
+class ProgressBoard:
+    """One live line per device (current operation, operations done, elapsed time), fed by run() events
+
+    On a terminal the lines are redrawn in place; otherwise nothing is drawn and
+    callers print their own per-device results.
+    """
+
+    def __init__(self, serials, stream=None, interval=0.1):
+        self.stream = stream or sys.stdout
+        self.live = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.interval = interval
+        self.start = time.monotonic()
+        self.rows = {serial: {"op": "waiting", "ops": 0, "status": None} for serial in serials}
+        self.lock = threading.Lock()
+        self.drawn = 0
+        self.last_draw = 0.0
+
+    def __enter__(self):
+        subscribe(self)
+        return self
+
+    def __exit__(self, *exc):
+        unsubscribe(self)
+        self.render(force=True)
+
+    def __call__(self, event):
+        row = self.rows.get(event.get("serial"))
+        if row is None or event.get("type") != "adb":
+            return
+        with self.lock:
+            if event["state"] == "start":
+                row["op"] = event["op"]
+            else:
+                row["ops"] += 1
+                if event["state"] != "done":
+                    row["op"] = f"{event['op']} ({event['state']})"
+        self.render()
+
+    def finish(self, serial, status):
+        with self.lock:
+            if serial in self.rows:
+                self.rows[serial]["status"] = status
+        self.render(force=True)
+
+    def render(self, force=False):
+        if not self.live:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_draw < self.interval:
+                return
+            self.last_draw = now
+            lines = []
+            for serial, row in self.rows.items():
+                if row["status"] is None:
+                    color, text = Fore.YELLOW, f"{row['op']}..."
+                else:
+                    color = Fore.GREEN if row["status"].startswith("installed") or row["status"] == "ok" else Fore.RED
+                    text = row["status"]
+                lines.append(color + f"  {serial:<24}{text[:40]:<42}{row['ops']:>4} op(s)" + Style.RESET_ALL)
+            lines.append(Fore.CYAN + f"  {now - self.start:6.1f}s elapsed" + Style.RESET_ALL)
+            out = (f"\x1b[{self.drawn}A" if self.drawn else "") + "".join(f"\x1b[2K{line}\n" for line in lines)
+            self.stream.write(out)
+            self.stream.flush()
+            self.drawn = len(lines)
@@ -0,0 +1,501 @@
+import os
+import stat
+import socket
+import select
+import struct
+import threading
+import subprocess
+
+# Where the local adb server listens (same variables the adb binary honours)
+ADB_HOST = os.environ.get("ANDROID_ADB_SERVER_ADDRESS", "127.0.0.1")
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+
+# socket: always talk to the server directly, subprocess: always fork adb,
+# auto (default): socket, falling back to subprocess when no server answers
+BACKEND = os.environ.get("KALLA_BILLA_ADB_BACKEND", "auto")
+
+# shell v2 packet ids (adb shell_protocol.h)
+SHELL_STDIN, SHELL_STDOUT, SHELL_STDERR, SHELL_EXIT, SHELL_CLOSE_STDIN = 0, 1, 2, 3, 4
+
+SYNC_CHUNK = 64 * 1024
+
+
+class AdbError(Exception):
+    """The adb server answered FAIL or broke the protocol"""
+
+
+class AdbServerUnavailable(ConnectionError):
+    """Nothing answered on the adb server port (nothing was sent to a device)"""
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("connection closed by adb server")
+        data += chunk
+    return data
+
+
+def _recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def check_shell_stdin(features, stdin):
+    """Shell v1 has no stdin channel: a command given stdin there would read nothing (or wait forever)"""
+    if stdin and "shell_v2" not in features:
+        raise AdbError("device has no shell_v2, stdin cannot be sent over shell v1")
+
+
+def shell_service(command, features):
+    """Service string for a shell command: shell v2, or v1 with the exit status on a marker line"""
+    if "shell_v2" in features:
+        return f"shell,v2,raw:{command}"
+    # No exit status in shell v1, so the command reports it itself
+    return f"shell:{command}; printf '\\001KB_RC=%s\\n' $?"
+
+
+def parse_shell_v1(output):
+    """(exit_code, stdout, stderr) from the raw output of a shell_service() v1 command"""
+    head, found, tail = output.rpartition(b"\x01KB_RC=")
+    if not found:
+        return 255, output, b""
+    return int(tail.strip() or b"255"), head, b""
+
+
+def shell_stdin_packets(stdin):
+    """shell v2 packets carrying stdin, ending with the close-stdin packet"""
+    view = memoryview(stdin or b"")
+    for offset in range(0, len(view), SYNC_CHUNK):
+        chunk = view[offset:offset + SYNC_CHUNK]
+        yield struct.pack("<BI", SHELL_STDIN, len(chunk)) + chunk
+    yield struct.pack("<BI", SHELL_CLOSE_STDIN, 0)
+
+
+class ShellV2Reader:
+    """Decodes shell v2 packets from bytes fed as they arrive (blocking and asyncio readers share it)"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.out, self.err = [], []
+        self.code = None
+
+    @property
+    def done(self):
+        return self.code is not None
+
+    def feed(self, data):
+        self.buffer += data
+        while self.code is None and len(self.buffer) >= 5:
+            packet_id, length = struct.unpack("<BI", self.buffer[:5])
+            if len(self.buffer) < 5 + length:
+                break
+            payload = bytes(self.buffer[5:5 + length])
+            del self.buffer[:5 + length]
+            if packet_id == SHELL_STDOUT:
+                self.out.append(payload)
+            elif packet_id == SHELL_STDERR:
+                self.err.append(payload)
+            elif packet_id == SHELL_EXIT:
+                self.code = payload[0] if payload else 0
+
+    def result(self):
+        """(exit_code, stdout, stderr); 255 when the stream ended without an exit packet"""
+        return (255 if self.code is None else self.code), b"".join(self.out), b"".join(self.err)
+
+
+def _parse_devices(text):
+    devices = []
+    for line in text.splitlines():
+        parts = line.strip().split("\t")
+        if len(parts) >= 2:
+            devices.append((parts[0], parts[1]))
+    return devices
+
+
+class AdbClient:
+    """Speaks the adb server protocol on tcp:5037 instead of forking an adb process per command.
+
+    Shell commands use one short-lived socket each (a service consumes its socket), while
+    sync sessions are kept open per device and reused for every push.
+    """
+
+    def __init__(self, host=ADB_HOST, port=ADB_PORT, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sync_pool = {}
+        self._features = {}
+
+    # -- host services ----------------------------------------------------
+
+    def _connect(self, timeout=None):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        except OSError as e:
+            raise AdbServerUnavailable(f"adb server {self.host}:{self.port}: {e}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _request(self, sock, service):
+        payload = service.encode()
+        sock.sendall(b"%04x" % len(payload) + payload)
+        status = _recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self._read_block(sock).decode(errors="replace"))
+        raise AdbError(f"unexpected adb server status {status!r}")
+
+    def _read_block(self, sock):
+        length = int(_recv_exact(sock, 4), 16)
+        return _recv_exact(sock, length)
+
+    def _host_query(self, service):
+        with self._connect() as sock:
+            self._request(sock, service)
+            return self._read_block(sock).decode(errors="replace")
+
+    def version(self):
+        return int(self._host_query("host:version"), 16)
+
+    def devices(self):
+        """Return (serial, state) pairs, like 'adb devices'"""
+        return self._note_devices(_parse_devices(self._host_query("host:devices")))
+
+    def _note_devices(self, devices):
+        """Forget the features of devices that are gone or not online, so they are asked again when back"""
+        online = {serial for serial, state in devices if state == "device"}
+        for key in list(self._features):
+            if key and key not in online:
+                self._features.pop(key, None)
+        return devices
+
+    def track_devices(self, heartbeat=1.0):
+        """Yield the (serial, state) list now and on every change, over one socket ('adb track-devices')
+
+        Yields None when nothing changed for heartbeat seconds, so the caller can run timers.
+        """
+        sock = self._connect()
+        with sock:
+            self._request(sock, "host:track-devices")
+            sock.settimeout(None)
+            while True:
+                if not select.select([sock], [], [], heartbeat)[0]:
+                    yield None
+                    continue
+                yield self._note_devices(_parse_devices(self._read_block(sock).decode(errors="replace")))
+
+    def features(self, serial=None):
+        """Features the server reports for a device; an empty set, not remembered, when it cannot say"""
+        key = serial or ""
+        features = self._features.get(key)
+        if features is None:
+            service = f"host-serial:{serial}:features" if serial else "host:features"
+            try:
+                features = set(self._host_query(service).strip().split(","))
+            except AdbError:
+                # e.g. still authorizing or offline for a moment: ask again next time
+                return set()
+            self._features[key] = features
+        return features
+
+    def connect(self, address):
+        """'adb connect HOST:PORT'; returns (ok, server message)"""
+        message = self._host_query(f"host:connect:{address}").strip()
+        self._features.pop(address, None)
+        return message.startswith(("connected to", "already connected to")), message
+
+    def disconnect(self, address=""):
+        """'adb disconnect [HOST:PORT]' (all TCP devices when no address is given)"""
+        self._features.pop(address, None)
+        return self._host_query(f"host:disconnect:{address}").strip()
+
+    def mdns_services(self):
+        """(instance, service type, 'ip:port') triples the server's own mDNS browser has seen"""
+        services = []
+        for line in self._host_query("host:mdns:services").splitlines():
+            parts = line.strip().split("\t")
+            if len(parts) == 3:
+                services.append(tuple(parts))
+        return services
+
+    def wait_for_device(self, serial, timeout=None):
+        """Block until the device is online ('adb wait-for-device'); the server answers OKAY twice"""
+        service = f"host-serial:{serial}:wait-for-any-device" if serial else "host:wait-for-any-device"
+        with self._connect(timeout) as sock:
+            self._request(sock, service)
+            status = _recv_exact(sock, 4)
+            if status != b"OKAY":
+                raise AdbError(self._read_block(sock).decode(errors="replace") if status == b"FAIL"
+                               else f"unexpected adb server status {status!r}")
+
+    def _transport(self, serial, timeout=None):
+        sock = self._connect(timeout)
+        try:
+            self._request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def service(self, serial, name, timeout=None):
+        """Open a one-shot device service (e.g. 'remount:', 'reboot:') and return its output"""
+        with self._transport(serial, timeout) as sock:
+            self._request(sock, name)
+            return _recv_all(sock)
+
+    # -- shell --------------------------------------------------------------
+
+    def shell(self, serial, command, stdin=None, timeout=None):
+        """Run a shell command, returns (exit_code, stdout_bytes, stderr_bytes)
+
+        Raises AdbError before anything runs when stdin is given and the device only has shell v1.
+        """
+        features = self.features(serial)
+        check_shell_stdin(features, stdin)
+        with self._transport(serial, timeout) as sock:
+            self._request(sock, shell_service(command, features))
+            if "shell_v2" not in features:
+                return parse_shell_v1(_recv_all(sock))
+            for packet in shell_stdin_packets(stdin):
+                sock.sendall(packet)
+            reader = ShellV2Reader()
+            while not reader.done:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                reader.feed(chunk)
+            return reader.result()
+
+    # -- sync ---------------------------------------------------------------
+
+    def _sync_session(self, serial, fresh=False):
+        """Return (socket, reused) for a sync session on this device"""
+        if not fresh:
+            with self._lock:
+                idle = self._sync_pool.get(serial or "")
+                if idle:
+                    return idle.pop(), True
+        sock = self._transport(serial)
+        try:
+            self._request(sock, "sync:")
+        except Exception:
+            sock.close()
+            raise
+        return sock, False
+
+    def _with_sync(self, serial, operation):
+        """Run operation(sock) on a pooled sync session, retrying once if the pooled one went stale"""
+        sock, reused = self._sync_session(serial)
+        try:
+            result = operation(sock)
+        except (OSError, AdbError):
+            sock.close()
+            if not reused:
+                raise
+            sock, reused = self._sync_session(serial, fresh=True)
+            try:
+                result = operation(sock)
+            except Exception:
+                sock.close()
+                raise
+        except Exception:
+            sock.close()
+            raise
+        with self._lock:
+            self._sync_pool.setdefault(serial or "", []).append(sock)
+        return result
+
+    def _sync_stat(self, sock, path):
+        payload = path.encode()
+        sock.sendall(b"STAT" + struct.pack("<I", len(payload)) + payload)
+        reply = _recv_exact(sock, 16)
+        if reply[:4] != b"STAT":
+            raise AdbError(f"bad STAT reply {reply[:4]!r}")
+        return struct.unpack("<III", reply[4:])
+
+    def _sync_send(self, sock, data, remote, mode, mtime):
+        header = f"{remote},{mode}".encode()
+        sock.sendall(b"SEND" + struct.pack("<I", len(header)) + header)
+        view = memoryview(data)
+        for offset in range(0, len(view), SYNC_CHUNK):
+            chunk = view[offset:offset + SYNC_CHUNK]
+            sock.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+        sock.sendall(b"DONE" + struct.pack("<I", int(mtime)))
+        status = _recv_exact(sock, 8)
+        if status[:4] == b"FAIL":
+            length = struct.unpack("<I", status[4:])[0]
+            raise AdbError(_recv_exact(sock, length).decode(errors="replace"))
+        if status[:4] != b"OKAY":
+            raise AdbError(f"bad sync reply {status[:4]!r}")
+
+    def stat(self, serial, path):
+        """Return (mode, size, mtime) of a remote path; mode 0 when it does not exist"""
+        return self._with_sync(serial, lambda sock: self._sync_stat(sock, path))
+
+    def push(self, serial, local_paths, remote):
+        """Push files or directories over one pooled sync session, like 'adb push'. Returns bytes sent."""
+        def operation(sock):
+            sent = 0
+            remote_is_dir = stat.S_ISDIR(self._sync_stat(sock, remote)[0]) or remote.endswith("/")
+            for local in local_paths:
+                base = remote.rstrip("/") + "/" + os.path.basename(local.rstrip("/\\")) if remote_is_dir else remote
+                if os.path.isdir(local):
+                    for dirpath, dirnames, filenames in os.walk(local):
+                        rel = os.path.relpath(dirpath, local).replace(os.sep, "/")
+                        for name in sorted(filenames):
+                            target = base + ("" if rel == "." else "/" + rel) + "/" + name
+                            sent += self._push_file(sock, os.path.join(dirpath, name), target)
+                else:
+                    sent += self._push_file(sock, local, base)
+            return sent
+        return self._with_sync(serial, operation)
+
+    def _push_file(self, sock, local, remote):
+        info = os.stat(local)
+        with open(local, "rb") as f:
+            data = f.read()
+        self._sync_send(sock, data, remote, stat.S_IFREG | (info.st_mode & 0o777), info.st_mtime)
+        return len(data)
+
+    def push_bytes(self, serial, data, remote, mode=0o644, mtime=0):
+        self._with_sync(serial, lambda sock: self._sync_send(sock, data, remote, stat.S_IFREG | mode, mtime))
+
+    def close(self):
+        with self._lock:
+            for sockets in self._sync_pool.values():
+                for sock in sockets:
+                    try:
+                        sock.sendall(b"QUIT" + struct.pack("<I", 0))
+                    except OSError:
+                        pass
+                    sock.close()
+            self._sync_pool.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Shared client for this process"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AdbClient()
+        return _client
+
+
+def adb_command(args, serial=None):
+    """Build an adb command line, targeting one device when a serial is given"""
+    cmd = ['adb']
+    if serial:
+        cmd.extend(['-s', serial])
+    cmd.extend(args)
+    return cmd
+
+
+def run_subprocess(args, serial=None, timeout=10, input=None):
+    """Fork the adb binary; always returns a CompletedProcess with text output (rc 124 on timeout)"""
+    cmd = adb_command(args, serial)
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout, input=input)
+    except subprocess.TimeoutExpired:
+        return subprocess.CompletedProcess(cmd, 124, "", "Command timed out")
+    except FileNotFoundError:
+        return subprocess.CompletedProcess(cmd, 127, "", "adb not found")
+    return subprocess.CompletedProcess(cmd, result.returncode, result.stdout.decode(errors="replace"),
+                                       result.stderr.decode(errors="replace"))
+
+
+def run_socket(args, serial=None, timeout=10, input=None):
+    """Serve 'shell', 'push', 'root', 'remount', 'reboot', 'wait-for-device', 'connect' and 'disconnect' through the socket"""
+    cmd = adb_command(args, serial)
+    client = get_client()
+    try:
+        if args[0] == "remount":
+            output = client.service(serial, "remount:", timeout).decode(errors="replace")
+            return subprocess.CompletedProcess(cmd, 0 if "succeeded" in output else 1, output, "")
+        if args[0] == "root":
+            # adbd restarts as root and drops off the device list for a moment: wait-for-device next
+            output = client.service(serial, "root:", timeout).decode(errors="replace")
+            return subprocess.CompletedProcess(cmd, 1 if "cannot" in output else 0, output, "")
+        if args[0] == "reboot":
+            client.service(serial, "reboot:" + (args[1] if len(args) > 1 else ""), timeout)
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+        if args[0] == "wait-for-device":
+            client.wait_for_device(serial, timeout)
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+        if args[0] == "connect":
+            ok, message = client.connect(args[1])
+            return subprocess.CompletedProcess(cmd, 0 if ok else 1, message + "\n", "")
+        if args[0] == "disconnect":
+            return subprocess.CompletedProcess(cmd, 0, client.disconnect(args[1] if len(args) > 1 else "") + "\n", "")
+        if args[0] == "shell":
+            code, out, err = client.shell(serial, " ".join(args[1:]), stdin=input, timeout=timeout)
+            return subprocess.CompletedProcess(cmd, code, out.decode(errors="replace"), err.decode(errors="replace"))
+        sent = client.push(serial, args[1:-1], args[-1])
+        return subprocess.CompletedProcess(cmd, 0, f"{len(args) - 2} file(s) pushed, {sent} bytes\n", "")
+    except AdbServerUnavailable:
+        raise
+    except socket.timeout:
+        return subprocess.CompletedProcess(cmd, 124, "", "Command timed out")
+    except (AdbError, OSError) as e:
+        return subprocess.CompletedProcess(cmd, 1, "", f"adb: {e}")
+
+
+def _socket_capable(args):
+    if args[0] == "shell":
+        return len(args) >= 2
+    if args[0] == "push":
+        return len(args) >= 3
+    if args[0] == "connect":
+        return len(args) == 2
+    return args[0] in ("root", "remount", "reboot", "wait-for-device", "disconnect")
+
+
+def server_available():
+    """True when an adb server answers on the configured port"""
+    if BACKEND == "subprocess":
+        return False
+    try:
+        get_client().version()
+        return True
+    except (AdbServerUnavailable, AdbError, OSError):
+        return False
+
+
+def run(args, serial=None, timeout=10, input=None):
+    """Run one adb command through the socket client when possible, else through the adb binary"""
+    if BACKEND != "subprocess" and args and _socket_capable(args):
+        try:
+            return run_socket(args, serial, timeout, input)
+        except AdbServerUnavailable:
+            if BACKEND == "socket":
+                return subprocess.CompletedProcess(adb_command(args, serial), 1, "", "adb server not reachable")
+    return run_subprocess(args, serial, timeout, input)
+
+
+def list_devices():
+    """(serial, state) pairs from the server, falling back to 'adb devices'"""
+    if BACKEND != "subprocess":
+        try:
+            return get_client().devices()
+        except (AdbServerUnavailable, socket.timeout, AdbError):
+            if BACKEND == "socket":
+                return []
+    result = run_subprocess(["devices"])
+    devices = []
+    for line in result.stdout.split("\n")[1:]:
+        parts = line.strip().split("\t")
+        if len(parts) >= 2:
+            devices.append((parts[0], parts[1]))
+    return devices
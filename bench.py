@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from colorama import init, Fore, Style
+import adbclient
+import devprofile
+import fakeadb
+import tracing
+
+init()
+
+FLOWS = ["install", "proxy", "convert", "startup"]
+DEFAULT_RESULTS = "bench_results.jsonl"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=HERE)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def latency_stats(values):
+    return {"p50": round(tracing.percentile(values, 50), 4), "p95": round(tracing.percentile(values, 95), 4),
+            "count": len(values)}
+
+
+def install_fake_adb_binary(directory, port, counter):
+    """Put an 'adb' on PATH that forwards each command to the fake server and counts invocations"""
+    if os.name == "nt":
+        path = os.path.join(directory, "adb.bat")
+        with open(path, "w") as f:
+            f.write(f'@"{sys.executable}" "{os.path.join(HERE, "fakeadb.py")}" adb %*\n')
+    else:
+        path = os.path.join(directory, "adb")
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "fakeadb.py")}" adb "$@"\n')
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = directory + os.pathsep + os.environ.get("PATH", "")
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(port)
+    os.environ["FAKEADB_COUNT"] = counter
+
+
+class FakeLab:
+    """A fake adb server with N simulated devices, wired into adbclient for one benchmark run"""
+
+    def __init__(self, devices, latency, jitter, failures, backend):
+        self.devices = fakeadb.make_fleet(devices, latency=latency, jitter=jitter, failures=failures)
+        self.server = fakeadb.FakeAdbServer(self.devices, reboot_seconds=0.5).start()
+        self.backend = backend
+        self.tmp = tempfile.mkdtemp(prefix="kalla_billa_bench_")
+        self.counter = os.path.join(self.tmp, "adb_calls")
+        open(self.counter, "wb").close()
+        self.saved = (adbclient.BACKEND, adbclient.get_client().port, dict(os.environ))
+        adbclient.get_client().close()
+        adbclient.get_client().port = self.server.port
+        adbclient.BACKEND = backend
+        if backend == "subprocess":
+            install_fake_adb_binary(self.tmp, self.server.port, self.counter)
+
+    def serials(self):
+        return [device.serial for device in self.devices if device.state == "device"]
+
+    def subprocess_count(self):
+        return os.path.getsize(self.counter)
+
+    def services(self):
+        return sum(device.counters["services"] for device in self.devices)
+
+    def close(self):
+        adbclient.get_client().close()
+        adbclient.BACKEND, adbclient.get_client().port, environ = self.saved
+        os.environ.clear()
+        os.environ.update(environ)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def bench_install(lab, args):
+    import phssl
+    work = tempfile.mkdtemp(prefix="kalla_billa_bench_certs_")
+    try:
+        import cert
+        hash_, out_file, _ = cert.convert_certificate(os.path.join(HERE, "burp.der"), work)
+        # Profiles would make later repeats faster than the first; keep every run a cold probe
+        phssl.profiles = devprofile.DeviceProfiles(cache_dir=work)
+        serials = [device.serial for device in lab.devices]
+        with tracing.Tracer() as tracer:
+            start = time.perf_counter()
+            results = phssl.install_on_fleet([out_file], serials, args.workers, args.timeout,
+                                             engine=args.engine, transfer=args.transfer)
+            wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    steps = {}
+    for record in tracer.records:
+        if record.get("type") == "step":
+            steps.setdefault(record["step"], []).append(record["seconds"])
+    device_seconds = [summary["total"] for summary in results]
+    statuses = {}
+    for summary in results:
+        statuses[summary["status"]] = statuses.get(summary["status"], 0) + 1
+    return {"wall": wall, "devices": len(results), "per_device": latency_stats(device_seconds),
+            "steps": {step: latency_stats(values) for step, values in sorted(steps.items())},
+            "adb_calls": sum(1 for r in tracer.records if r.get("type") == "adb"),
+            "statuses": statuses}
+
+
+def bench_proxy(lab, args):
+    import setup_wifi
+    serials = lab.serials()
+    with tracing.Tracer() as tracer:
+        start = time.perf_counter()
+        set_results = asyncio.run(setup_wifi.apply_proxy(serials, "s", "10.0.2.2", "8080", args.workers,
+                                                         args.timeout, log=lambda message: None))
+        clear_results = asyncio.run(setup_wifi.apply_proxy(serials, "c", "10.0.2.2", "8080", args.workers,
+                                                           args.timeout, log=lambda message: None))
+        wall = time.perf_counter() - start
+    calls = [r["seconds"] for r in tracer.records if r.get("type") == "adb"]
+    ok = sum(1 for serial in serials if set_results.get(serial) and clear_results.get(serial))
+    return {"wall": wall, "devices": len(serials), "steps": {"settings": latency_stats(calls)},
+            "adb_calls": len(calls), "statuses": {"ok": ok, "failed": len(serials) - ok}}
+
+
+def bench_convert(lab, args):
+    import cert
+    work = tempfile.mkdtemp(prefix="kalla_billa_bench_convert_")
+    try:
+        source = os.path.join(work, "in")
+        os.makedirs(source)
+        # Copies of the bundled certificate: same subject, so the run measures parse/hash/write cost
+        for i in range(args.certs):
+            shutil.copyfile(os.path.join(HERE, "burp.der"), os.path.join(source, f"cert{i:04d}.der"))
+        start = time.perf_counter()
+        manifest, _ = cert.batch_convert(source, os.path.join(work, "out"), args.convert_workers, args.convert_engine)
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    seconds = [entry["seconds"] for entry in manifest["files"]]
+    statuses = {}
+    for entry in manifest["files"]:
+        statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+    return {"wall": wall, "devices": len(seconds), "steps": {"convert": latency_stats(seconds)},
+            "adb_calls": 0, "statuses": statuses}
+
+
+def bench_startup(lab, args):
+    """Time fresh interpreters: the menu straight to exit, and 'main.py install --help'"""
+    commands = {"menu": ([sys.executable, os.path.join(HERE, "main.py")], "0\n"),
+                "install": ([sys.executable, os.path.join(HERE, "main.py"), "install", "--help"], "")}
+    steps, statuses = {}, {}
+    start = time.perf_counter()
+    for _ in range(args.starts):
+        for name, (command, stdin) in commands.items():
+            began = time.perf_counter()
+            result = subprocess.run(command, input=stdin, capture_output=True, text=True, cwd=HERE)
+            steps.setdefault(name, []).append(time.perf_counter() - began)
+            status = "ok" if result.returncode == 0 else "failed"
+            statuses[status] = statuses.get(status, 0) + 1
+    wall = time.perf_counter() - start
+    return {"wall": wall, "devices": sum(statuses.values()),
+            "steps": {name: latency_stats(values) for name, values in steps.items()},
+            "adb_calls": 0, "statuses": statuses, "subprocesses": sum(statuses.values()), "server_services": 0}
+
+
+BENCHES = {"install": bench_install, "proxy": bench_proxy, "convert": bench_convert, "startup": bench_startup}
+# Flows that never talk to a device run without a fake adb server
+OFFLINE_FLOWS = ("convert", "startup")
+
+
+def run_flow(flow, args):
+    if flow in OFFLINE_FLOWS:
+        metrics = BENCHES[flow](None, args)
+        metrics.setdefault("subprocesses", 0)
+        metrics.setdefault("server_services", 0)
+    else:
+        lab = FakeLab(args.devices, args.latency, args.jitter, fakeadb.parse_failures(args.failures), args.backend)
+        try:
+            metrics = BENCHES[flow](lab, args)
+            metrics["subprocesses"] = lab.subprocess_count()
+            metrics["server_services"] = lab.services()
+        finally:
+            lab.close()
+    unit = {"convert": "certs", "startup": "starts"}.get(flow, "devices")
+    metrics["throughput"] = round(metrics["devices"] / metrics["wall"] * 60, 1) if metrics["wall"] else 0.0
+    metrics["unit"] = f"{unit}/min"
+    metrics["wall"] = round(metrics["wall"], 4)
+    return metrics
+
+
+def config_key(args, flow):
+    """Settings that must match for two results to be comparable"""
+    if flow == "convert":
+        return {"flow": flow, "certs": args.certs, "engine": args.convert_engine, "workers": args.convert_workers}
+    if flow == "startup":
+        return {"flow": flow, "starts": args.starts}
+    return {"flow": flow, "devices": args.devices, "latency": args.latency, "jitter": args.jitter,
+            "failures": args.failures, "backend": args.backend, "workers": args.workers,
+            "engine": args.engine if flow == "install" else None,
+            "transfer": args.transfer if flow == "install" else None}
+
+
+def load_results(path):
+    try:
+        return tracing.load([path])
+    except OSError:
+        return []
+
+
+def print_result(result, previous):
+    metrics = result["metrics"]
+    line = (f"{result['config']['flow']:<8} {metrics['throughput']:>9.1f} {metrics['unit']:<12}"
+            f" wall {metrics['wall']:.2f}s  adb calls {metrics['adb_calls']}"
+            f"  subprocesses {metrics['subprocesses']}  statuses {metrics['statuses']}")
+    print(Fore.GREEN + line + Style.RESET_ALL)
+    if previous:
+        before = previous["metrics"]["throughput"]
+        change = (metrics["throughput"] - before) / before * 100 if before else 0.0
+        color = Fore.GREEN if change >= -5 else Fore.RED
+        print(color + f"         vs {previous.get('revision') or '?'} ({before:.1f} {metrics['unit']}): {change:+.1f}%"
+              + Style.RESET_ALL)
+    for step, stats in metrics["steps"].items():
+        old = previous["metrics"]["steps"].get(step) if previous else None
+        delta = f"  (was p50 {old['p50']:.3f}s p95 {old['p95']:.3f}s)" if old else ""
+        print(f"         {step:<10} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  n={stats['count']}{delta}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the install, proxy, convert and startup flows "
+                                                 "against simulated devices")
+    parser.add_argument("flows", nargs="*", help=f"flows to run: {', '.join(FLOWS)} (default: all)")
+    parser.add_argument("--devices", type=int, default=20, help="simulated devices (default: 20)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per adb service (default: 0.02)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="extra random 0..N seconds per service")
+    parser.add_argument("--failures", default="", help="e.g. remount-refused=2,no-su=1,ro-system=1,offline=1")
+    parser.add_argument("--backend", choices=["socket", "subprocess"], default="socket",
+                        help="adb transport: fake server socket, or a fake adb binary per command")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--engine", choices=["script", "steps"], default="script")
+    parser.add_argument("--transfer", choices=["sync", "tar"], default="sync")
+    parser.add_argument("--certs", type=int, default=200, help="certificates for the convert flow")
+    parser.add_argument("--convert-engine", choices=["python", "openssl"], default="python")
+    parser.add_argument("--convert-workers", type=int, default=1)
+    parser.add_argument("--starts", type=int, default=10, help="interpreter launches per command for the startup flow")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="JSON-lines results file (default: %(default)s)")
+    parser.add_argument("--no-save", action="store_true", help="do not append to the results file")
+    args = parser.parse_args(argv)
+    unknown = [flow for flow in args.flows if flow not in FLOWS]
+    if unknown:
+        parser.error(f"unknown flow(s): {', '.join(unknown)} (choose from {', '.join(FLOWS)})")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    history = load_results(args.results)
+    revision = git_revision()
+    print(Fore.CYAN + f"Benchmarking {args.devices} simulated device(s), {args.backend} backend, "
+          f"latency {args.latency}s+{args.jitter}s, failures: {args.failures or 'none'}" + Style.RESET_ALL)
+    for flow in args.flows or FLOWS:
+        config = config_key(args, flow)
+        previous = next((r for r in reversed(history) if r.get("config") == config), None)
+        result = {"revision": revision, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config,
+                  "metrics": run_flow(flow, args)}
+        print_result(result, previous)
+        if not args.no_save:
+            with open(args.results, "a") as f:
+                f.write(json.dumps(result) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,16 @@ import os
 import subprocess
 import shutil
 import random
+import sys
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import re
+import time
+import concurrent.futures
+import certcache
 from colorama import init, Fore, Style
 import colorama
 
@@ -76,6 +86,376 @@ def move_pem_to_hash(pem_file, new_hash):
     except Exception as e:
         raise RuntimeError(f"{Fore.RED}Failed to move {pem_file} to {new_hash}.0: {e}{Style.RESET_ALL}")
 
+# In-process engine: parses the DER itself and computes the legacy subject hash
+# without spawning openssl. The openssl functions above remain the fallback.
+
+# Function to read one DER TLV, returns (tag, content_start, content_end)
+def der_read_tlv(data, pos):
+    if pos + 2 > len(data):
+        raise ValueError("Truncated DER element")
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        num_bytes = length & 0x7F
+        if num_bytes == 0 or num_bytes > 4 or pos + num_bytes > len(data):
+            raise ValueError("Unsupported DER length encoding")
+        length = int.from_bytes(data[pos:pos + num_bytes], "big")
+        pos += num_bytes
+    if pos + length > len(data):
+        raise ValueError("DER element runs past end of data")
+    return tag, pos, pos + length
+
+# Function to list the direct children of a constructed DER element
+def der_children(data, start, end):
+    children = []
+    pos = start
+    while pos < end:
+        tag, content_start, content_end = der_read_tlv(data, pos)
+        children.append((tag, pos, content_start, content_end))
+        pos = content_end
+    return children
+
+# Function to parse the fields we need out of a DER certificate
+def parse_certificate(der):
+    tag, start, end = der_read_tlv(der, 0)
+    if tag != 0x30:
+        raise ValueError("Not a DER encoded certificate")
+    tbs_tag, tbs_header, tbs_start, tbs_end = der_children(der, start, end)[0]
+    if tbs_tag != 0x30:
+        raise ValueError("Certificate is missing tbsCertificate")
+    fields = der_children(der, tbs_start, tbs_end)
+    # Skip the optional explicit [0] version field (absent means v1)
+    version = 1
+    if fields and fields[0][0] == 0xA0:
+        _, _, version_start, version_end = der_children(der, fields[0][2], fields[0][3])[0]
+        version = int.from_bytes(der[version_start:version_end], "big") + 1
+        fields = fields[1:]
+    if len(fields) < 6:
+        raise ValueError("tbsCertificate has too few fields")
+    serial, _, issuer, validity, subject = fields[0], fields[1], fields[2], fields[3], fields[4]
+    # Extensions are the optional explicit [3] after the public key and unique IDs
+    extensions = next((der[f[2]:f[3]] for f in fields[6:] if f[0] == 0xA3), b"")
+    return {
+        "serial": der[serial[2]:serial[3]],
+        "issuer_der": der[issuer[1]:issuer[3]],
+        "validity_der": der[validity[1]:validity[3]],
+        "subject_der": der[subject[1]:subject[3]],
+        "version": version,
+        "extensions_der": extensions,
+    }
+
+# Function to compute OpenSSL's subject_hash_old (MD5 of the subject DER)
+def subject_hash_old(subject_der):
+    digest = hashlib.md5(subject_der).digest()
+    return "%08x" % int.from_bytes(digest[:4], "little")
+
+# Function to wrap DER bytes as a PEM certificate
+def der_to_pem(der):
+    b64 = base64.b64encode(der).decode("ascii")
+    lines = [b64[i:i + 64] for i in range(0, len(b64), 64)]
+    return "-----BEGIN CERTIFICATE-----\n" + "\n".join(lines) + "\n-----END CERTIFICATE-----\n"
+
+# Function to turn certificate bytes (DER or PEM) into DER bytes
+def certificate_der(data):
+    marker = b"-----BEGIN CERTIFICATE-----"
+    if marker in data:
+        body = data.split(marker, 1)[1].split(b"-----END CERTIFICATE-----", 1)[0]
+        return base64.b64decode(b"".join(body.split()))
+    return data
+
+# Function to load a certificate file (DER or PEM) as DER bytes
+def load_certificate_der(path):
+    with open(path, "rb") as f:
+        return certificate_der(f.read())
+
+# Function to get the hash and PEM text of certificate bytes, without touching the disk
+def convert_bytes(data):
+    try:
+        der = certificate_der(data)
+        return subject_hash_old(parse_certificate(der)["subject_der"]), der_to_pem(der)
+    except (ValueError, binascii.Error) as e:
+        raise ValueError(f"not a DER or PEM certificate: {e}")
+
+# Short names for the attributes CA subjects actually use
+NAME_ATTRIBUTES = {"2.5.4.3": "CN", "2.5.4.6": "C", "2.5.4.7": "L", "2.5.4.8": "ST", "2.5.4.10": "O",
+                   "2.5.4.11": "OU", "1.2.840.113549.1.9.1": "emailAddress"}
+
+# Function to decode a DER object identifier into dotted form
+def der_oid(content):
+    parts, value = [], 0
+    for byte in content:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            parts.append(value)
+            value = 0
+    if not parts:
+        raise ValueError("Empty object identifier")
+    first = min(parts[0] // 40, 2)
+    return ".".join(str(p) for p in [first, parts[0] - first * 40] + parts[1:])
+
+# Function to decode a DER string of any of the types used in names
+def der_string(tag, content):
+    if tag == 0x1E:
+        return content.decode("utf-16-be", "replace")
+    if tag == 0x1C:
+        return content.decode("utf-32-be", "replace")
+    if tag == 0x14:
+        return content.decode("latin-1")
+    return content.decode("utf-8", "replace")
+
+# Function to render a DER Name as "CN=..., O=..." in certificate order
+def der_name_text(name_der):
+    tag, start, end = der_read_tlv(name_der, 0)
+    parts = []
+    for _, _, set_start, set_end in der_children(name_der, start, end):
+        for _, _, seq_start, seq_end in der_children(name_der, set_start, set_end):
+            (oid_tag, _, oid_start, oid_end), (value_tag, _, value_start, value_end) = \
+                der_children(name_der, seq_start, seq_end)[:2]
+            oid = der_oid(name_der[oid_start:oid_end])
+            parts.append(f"{NAME_ATTRIBUTES.get(oid, oid)}={der_string(value_tag, name_der[value_start:value_end])}")
+    return ", ".join(parts)
+
+# Function to turn a DER UTCTime/GeneralizedTime into a sortable "YYYY-MM-DDTHH:MM:SSZ"
+def der_time(tag, content):
+    text = content.decode("ascii").rstrip("Z")
+    if tag == 0x17:
+        text = ("19" if int(text[:2]) >= 50 else "20") + text
+    text = text.ljust(14, "0")
+    return f"{text[0:4]}-{text[4:6]}-{text[6:8]}T{text[8:10]}:{text[10:12]}:{text[12:14]}Z"
+
+# Function to map extension OIDs to (critical, extnValue bytes)
+def der_extensions(extensions_der):
+    if not extensions_der:
+        return {}
+    _, start, end = der_read_tlv(extensions_der, 0)
+    extensions = {}
+    for _, _, ext_start, ext_end in der_children(extensions_der, start, end):
+        parts = der_children(extensions_der, ext_start, ext_end)
+        oid = der_oid(extensions_der[parts[0][2]:parts[0][3]])
+        critical = len(parts) == 3 and extensions_der[parts[1][2]:parts[1][3]] not in (b"", b"\0")
+        value = parts[-1]
+        extensions[oid] = (critical, extensions_der[value[2]:value[3]])
+    return extensions
+
+# Function to read what a CA certificate is allowed to do: basicConstraints and keyUsage
+def certificate_constraints(data):
+    try:
+        fields = parse_certificate(certificate_der(data))
+        extensions = der_extensions(fields["extensions_der"])
+        constraints = {"version": fields["version"], "ca": None, "path_len": None, "key_cert_sign": None,
+                       "critical": sorted(oid for oid, (critical, _) in extensions.items() if critical)}
+        if "2.5.29.19" in extensions:
+            value = extensions["2.5.29.19"][1]
+            _, start, end = der_read_tlv(value, 0)
+            constraints["ca"] = False
+            for tag, _, item_start, item_end in der_children(value, start, end):
+                if tag == 0x01:
+                    constraints["ca"] = value[item_start:item_end] not in (b"", b"\0")
+                elif tag == 0x02:
+                    constraints["path_len"] = int.from_bytes(value[item_start:item_end], "big")
+        if "2.5.29.15" in extensions:
+            value = extensions["2.5.29.15"][1]
+            _, start, end = der_read_tlv(value, 0)
+            bits = value[start + 1:end]
+            # keyCertSign is bit 5 of the KeyUsage BIT STRING
+            constraints["key_cert_sign"] = bool(bits and bits[0] & 0x04)
+        return constraints
+    except (ValueError, IndexError, binascii.Error) as e:
+        raise ValueError(f"not a DER or PEM certificate: {e}")
+
+# Function to get the hash, SHA-256 fingerprint, names and validity of certificate bytes
+def certificate_info(data):
+    try:
+        der = certificate_der(data)
+        fields = parse_certificate(der)
+        validity = fields["validity_der"]
+        _, start, end = der_read_tlv(validity, 0)
+        not_before, not_after = [der_time(tag, validity[s:e]) for tag, _, s, e in der_children(validity, start, end)[:2]]
+        return {"hash": subject_hash_old(fields["subject_der"]), "fingerprint": hashlib.sha256(der).hexdigest(),
+                "subject": der_name_text(fields["subject_der"]), "issuer": der_name_text(fields["issuer_der"]),
+                "not_before": not_before, "not_after": not_after, "serial": fields["serial"].lstrip(b"\0").hex() or "00"}
+    except (ValueError, IndexError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"not a DER or PEM certificate: {e}")
+
+# Function to tell openssl whether a file is DER or PEM
+def certificate_inform(path):
+    with open(path, "rb") as f:
+        return "PEM" if b"-----BEGIN CERTIFICATE-----" in f.read() else "DER"
+
+# Function to get the hash with openssl (fallback engine)
+def openssl_subject_hash(path):
+    inform = certificate_inform(path)
+    result = subprocess.run(['openssl', 'x509', '-inform', inform, '-subject_hash_old', '-noout', '-in', path],
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip().split('\n')[0]
+
+# Function to get the hash and PEM text of a certificate file
+def hash_and_pem(path, engine="python"):
+    if engine == "python":
+        try:
+            der = load_certificate_der(path)
+            return subject_hash_old(parse_certificate(der)["subject_der"]), der_to_pem(der)
+        except (ValueError, OSError, binascii.Error):
+            pass
+    try:
+        new_hash = openssl_subject_hash(path)
+        pem = subprocess.run(['openssl', 'x509', '-inform', certificate_inform(path), '-in', path],
+                             capture_output=True, text=True, check=True).stdout
+        return new_hash, pem
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        raise RuntimeError(f"{Fore.RED}Failed to convert {path} with openssl{Style.RESET_ALL}")
+
+# Function to convert a certificate to <hash>.0 in one pass, no burp.pem
+def convert_certificate(path, out_dir=".", engine="python", cache=None):
+    if cache is not None:
+        with open(path, "rb") as f:
+            key = cache.key_for(f.read())
+        hit = cache.get(key)
+        if hit:
+            new_hash, pem = hit[0], hit[1]
+        else:
+            new_hash, pem = hash_and_pem(path, engine)
+            cache.put(key, new_hash, pem, pem_fingerprint(pem))
+        cache.save()
+    else:
+        new_hash, pem = hash_and_pem(path, engine)
+    out_file = os.path.join(out_dir, f"{new_hash}.0")
+    with open(out_file, "w") as f:
+        f.write(pem)
+    return new_hash, out_file, pem
+
+# Function to compare the in-process hash against openssl for some files
+def check_against_openssl(paths):
+    mismatches = 0
+    for path in paths:
+        ours = subject_hash_old(parse_certificate(load_certificate_der(path))["subject_der"])
+        theirs = openssl_subject_hash(path)
+        status = f"{Fore.GREEN}OK" if ours == theirs else f"{Fore.RED}MISMATCH"
+        if ours != theirs:
+            mismatches += 1
+        print(f"{status}{Style.RESET_ALL} {path}: python={ours} openssl={theirs}")
+    return mismatches == 0
+
+# Batch mode: converts a whole directory tree without any prompts.
+
+CERT_EXTENSIONS = (".der", ".pem", ".crt", ".cer")
+
+# Function to find every certificate file below a directory
+def find_certificate_files(root):
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(CERT_EXTENSIONS):
+                found.append(os.path.join(dirpath, name))
+    return found
+
+# Function to get the SHA-256 fingerprint of a one-certificate PEM (the sha256 of its DER)
+def pem_fingerprint(pem):
+    der = base64.b64decode("".join(pem.strip().splitlines()[1:-1]))
+    return hashlib.sha256(der).hexdigest()
+
+# Function run in a worker process: hash one file, never raises
+def batch_worker(path, engine="python"):
+    start = time.perf_counter()
+    try:
+        new_hash, pem = hash_and_pem(path, engine)
+        return {"file": path, "hash": new_hash, "fingerprint": pem_fingerprint(pem), "pem": pem,
+                "status": "ok", "seconds": round(time.perf_counter() - start, 6)}
+    except Exception as e:
+        return {"file": path, "hash": None, "fingerprint": None, "pem": None,
+                "status": "error: " + re.sub(r"\x1b\[[0-9;]*m", "", str(e)), "seconds": round(time.perf_counter() - start, 6)}
+
+# Function to pick <hash>.N the way Android's cacerts expects
+def assign_output_name(out_dir, new_hash, pem, taken):
+    index = 0
+    while True:
+        name = f"{new_hash}.{index}"
+        if name in taken:
+            if taken[name] == pem:
+                return name, "duplicate"
+        else:
+            path = os.path.join(out_dir, name)
+            if not os.path.exists(path):
+                taken[name] = pem
+                return name, "written"
+            with open(path) as f:
+                existing = f.read()
+            taken[name] = existing
+            if existing == pem:
+                return name, "unchanged"
+        index += 1
+
+# Function to convert a directory tree into hashed .0 files with a worker pool
+def batch_convert(root, out_dir, workers=None, engine="python", manifest_path=None, cache=None):
+    files = find_certificate_files(root)
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    results = [None] * len(files)
+    keys = {}
+    # Cache hits are answered here and never reach the pool
+    if cache is not None:
+        for i, path in enumerate(files):
+            lookup_start = time.perf_counter()
+            try:
+                with open(path, "rb") as f:
+                    keys[i] = cache.key_for(f.read())
+            except OSError:
+                continue
+            hit = cache.get(keys[i])
+            if hit:
+                # Entries cached without a fingerprint get theirs from the cached PEM
+                results[i] = {"file": path, "hash": hit[0], "fingerprint": hit[2] or pem_fingerprint(hit[1]),
+                              "pem": hit[1], "status": "ok", "cached": True,
+                              "seconds": round(time.perf_counter() - lookup_start, 6)}
+    pending = [i for i in range(len(files)) if results[i] is None]
+    if workers == 1 or len(pending) < 2:
+        computed = [batch_worker(files[i], engine) for i in pending]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            computed = list(pool.map(batch_worker, [files[i] for i in pending], [engine] * len(pending), chunksize=8))
+    for i, entry in zip(pending, computed):
+        entry["cached"] = False
+        results[i] = entry
+        if cache is not None and i in keys and entry["status"] == "ok":
+            cache.put(keys[i], entry["hash"], entry["pem"], entry["fingerprint"])
+    if cache is not None:
+        cache.save()
+    # Names are assigned here, in input order, so collisions resolve the same way every run
+    taken = {}
+    for entry in results:
+        pem = entry.pop("pem")
+        entry["output"] = None
+        if entry["status"] != "ok":
+            continue
+        name, entry["status"] = assign_output_name(out_dir, entry["hash"], pem, taken)
+        entry["output"] = os.path.join(out_dir, name)
+        if entry["status"] == "written":
+            with open(entry["output"], "w") as f:
+                f.write(pem)
+    manifest = {
+        "root": root,
+        "output_dir": out_dir,
+        "engine": engine,
+        "total_seconds": round(time.perf_counter() - started, 6),
+        "files": results,
+    }
+    manifest_path = manifest_path or os.path.join(out_dir, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest, manifest_path
+
+# Function to print a short summary of a batch run
+def print_batch_summary(manifest, manifest_path):
+    for entry in manifest["files"]:
+        color = Fore.RED if entry["status"].startswith("error") else Fore.GREEN
+        print(f"{color}{entry['status']:<10}{Style.RESET_ALL} {entry['file']} -> {entry['output'] or '-'}")
+    failed = sum(1 for e in manifest["files"] if e["status"].startswith("error"))
+    print(f"{Fore.CYAN}{len(manifest['files'])} file(s), {failed} failed, "
+          f"{manifest['total_seconds']:.2f}s. Manifest: {manifest_path}{Style.RESET_ALL}")
+    return failed == 0
+
 # Function to handle the menu after the file is moved
 def handle_menu():
     print(f"{random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}Options:{Style.RESET_ALL}")
@@ -91,17 +471,23 @@ def main():
     try:
         der_files = list_der_files()
         selected_index = int(input(f"{random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}Enter the serial number of the file you want to convert: {Style.RESET_ALL}"))
-        pem_file = convert_to_pem(selected_index, der_files)
-        new_hash = print_subject_hash_and_certificate(pem_file)
-        move_pem_to_hash(pem_file, new_hash)
+        if not 1 <= selected_index <= len(der_files):
+            raise ValueError(f"{Fore.RED}Invalid selection{Style.RESET_ALL}")
+        selected_file = der_files[selected_index - 1]
+        new_hash, out_file, pem = convert_certificate(selected_file, cache=certcache.CertCache())
+        print(f"{random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}First line: {new_hash}{Style.RESET_ALL}")
+        print(f"{random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}Certificate:{Style.RESET_ALL}")
+        print(pem)
+        print(f"{random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}{selected_file} converted to {out_file}{Style.RESET_ALL}")
         
         while True:
             choice = handle_menu()
             if choice == "1":
                 break
             elif choice == "2":
-                # Run phssl.py script
-                subprocess.run(['python', 'phssl.py'])
+                # Run the installer in this process
+                import phssl
+                phssl.cli([])
             elif choice == "0":
                 print(f"{random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}Exiting...{Style.RESET_ALL}")
                 break
@@ -118,5 +504,38 @@ def main():
     except Exception as e:
         print(f"{Fore.RED}An unexpected error occurred: {e}{Style.RESET_ALL}")
 
-if __name__ == "__main__":
+# Function to parse command line options (no options = interactive menu)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert certificates to Android <hash>.0 files")
+    parser.add_argument("--check-openssl", nargs="+", metavar="CERT",
+                        help="compare the in-process subject hash with openssl for these files")
+    parser.add_argument("--batch", metavar="DIR",
+                        help="convert every .der/.pem/.crt/.cer below DIR without prompting")
+    parser.add_argument("--out", metavar="DIR", default=".",
+                        help="output directory for <hash>.N files in batch mode (default: .)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for batch mode (default: CPU count)")
+    parser.add_argument("--engine", choices=["python", "openssl"], default="python",
+                        help="hashing engine (default: python, falls back to openssl)")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="where to write the batch manifest (default: OUT/manifest.json)")
+    parser.add_argument("--cache-dir", metavar="DIR", default=None,
+                        help="conversion cache directory (default: ~/.cache/kalla_billa)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always convert, never read or write the conversion cache")
+    return parser.parse_args(argv)
+
+# Function to run the converter from the command line (or from main.py) and return an exit code
+def cli(argv=None):
+    args = parse_args(argv)
+    if args.check_openssl:
+        return 0 if check_against_openssl(args.check_openssl) else 1
+    if args.batch:
+        cache = None if args.no_cache else certcache.CertCache(args.cache_dir)
+        manifest, manifest_path = batch_convert(args.batch, args.out, args.workers, args.engine, args.manifest, cache)
+        return 0 if print_batch_summary(manifest, manifest_path) else 1
     main()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
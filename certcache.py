@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from colorama import init, Fore, Style
+
+init()
+
+# Default limits for eviction
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 90
+
+# A blob without an index entry may belong to another process that has not saved its index yet
+ORPHAN_GRACE_SECONDS = 3600
+
+# Function to find the cache directory (KALLA_BILLA_CACHE overrides the default)
+def default_cache_dir():
+    base = os.environ.get("KALLA_BILLA_CACHE")
+    if base:
+        return base
+    xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg, "kalla_billa")
+
+
+class CertCache:
+    """Content-addressed cache: SHA-256 of input bytes -> subject hash and finished .0 text
+
+    save() prunes once the index grows past max_entries or max_bytes, so the cache stays
+    bounded without a manual 'certcache.py prune'.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.root = os.path.join(cache_dir or default_cache_dir(), "certs")
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.index_path = os.path.join(self.root, "index.json")
+        self.index = self._load()
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _blob_path(self, key):
+        return os.path.join(self.blob_dir, f"{key}.0")
+
+    @staticmethod
+    def key_for(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key):
+        """Return (subject_hash, pem, fingerprint) for a key, or None on a miss"""
+        entry = self.index.get(key)
+        if not entry:
+            return None
+        try:
+            with open(self._blob_path(key)) as f:
+                pem = f.read()
+        except OSError:
+            del self.index[key]
+            self.dirty = True
+            return None
+        entry["last_used"] = time.time()
+        self.dirty = True
+        return entry["hash"], pem, entry.get("fingerprint")
+
+    def put(self, key, subject_hash, pem, fingerprint=None):
+        os.makedirs(self.blob_dir, exist_ok=True)
+        tmp = self._blob_path(key) + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(pem)
+        os.replace(tmp, self._blob_path(key))
+        now = time.time()
+        self.index[key] = {"hash": subject_hash, "fingerprint": fingerprint, "size": len(pem),
+                           "created": now, "last_used": now}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        if (len(self.index) > self.max_entries or
+                sum(e.get("size", 0) for e in self.index.values()) > self.max_bytes):
+            # prune() saves the trimmed index itself
+            self.prune(self.max_entries, self.max_bytes)
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+        self.dirty = False
+
+    def _drop(self, key):
+        self.index.pop(key, None)
+        try:
+            os.remove(self._blob_path(key))
+        except OSError:
+            pass
+        self.dirty = True
+
+    def prune(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        """Evict entries past max age, then least recently used ones until under the size limits"""
+        removed = 0
+        cutoff = time.time() - max_age_days * 86400
+        for key in [k for k, e in self.index.items() if e.get("last_used", 0) < cutoff]:
+            self._drop(key)
+            removed += 1
+        by_age = sorted(self.index, key=lambda k: self.index[k].get("last_used", 0))
+        total = sum(e.get("size", 0) for e in self.index.values())
+        while by_age and (len(self.index) > max_entries or total > max_bytes):
+            key = by_age.pop(0)
+            total -= self.index[key].get("size", 0)
+            self._drop(key)
+            removed += 1
+        # Blobs that lost their index entry (e.g. an interrupted run); .tmp files are puts in progress
+        if os.path.isdir(self.blob_dir):
+            orphan_cutoff = time.time() - ORPHAN_GRACE_SECONDS
+            for name in os.listdir(self.blob_dir):
+                if name.endswith(".tmp") or name.split(".")[0] in self.index:
+                    continue
+                path = os.path.join(self.blob_dir, name)
+                try:
+                    if os.path.getmtime(path) < orphan_cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+        self.save()
+        return removed
+
+    def verify(self):
+        """Re-hash every cached .0 and drop entries that are missing or no longer match"""
+        import cert
+        bad = 0
+        for key in list(self.index):
+            try:
+                with open(self._blob_path(key)) as f:
+                    pem = f.read()
+                der = cert.load_certificate_der(self._blob_path(key))
+                ok = (cert.der_to_pem(der) == pem and
+                      cert.subject_hash_old(cert.parse_certificate(der)["subject_der"]) == self.index[key]["hash"])
+            except (OSError, ValueError):
+                ok = False
+            if not ok:
+                self._drop(key)
+                bad += 1
+        self.save()
+        return bad
+
+    def stats(self):
+        return {"entries": len(self.index),
+                "bytes": sum(e.get("size", 0) for e in self.index.values()),
+                "path": self.root}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and maintain the certificate conversion cache")
+    parser.add_argument("command", choices=["stats", "verify", "prune", "clear"])
+    parser.add_argument("--cache-dir", help="cache directory (default: %(default)s)", default=default_cache_dir())
+    parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES)
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024))
+    parser.add_argument("--max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS)
+    args = parser.parse_args(argv)
+
+    cache = CertCache(args.cache_dir, args.max_entries, int(args.max_mb * 1024 * 1024))
+    if args.command == "verify":
+        bad = cache.verify()
+        removed = cache.prune(args.max_entries, int(args.max_mb * 1024 * 1024), args.max_age_days)
+        print(Fore.GREEN + f"Verified cache: {bad} bad entr(ies) dropped, {removed} evicted" + Style.RESET_ALL)
+    elif args.command == "prune":
+        removed = cache.prune(args.max_entries, int(args.max_mb * 1024 * 1024), args.max_age_days)
+        print(Fore.GREEN + f"Pruned {removed} entr(ies)" + Style.RESET_ALL)
+    elif args.command == "clear":
+        removed = cache.prune(max_entries=0)
+        print(Fore.GREEN + f"Cleared {removed} entr(ies)" + Style.RESET_ALL)
+    stats = cache.stats()
+    print(Fore.CYAN + f"{stats['entries']} entr(ies), {stats['bytes']} bytes in {stats['path']}" + Style.RESET_ALL)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from colorama import init, Fore, Style
+from certcache import default_cache_dir
+
+init()
+
+# Profiles older than this are ignored and re-probed
+DEFAULT_TTL_DAYS = 7
+
+
+class DeviceProfiles:
+    """Per-device record of the root, remount and copy methods that worked last time
+
+    Entries are keyed by serial and build fingerprint, so an OTA or a reflashed
+    device starts with a fresh probe.
+    """
+
+    def __init__(self, cache_dir=None, ttl_days=DEFAULT_TTL_DAYS):
+        self.path = os.path.join(cache_dir or default_cache_dir(), "profiles.json")
+        self.ttl = ttl_days * 86400
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key_for(serial, fingerprint):
+        return f"{serial}|{fingerprint}"
+
+    def lookup(self, serial, fingerprint):
+        """Return a copy of the stored profile, or {} when unknown or past its TTL"""
+        with self.lock:
+            entry = self.entries.get(self.key_for(serial, fingerprint))
+            # The TTL runs from the last full probe, not the last successful install
+            if not entry or time.time() - entry.get("probed", 0) > self.ttl:
+                return {}
+            return json.loads(json.dumps(entry))
+
+    def record(self, serial, fingerprint, profile):
+        """Store a profile and write the file; other serials' entries are left alone"""
+        with self.lock:
+            # Only one fingerprint per serial is worth keeping
+            for key in [k for k in self.entries if k.split("|", 1)[0] == serial]:
+                del self.entries[key]
+            entry = dict(profile, serial=serial, fingerprint=fingerprint, updated=time.time())
+            self.entries[self.key_for(serial, fingerprint)] = entry
+            self._save()
+
+    def forget(self, serial=None):
+        """Drop one serial's profile, or all of them"""
+        with self.lock:
+            keys = [k for k in self.entries if serial is None or k.split("|", 1)[0] == serial]
+            for key in keys:
+                del self.entries[key]
+            self._save()
+            return len(keys)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def ordered_methods(methods, profile, kind):
+    """Known-good method first, methods that failed on this device last time dropped
+
+    When every method has failed, all of them are tried again rather than none: the device
+    may have been rooted or unlocked since, and an empty list would skip the step outright.
+    """
+    if not profile:
+        return list(methods)
+    preferred = profile.get(kind)
+    failed = set(profile.get("failed", {}).get(kind, []))
+    ordered = ([m for m in methods if m == preferred] +
+               [m for m in methods if m != preferred and m not in failed])
+    return ordered or list(methods)
+
+
+def note_method(profile, kind, method, ok):
+    """Record the outcome of one method in a profile dict (no-op when profile is None)"""
+    if profile is None:
+        return
+    failed = profile.setdefault("failed", {}).setdefault(kind, [])
+    if ok:
+        profile[kind] = method
+        if method in failed:
+            failed.remove(method)
+    elif method not in failed:
+        failed.append(method)
+        if profile.get(kind) == method:
+            del profile[kind]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or reset stored device capability profiles")
+    parser.add_argument("command", choices=["list", "forget"])
+    parser.add_argument("-s", "--serial", help="only this device serial")
+    parser.add_argument("--cache-dir", help="cache directory (default: %(default)s)", default=default_cache_dir())
+    args = parser.parse_args(argv)
+
+    profiles = DeviceProfiles(args.cache_dir)
+    if args.command == "forget":
+        removed = profiles.forget(args.serial)
+        print(Fore.GREEN + f"Forgot {removed} profile(s)" + Style.RESET_ALL)
+        return 0
+    for entry in profiles.entries.values():
+        if args.serial and entry.get("serial") != args.serial:
+            continue
+        age = (time.time() - entry.get("probed", 0)) / 3600
+        print(Fore.CYAN + f"{entry.get('serial')}  ({entry.get('fingerprint') or 'unknown build'}, "
+              f"{entry.get('store', 'system')} store, probed {age:.1f}h ago)" + Style.RESET_ALL)
+        for kind in ("root", "remount", "copy"):
+            failed = ", ".join(entry.get("failed", {}).get(kind, [])) or "-"
+            print(f"  {kind:<8} {entry.get(kind, '?'):<32} failed: {failed}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
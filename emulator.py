@@ -0,0 +1,358 @@
+import os
+import re
+import sys
+import time
+import socket
+import hashlib
+import argparse
+from colorama import init, Fore, Style
+import phssl
+
+init()
+
+# The console of emulator-<port> listens on 127.0.0.1:<port>; its auth token lives in this file
+CONSOLE_HOST = "127.0.0.1"
+TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".emulator_console_auth_token")
+EMULATOR_SERIAL = re.compile(r"^emulator-(\d+)$")
+
+# Snapshots this suite saves are named after the certificates in them, so a changed set gets a new one
+SNAPSHOT_PREFIX = "kalla_billa-"
+
+# Saving or loading a snapshot writes or reads the whole RAM image
+SNAPSHOT_TIMEOUT = 120
+
+# Loading a snapshot replaces everything running, so on its own it only happens this soon after boot
+FRESH_BOOT_SECONDS = 180
+LOAD_CHOICES = ("auto", "always", "never")
+
+# sha256 of the wanted files in the store conscrypt reads, in one adb call
+STORE_CHECK = "D={cacerts}; [ -d {apex} ] && D={apex}; sha256sum {paths} 2>/dev/null"
+
+
+class ConsoleError(Exception):
+    """The emulator console answered KO, or could not be reached or authenticated"""
+
+
+class EmulatorConsole:
+    """One connection to an emulator console: a line per command, answered by OK or KO: <reason>"""
+
+    def __init__(self, port, host=CONSOLE_HOST, token=None, timeout=10):
+        self.timeout = timeout
+        try:
+            self.sock = socket.create_connection((host, port), timeout)
+        except OSError as e:
+            raise ConsoleError(f"no console on {host}:{port}: {e}") from e
+        self.reader = self.sock.makefile("rb")
+        try:
+            greeting = self._reply()
+            if any("Authentication required" in line for line in greeting):
+                token = console_token() if token is None else token
+                if not token:
+                    raise ConsoleError(f"console needs the auth token from {TOKEN_FILE}")
+                self.command(f"auth {token}")
+        except Exception:
+            self.close()
+            raise
+
+    def _reply(self):
+        lines = []
+        while True:
+            raw = self.reader.readline()
+            if not raw:
+                raise ConsoleError("console closed the connection")
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            if line == "OK":
+                return lines
+            if line.startswith("KO"):
+                raise ConsoleError(line[2:].lstrip(": ") or "command failed")
+            lines.append(line)
+
+    def command(self, text, timeout=None):
+        """Send one command; returns the lines before OK"""
+        self.sock.settimeout(timeout or self.timeout)
+        try:
+            self.sock.sendall(text.encode() + b"\r\n")
+            return self._reply()
+        except socket.timeout as e:
+            raise ConsoleError(f"'{text}' timed out") from e
+
+    def name(self):
+        """AVD name: the same for every instance started from one AVD, and for its snapshots"""
+        lines = self.command("avd name")
+        return lines[0].strip() if lines else ""
+
+    def snapshots(self):
+        # "--  <tag>  <size> <date> <clock>" rows under the header
+        return [line.split()[1] for line in self.command("avd snapshot list") if line.split()[:1] == ["--"]]
+
+    def save(self, name):
+        self.command(f"avd snapshot save {name}", SNAPSHOT_TIMEOUT)
+
+    def load(self, name):
+        self.command(f"avd snapshot load {name}", SNAPSHOT_TIMEOUT)
+
+    def delete(self, name):
+        self.command(f"avd snapshot delete {name}", SNAPSHOT_TIMEOUT)
+
+    def close(self):
+        try:
+            self.sock.sendall(b"quit\r\n")
+        except OSError:
+            pass
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def console_token():
+    try:
+        with open(TOKEN_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def console_port(serial):
+    """Console port of an emulator-<port> serial, or None (emulators reached over 'adb connect' have none here)"""
+    match = EMULATOR_SERIAL.match(serial or "")
+    return int(match.group(1)) if match else None
+
+
+def is_emulator(serial):
+    """emulator-<port> serials are; an adb-over-TCP serial is when ro.kernel.qemu says so. USB phones never are."""
+    if console_port(serial):
+        return True
+    if ":" not in (serial or ""):
+        return False
+    return phssl.run_adb(["shell", "getprop ro.kernel.qemu"], serial, timeout=5).stdout.strip() == "1"
+
+
+def snapshot_name(files):
+    """Snapshot name for a set of <hash>.0 files: the same certificates always map to the same snapshot"""
+    digest = hashlib.sha256()
+    for file in sorted(files, key=os.path.basename):
+        with open(file, "rb") as f:
+            digest.update(f"{os.path.basename(file)}:{hashlib.sha256(f.read()).hexdigest()}\n".encode())
+    return SNAPSHOT_PREFIX + digest.hexdigest()[:12]
+
+
+def has_files(serial, files):
+    """True when every file is already in the device's trust store with the same content"""
+    wanted = {}
+    for file in files:
+        with open(file, "rb") as f:
+            wanted[os.path.basename(file)] = hashlib.sha256(f.read()).hexdigest()
+    command = STORE_CHECK.format(cacerts=phssl.CACERTS_DIR, apex=phssl.APEX_CACERTS_DIR,
+                                 paths=" ".join(f"$D/{name}" for name in wanted))
+    present = {}
+    for line in phssl.run_adb(["shell", command], serial, timeout=10, op="diff").stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            present[os.path.basename(parts[1])] = parts[0].lower()
+    return all(present.get(name) == digest for name, digest in wanted.items())
+
+
+def uptime(serial):
+    """Seconds since the device booted, or None when /proc/uptime cannot be read"""
+    fields = phssl.run_adb(["shell", "cat /proc/uptime"], serial, timeout=5).stdout.split()
+    try:
+        return float(fields[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def may_load(serial, load_snapshot):
+    """Whether a snapshot may replace the running state: when asked to, or ('auto') right after boot"""
+    if load_snapshot != "auto":
+        return load_snapshot == "always"
+    seconds = uptime(serial)
+    return seconds is not None and seconds < FRESH_BOOT_SECONDS
+
+
+def restart_adbd_as_root(serial):
+    """'adb root' unless adbd already runs as root; False on images that do not allow it"""
+    if phssl.run_adb(["shell", "id -u"], serial, timeout=5).stdout.strip() == "0":
+        return True
+    if phssl.run_adb(["root"], serial, timeout=10).returncode != 0:
+        return False
+    return phssl.run_adb(["wait-for-device"], serial, timeout=30).returncode == 0
+
+
+def prepare_system(serial, boot_timeout=180):
+    """adb root + adb remount on an emulator; returns 'writable' or 'read-only'
+
+    On a -writable-system image the first remount only disables verity and asks for a
+    reboot. That reboot happens once per image: the snapshot saved afterwards already has it.
+    """
+    for attempt in range(2):
+        if not restart_adbd_as_root(serial):
+            return "read-only"
+        run = phssl.run_adb(["remount"], serial, timeout=30)
+        if run.returncode == 0:
+            return "writable"
+        if attempt or "reboot" not in run.stdout.lower() or phssl.reboot_and_wait(serial, boot_timeout) is None:
+            break
+    # Started without -writable-system: the live install falls back to the tmpfs overlay
+    return "read-only"
+
+
+def open_console(serial, info):
+    """Console for a serial and its AVD name in info, or None with the reason in info['action']"""
+    port = console_port(serial)
+    if port is None:
+        info["action"] = "no console"
+        return None
+    try:
+        console = EmulatorConsole(port)
+        info["avd"] = console.name()
+        return console
+    except (OSError, ConsoleError) as e:
+        info["action"] = f"no console: {e}"
+        return None
+
+
+def drop_console(console):
+    """Close a console that stopped answering; returns None to put in its place"""
+    try:
+        console.close()
+    except OSError:
+        pass
+    return None
+
+
+def install_on_emulator(serial, files, timeout=None, reboot='never', engine='script', transfer='sync', reprobe=False,
+                        session=None, live=False, restart=(), boot_timeout=180, snapshots=True, load_snapshot="auto"):
+    """phssl.install_on_device with an emulator fast path; other devices go straight through
+
+    An emulator without the certs can load the snapshot saved for this certificate set: RAM
+    and disk come back with the certs installed and every process already trusting them,
+    so only the diff check runs. Loading throws away the running state, so load_snapshot
+    'auto' loads only within FRESH_BOOT_SECONDS of boot ('always' and 'never' decide for
+    the caller). Otherwise adbd restarts as root, /system is remounted (the
+    -writable-system image makes that stick), the live install runs and, when no snapshot
+    exists yet, the result is saved for the next emulator started from the same AVD. Emulators never need the reboot,
+    so reboot is ignored here. A console that fails to list, load or save snapshots is
+    dropped and the install carries on without the fast path.
+    """
+    if not is_emulator(serial):
+        return phssl.install_on_device(serial, files, timeout, reboot, engine, transfer, reprobe, session, live,
+                                       restart, boot_timeout)
+    start = time.monotonic()
+    info = {"avd": None, "snapshot": snapshot_name(files) if snapshots else None, "system": None, "action": "none"}
+    console = open_console(serial, info) if snapshots else None
+    summary = {"serial": serial, "status": "failed", "store": "system", "steps": {}, "runs": []}
+    try:
+        loaded = False
+        present = has_files(serial, files)
+        saved = []
+        if console is not None:
+            try:
+                saved = console.snapshots()
+            except (OSError, ConsoleError) as e:
+                info["action"] = f"snapshot list failed: {e}"
+                console = drop_console(console)
+        if console is not None and info["snapshot"] in saved and not present:
+            if not may_load(serial, load_snapshot):
+                # Loading would throw away what is running; the live install below leaves it alone
+                info["action"] = "not loaded: emulator in use"
+            else:
+                try:
+                    console.load(info["snapshot"])
+                    phssl.run_adb(["wait-for-device"], serial, timeout=30)
+                    info["action"] = loaded = "loaded"
+                except (OSError, ConsoleError) as e:
+                    # e.g. saved with -writable-system, and this instance was started without it
+                    info["action"] = f"load failed: {e}"
+                    console = drop_console(console)
+        if not loaded and not present:
+            with phssl.device_deadline(boot_timeout):
+                info["system"] = prepare_system(serial, boot_timeout)
+        summary = phssl.install_on_device(serial, files, timeout, 'never', engine, transfer, reprobe, session, True,
+                                          restart, boot_timeout)
+        if loaded and summary["status"] == "installed, unchanged":
+            summary["status"] = "installed, snapshot"
+        elif console is not None and info["snapshot"] not in saved and summary["status"].startswith("installed"):
+            try:
+                console.save(info["snapshot"])
+                info["action"] = "saved"
+                summary["status"] += ", snapshot saved"
+            except (OSError, ConsoleError) as e:
+                # The certs are installed; only the next emulator misses the fast path
+                info["action"] = f"save failed: {e}"
+    except phssl.DeviceTimeout:
+        summary["status"] = "timeout"
+    finally:
+        if console is not None:
+            console.close()
+    summary["emulator"] = info
+    summary["total"] = time.monotonic() - start
+    return summary
+
+
+def connect_console(serial):
+    port = console_port(serial)
+    if port is None:
+        raise ConsoleError("not an emulator-<port> serial, no console to reach")
+    return EmulatorConsole(port)
+
+
+def emulator_serials():
+    return [serial for serial, state in phssl.get_connected_devices() if state == "device" and console_port(serial)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Emulator trust-store snapshots (install with phssl.py --fleet)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("list", help="running emulators, their AVD and the snapshots saved for it")
+    show.add_argument("-s", "--serial", action="append", help="only this emulator (repeatable)")
+    delete = sub.add_parser("delete", help="delete snapshots (default: every one this suite saved)")
+    delete.add_argument("serial", help="emulator whose AVD owns the snapshots")
+    delete.add_argument("names", nargs="*", help="snapshot names")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not phssl.check_adb_installed():
+        return 3
+    if args.command == "list":
+        serials = args.serial or emulator_serials()
+        if not serials:
+            print(Fore.YELLOW + "No emulators running." + Style.RESET_ALL)
+            return 0
+        failed = 0
+        for serial in serials:
+            try:
+                with connect_console(serial) as console:
+                    avd, names = console.name(), console.snapshots()
+            except (OSError, ConsoleError) as e:
+                print(Fore.RED + f"{serial}: {e}" + Style.RESET_ALL)
+                failed += 1
+                continue
+            print(Fore.CYAN + f"{serial}: AVD {avd}" + Style.RESET_ALL)
+            for name in names:
+                print(f"  {name}" + (Fore.GREEN + " (certificates)" + Style.RESET_ALL
+                                     if name.startswith(SNAPSHOT_PREFIX) else ""))
+            ours = [name for name in names if name.startswith(SNAPSHOT_PREFIX)]
+            if ours:
+                print(f"  boot pre-trusted: emulator -avd {avd} -writable-system -snapshot {ours[-1]}")
+        return 1 if failed else 0
+    try:
+        with connect_console(args.serial) as console:
+            names = args.names or [name for name in console.snapshots() if name.startswith(SNAPSHOT_PREFIX)]
+            for name in names:
+                console.delete(name)
+                print(f"  {name}: deleted")
+    except (OSError, ConsoleError) as e:
+        print(Fore.RED + f"{args.serial}: {e}" + Style.RESET_ALL)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
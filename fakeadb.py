@@ -0,0 +1,1802 @@
+"""Offline stand-in for an adb server and the devices behind it.
+
+FakeDevice models just enough of a rooted Android phone (a small in-memory filesystem,
+su, remount, tmpfs and bind mounts per mount namespace, settings, getprop) to run the
+commands and generated scripts this suite sends. FakeAdbServer speaks the adb server
+protocol on a local TCP port, so adbclient (and anything built on it) can be exercised
+without hardware:
+
+    python fakeadb.py serve --port 5037 --devices 4
+
+It can also stand in for the adb binary itself (one process per command, talking to
+a fake server), which is how bench.py measures the subprocess backend:
+
+    python fakeadb.py adb -s FAKE001 shell id
+
+Emulators come with a console (the telnet-style port behind each emulator-<port> serial)
+that answers 'avd name' and 'avd snapshot list|save|load|delete'.
+"""
+import os
+import re
+import sys
+import copy
+import random
+import time
+import stat
+import fnmatch
+import hashlib
+import argparse
+import posixpath
+import threading
+import socketserver
+import struct
+
+CACERTS_DIR = "/system/etc/security/cacerts"
+APEX_CACERTS_DIR = "/apex/com.android.conscrypt/cacerts"
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+UPTIME = "/proc/uptime"
+
+# pid -> (name, parent pid) right after boot
+BOOT_PROCESSES = {1: ("init", 0), 600: ("zygote64", 1), 601: ("zygote", 1),
+                  1200: ("com.android.systemui", 600), 1300: ("com.android.chrome", 600)}
+
+# What an emulator snapshot captures (RAM and disk): everything below except serial and counters
+SNAPSHOT_FIELDS = ("files", "meta", "dirs", "tmpfs", "binds", "namespace", "processes", "next_pid", "settings",
+                   "props", "system_rw", "root", "verity")
+
+REMOUNT_METHODS = ["adb", "mount -o rw,remount /system", "mount -o rw,remount /", "mount -o remount,rw /system"]
+
+# Failure modes: FakeDevice keyword overrides for simulated problem devices
+FAILURE_MODES = {
+    "ok": {},
+    "remount-refused": {"remount_methods": ["mount -o rw,remount /"]},   # adb remount refused, su mount works
+    "ro-system": {"remount_methods": []},                                 # /system never becomes writable
+    "no-su": {"root": None},
+    "offline": {"state": "offline"},
+    "apex": {"sdk": 34},                                                  # Android 14: CA store in the conscrypt APEX
+    "shell-v1": {"features": "cmd"},                                      # pre-Android 7 adbd: no stdin over shell
+}
+
+
+class ShellExit(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+class ShellSyntaxError(Exception):
+    pass
+
+
+# -- tokenizer / parser for the small sh subset we generate -----------------
+
+KEYWORDS = {"if", "then", "elif", "else", "fi", "for", "in", "do", "done", "while", "{", "}"}
+OPERATORS = ["&&", "||", ";;", ";", "|", "&", "(", ")", "\n"]
+REDIRECTS = ["2>&1", ">&2", "1>&2", "2>>", "2>", ">>", "1>", ">", "<"]
+
+
+def _scan_subst(text, i):
+    """Return the index just past the ')' closing a '$(' that starts at text[i]"""
+    depth = 0
+    quote = None
+    while i < len(text):
+        c = text[i]
+        if quote:
+            if c == quote:
+                quote = None
+            elif c == "\\" and quote == '"':
+                i += 1
+        elif c in "'\"":
+            quote = c
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise ShellSyntaxError("unterminated $(")
+
+
+def tokenize(text):
+    tokens = []
+    i = 0
+    parts = []
+    bare = ""
+
+    def flush_word():
+        nonlocal parts, bare
+        if bare:
+            parts.append(("bare", bare))
+            bare = ""
+        if parts:
+            tokens.append(("word", parts))
+            parts = []
+
+    while i < len(text):
+        c = text[i]
+        if c in " \t\r":
+            flush_word()
+            i += 1
+        elif c == "#" and not parts and not bare:
+            while i < len(text) and text[i] != "\n":
+                i += 1
+        elif c == "\\":
+            if i + 1 < len(text) and text[i + 1] == "\n":
+                i += 2
+                continue
+            if bare:
+                parts.append(("bare", bare))
+                bare = ""
+            parts.append(("lit", text[i + 1:i + 2]))
+            i += 2
+        elif c == "'":
+            end = text.index("'", i + 1)
+            if bare:
+                parts.append(("bare", bare))
+                bare = ""
+            parts.append(("lit", text[i + 1:end]))
+            i = end + 1
+        elif c == '"':
+            j = i + 1
+            chunk = ""
+            while text[j] != '"':
+                if text[j] == "\\" and text[j + 1] in '"\\$`':
+                    chunk += "\\" + text[j + 1] if text[j + 1] == "$" else text[j + 1]
+                    j += 2
+                elif text.startswith("$(", j):
+                    end = _scan_subst(text, j + 1)
+                    chunk += text[j:end]
+                    j = end
+                else:
+                    chunk += text[j]
+                    j += 1
+            if bare:
+                parts.append(("bare", bare))
+                bare = ""
+            parts.append(("dq", chunk))
+            i = j + 1
+        elif text.startswith("$(", i):
+            end = _scan_subst(text, i + 1)
+            bare += text[i:end]
+            i = end
+        else:
+            redirect = next((r for r in REDIRECTS if text.startswith(r, i)), None)
+            if redirect and not (redirect[0] in "12" and (bare or parts)):
+                flush_word()
+                tokens.append(("redir", redirect))
+                i += len(redirect)
+                continue
+            op = next((o for o in OPERATORS if text.startswith(o, i)), None)
+            if op:
+                flush_word()
+                tokens.append(("op", op))
+                i += len(op)
+                continue
+            bare += c
+            i += 1
+    flush_word()
+    return tokens
+
+
+def _word_text(token):
+    if token[0] == "word" and len(token[1]) == 1 and token[1][0][0] == "bare":
+        return token[1][0][1]
+    return None
+
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ("eof", None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def skip_newlines(self):
+        while self.peek() in (("op", "\n"), ("op", ";")):
+            self.pos += 1
+
+    def expect_word(self, text):
+        self.skip_newlines()
+        token = self.take()
+        if _word_text(token) != text:
+            raise ShellSyntaxError(f"expected {text}, got {token}")
+
+    def at_keyword(self, *words):
+        return _word_text(self.peek()) in words
+
+    def parse_list(self, stop=()):
+        items = []
+        connector = None
+        self.skip_newlines()
+        while self.peek()[0] != "eof" and not self.at_keyword(*stop) and self.peek() != ("op", ")"):
+            items.append((connector, self.parse_pipeline()))
+            token = self.peek()
+            if token[0] == "op" and token[1] in ("&&", "||"):
+                connector = token[1]
+                self.take()
+                self.skip_newlines()
+            elif token[0] == "op" and token[1] in (";", "\n", "&"):
+                connector = ";"
+                self.skip_newlines()
+            else:
+                connector = ";"
+        return ("list", items)
+
+    def parse_pipeline(self):
+        negate = False
+        if _word_text(self.peek()) == "!":
+            self.take()
+            negate = True
+        commands = [self.parse_command()]
+        while self.peek() == ("op", "|"):
+            self.take()
+            self.skip_newlines()
+            commands.append(self.parse_command())
+        return ("pipe", commands, negate)
+
+    def parse_command(self):
+        word = _word_text(self.peek())
+        if word == "if":
+            self.take()
+            branches = []
+            cond = self.parse_list(("then",))
+            self.expect_word("then")
+            body = self.parse_list(("elif", "else", "fi"))
+            branches.append((cond, body))
+            otherwise = None
+            while True:
+                word = _word_text(self.take())
+                if word == "elif":
+                    cond = self.parse_list(("then",))
+                    self.expect_word("then")
+                    branches.append((cond, self.parse_list(("elif", "else", "fi"))))
+                elif word == "else":
+                    otherwise = self.parse_list(("fi",))
+                    self.expect_word("fi")
+                    break
+                elif word == "fi":
+                    break
+                else:
+                    raise ShellSyntaxError("bad if")
+            return ("if", branches, otherwise, self.parse_redirects())
+        if word in ("for", "while"):
+            self.take()
+            if word == "for":
+                name = _word_text(self.take())
+                items = []
+                self.skip_newlines()
+                if self.at_keyword("in"):
+                    self.take()
+                    while self.peek()[0] == "word" and not self.at_keyword("do"):
+                        items.append(self.take())
+                self.expect_word("do")
+                body = self.parse_list(("done",))
+                self.expect_word("done")
+                return ("for", name, items, body, self.parse_redirects())
+            cond = self.parse_list(("do",))
+            self.expect_word("do")
+            body = self.parse_list(("done",))
+            self.expect_word("done")
+            return ("while", cond, body, self.parse_redirects())
+        if word == "{":
+            self.take()
+            body = self.parse_list(("}",))
+            self.expect_word("}")
+            return ("group", body, self.parse_redirects())
+        if self.peek() == ("op", "("):
+            self.take()
+            body = self.parse_list()
+            if self.take() != ("op", ")"):
+                raise ShellSyntaxError("expected )")
+            return ("subshell", body, self.parse_redirects())
+        words, assigns, redirects = [], [], []
+        while True:
+            token = self.peek()
+            if token[0] == "word":
+                text = _word_text(token)
+                if not words and token[1][0][0] == "bare" and re.match(r"^[A-Za-z_][A-Za-z0-9_]*=", token[1][0][1]):
+                    name, _, rest = token[1][0][1].partition("=")
+                    assigns.append((name, ("word", ([("bare", rest)] if rest else []) + token[1][1:])))
+                elif words or text not in ("then", "do", "done", "fi", "elif", "else", "}"):
+                    words.append(token)
+                else:
+                    break
+                self.take()
+            elif token[0] == "redir":
+                self.take()
+                redirects.append((token[1], self.take() if token[1] not in ("2>&1", ">&2", "1>&2") else None))
+            else:
+                break
+        return ("simple", assigns, words, redirects)
+
+    def parse_redirects(self):
+        redirects = []
+        while self.peek()[0] == "redir":
+            op = self.take()[1]
+            redirects.append((op, self.take() if op not in ("2>&1", ">&2", "1>&2") else None))
+        return redirects
+
+
+def parse(text):
+    parser = Parser(tokenize(text))
+    tree = parser.parse_list()
+    if parser.peek()[0] != "eof":
+        raise ShellSyntaxError(f"unexpected {parser.peek()}")
+    return tree
+
+
+# -- the simulated device ------------------------------------------------------
+
+class FakeDevice:
+    """One simulated phone: filesystem, root/remount behaviour, settings and props"""
+
+    def __init__(self, serial, state="device", root="su", remount_methods=None, sdk=30,
+                 latency=0.0, stock_certs=3, props=None, jitter=0.0, features="shell_v2,cmd,stat_v2"):
+        self.serial = serial
+        self.state = state
+        self.root = root                      # "su", "adb-root" or None
+        self.boot_root = root                 # what a reboot goes back to ('adb root' does not survive one)
+        self.root_allowed = False             # 'adb root' works (userdebug and emulator images)
+        self.verity = False                   # True: the first 'adb remount' only disables verity, then needs a reboot
+        self.remount_methods = REMOUNT_METHODS[:2] if remount_methods is None else list(remount_methods)
+        self.latency = latency
+        self.jitter = jitter
+        self.features = features              # what host-serial:<serial>:features reports
+        self.system_rw = False
+        self.lock = threading.RLock()
+        self.files = {}
+        self.meta = {}
+        self.dirs = {"/", "/system", "/system/etc", "/system/etc/security", CACERTS_DIR,
+                     "/data", "/data/local", "/data/local/tmp", "/data/misc", "/proc", "/dev"}
+        self.tmpfs = {}                       # mount point -> stack of the files each tmpfs hides
+        self.binds = {}                       # mount namespace -> {target: source}
+        self.namespace = "init"               # namespace the running command sees (see nsenter)
+        # pid -> (name, parent pid); apps get their own mount namespace, forked from zygote's
+        self.processes = dict(BOOT_PROCESSES)
+        self.next_pid = 2000
+        self.settings = {}
+        self.props = {
+            "ro.build.fingerprint": f"fake/{serial}/generic:{sdk}/FAKE.{sdk}/1:userdebug/test-keys",
+            "ro.build.version.sdk": str(sdk),
+            "ro.build.version.release": str(sdk - 19 if sdk > 28 else 9),
+            "ro.product.model": "Fake Phone",
+            "ro.kernel.qemu": "0",
+            "sys.boot_completed": "1",
+        }
+        self.props.update(props or {})
+        self.new_boot_id()
+        self.counters = {"services": 0, "commands": 0, "bytes_in": 0}
+        stores = [CACERTS_DIR]
+        if sdk >= 34:
+            # Android 14+: conscrypt reads its APEX copy, /system/etc/security/cacerts is ignored
+            self.dirs.update({"/apex", "/apex/com.android.conscrypt", APEX_CACERTS_DIR})
+            stores.append(APEX_CACERTS_DIR)
+        for i in range(stock_certs):
+            name = f"{hashlib.md5(f'{serial}{i}'.encode()).hexdigest()[:8]}.0"
+            for store in stores:
+                self.write_file(f"{store}/{name}", f"stock cert {i}\n".encode(), context="u:object_r:system_file:s0")
+
+    # filesystem helpers
+    def write_file(self, path, data, mode=0o644, context="u:object_r:shell_data_file:s0"):
+        self.files[path] = bytes(data)
+        self.meta[path] = {"mode": mode, "owner": "root", "context": context, "mtime": time.time()}
+        self.dirs.add(posixpath.dirname(path))
+
+    def is_dir(self, path):
+        return path in self.dirs
+
+    def exists(self, path):
+        return path in self.files or path in self.dirs
+
+    def can_write(self, path, uid):
+        if path.startswith("/data/local/tmp/") or path == "/dev/null":
+            return True
+        if uid != 0:
+            return False
+        if any(path == point or path.startswith(point + "/") for point in self.tmpfs):
+            return True
+        if path == "/apex" or path.startswith("/apex/"):
+            return False
+        if path == "/system" or path.startswith("/system/"):
+            return self.system_rw
+        return True
+
+    def listdir(self, path):
+        prefix = path.rstrip("/") + "/"
+        names = {p[len(prefix):].split("/")[0] for p in list(self.files) + list(self.dirs)
+                 if p.startswith(prefix) and p != prefix}
+        return sorted(names)
+
+    def remove(self, path):
+        if path in self.files:
+            del self.files[path]
+            self.meta.pop(path, None)
+        elif path in self.dirs:
+            prefix = path.rstrip("/") + "/"
+            for p in [p for p in self.files if p.startswith(prefix)]:
+                del self.files[p]
+                self.meta.pop(p, None)
+            self.dirs = {d for d in self.dirs if d != path and not d.startswith(prefix)}
+
+    def resolve(self, path):
+        """Follow the bind mounts visible in the current mount namespace"""
+        for target, source in self.binds.get(self.namespace, {}).items():
+            if path == target or path.startswith(target + "/"):
+                return source + path[len(target):]
+        return path
+
+    @staticmethod
+    def namespace_of(pid):
+        return "init" if pid == 1 else pid
+
+    def mount_tmpfs(self, point):
+        prefix = point.rstrip("/") + "/"
+        hidden = {p: (self.files.pop(p), self.meta.pop(p, None)) for p in list(self.files) if p.startswith(prefix)}
+        self.tmpfs.setdefault(point, []).append(hidden)
+
+    def unmount_tmpfs(self, point):
+        prefix = point.rstrip("/") + "/"
+        for p in [p for p in self.files if p.startswith(prefix)]:
+            del self.files[p]
+            self.meta.pop(p, None)
+        for p, (data, meta) in self.tmpfs[point].pop().items():
+            self.files[p] = data
+            self.meta[p] = meta
+        if not self.tmpfs[point]:
+            del self.tmpfs[point]
+
+    def start_process(self, name, parent=600):
+        """Fork a process from zygote: it starts with a copy of zygote's mounts"""
+        pid = self.next_pid
+        self.next_pid += 1
+        self.processes[pid] = (name, parent)
+        self.binds[pid] = dict(self.binds.get(self.namespace_of(parent), {}))
+        return pid
+
+    def reset_mounts(self):
+        """What a reboot does to runtime mounts and processes"""
+        for point in list(self.tmpfs):
+            while point in self.tmpfs:
+                self.unmount_tmpfs(point)
+        self.binds = {}
+        self.namespace = "init"
+        self.processes = dict(BOOT_PROCESSES)
+
+    def new_boot_id(self):
+        self.write_file(BOOT_ID, f"{random.getrandbits(128):032x}\n".encode(), mode=0o444, context="u:object_r:proc:s0")
+        self.booted_at = time.monotonic()
+        self.update_uptime()
+
+    def update_uptime(self):
+        """/proc/uptime as of now (seconds since boot, idle seconds)"""
+        seconds = time.monotonic() - self.booted_at
+        self.write_file(UPTIME, f"{seconds:.2f} {seconds * 3:.2f}\n".encode(), mode=0o444, context="u:object_r:proc:s0")
+
+    def remount(self, how, uid):
+        if uid == 0 and how in self.remount_methods:
+            self.system_rw = True
+            return True
+        return False
+
+    def save_state(self):
+        """Copy of the device state an emulator snapshot saves"""
+        with self.lock:
+            return copy.deepcopy({field: getattr(self, field) for field in SNAPSHOT_FIELDS})
+
+    def load_state(self, state):
+        with self.lock:
+            for field, value in copy.deepcopy(state).items():
+                setattr(self, field, value)
+
+    def shell(self, command, stdin=b"", adb_root=None):
+        """Run one shell command line; returns (exit_code, stdout, stderr)"""
+        with self.lock:
+            self.counters["commands"] += 1
+            uid = 0 if (self.root == "adb-root" if adb_root is None else adb_root) else 2000
+            sh = Shell(self, uid)
+            try:
+                code = sh.run(command, stdin)
+            except ShellSyntaxError as e:
+                return 2, bytes(sh.out), bytes(sh.err) + f"sh: syntax error: {e}\n".encode()
+            return code, bytes(sh.out), bytes(sh.err)
+
+
+class Shell:
+    """Interprets the sh subset against a FakeDevice"""
+
+    def __init__(self, device, uid, env=None, args=None):
+        self.device = device
+        self.uid = uid
+        self.env = dict(env or {})
+        self.args = list(args or [])
+        self.status = 0
+        self.out = bytearray()
+        self.err = bytearray()
+
+    def run(self, text, stdin=b""):
+        try:
+            return self.exec_list(parse(text), stdin, self.out, self.err)
+        except ShellExit as e:
+            return e.code
+
+    def path(self, p):
+        return self.device.resolve(posixpath.normpath(p if p.startswith("/") else "/" + p))
+
+    # expansion
+    def expand_text(self, text, stdin):
+        result = ""
+        i = 0
+        while i < len(text):
+            c = text[i]
+            if c == "\\" and text[i + 1:i + 2] == "$":
+                result += "$"
+                i += 2
+            elif text.startswith("$((", i):
+                end = text.index("))", i)
+                expr = self.expand_text(text[i + 3:end], stdin)
+                result += str(int(eval(expr, {"__builtins__": {}})) if re.match(r"^[\d\s+\-*/()]+$", expr) else 0)
+                i = end + 2
+            elif text.startswith("$(", i):
+                end = _scan_subst(text, i + 1)
+                sub = Shell(self.device, self.uid, self.env, self.args)
+                sub.run(text[i + 2:end - 1], stdin)
+                result += sub.out.decode(errors="replace").rstrip("\n")
+                self.err += sub.err
+                i = end
+            elif c == "$":
+                m = re.match(r"\$(\{[A-Za-z_][A-Za-z0-9_]*\}|[A-Za-z_][A-Za-z0-9_]*|[0-9?$#@*])", text[i:])
+                if not m:
+                    result += c
+                    i += 1
+                    continue
+                name = m.group(1).strip("{}")
+                if name == "?":
+                    result += str(self.status)
+                elif name == "$":
+                    result += "4242"
+                elif name == "#":
+                    result += str(len(self.args))
+                elif name in "@*":
+                    result += " ".join(self.args)
+                elif name.isdigit():
+                    index = int(name)
+                    result += self.args[index - 1] if 0 < index <= len(self.args) else ""
+                else:
+                    result += self.env.get(name, "")
+                i += len(m.group(0))
+            else:
+                result += c
+                i += 1
+        return result
+
+    def expand_word(self, token, stdin):
+        fields = [""]
+        split_happened = False
+        for kind, text in token[1]:
+            if kind == "lit":
+                fields[-1] += text
+            elif kind == "dq":
+                fields[-1] += self.expand_text(text, stdin)
+            else:
+                value = self.expand_text(text, stdin)
+                if "$" in text:
+                    pieces = value.split()
+                    if not pieces:
+                        split_happened = True
+                        continue
+                    if value[:1].isspace():
+                        fields.append("")
+                    fields[-1] += pieces[0]
+                    for piece in pieces[1:]:
+                        fields.append(piece)
+                    if value[-1:].isspace():
+                        fields.append("")
+                    split_happened = True
+                else:
+                    fields[-1] += value
+        if split_happened:
+            fields = [f for f in fields if f != ""]
+        if any(kind == "bare" and ("*" in text or "?" in text) for kind, text in token[1]):
+            globbed = []
+            for field in fields:
+                matches = self.glob(field) if field.startswith("/") and ("*" in field or "?" in field) else []
+                globbed.extend(matches or [field])
+            fields = globbed
+        return fields
+
+    def glob(self, pattern):
+        directory = posixpath.dirname(pattern)
+        names = self.device.listdir(self.path(directory))
+        return [posixpath.join(directory, n) for n in names if fnmatch.fnmatch(n, posixpath.basename(pattern))]
+
+    # execution
+    def exec_list(self, node, stdin, out, err):
+        status = 0
+        for connector, pipeline in node[1]:
+            if connector == "&&" and self.status != 0:
+                continue
+            if connector == "||" and self.status == 0:
+                continue
+            status = self.exec_pipeline(pipeline, stdin, out, err)
+            self.status = status
+        return status
+
+    def exec_pipeline(self, node, stdin, out, err):
+        data = stdin
+        commands = node[1]
+        for i, command in enumerate(commands):
+            sink = out if i == len(commands) - 1 else bytearray()
+            status = self.exec_command(command, data, sink, err)
+            data = bytes(sink)
+        if node[2]:
+            status = 0 if status else 1
+        return status
+
+    def open_redirects(self, redirects, stdin, out, err):
+        targets = []
+        for op, target in redirects:
+            if op in ("2>&1",):
+                err = out
+            elif op in (">&2", "1>&2"):
+                out = err
+            elif op == "<":
+                path = self.path(self.expand_word(target, stdin)[0])
+                stdin = self.device.files.get(path, b"")
+            else:
+                path = self.path(self.expand_word(target, stdin)[0])
+                buffer = bytearray()
+                if path != "/dev/null":
+                    targets.append((path, buffer, op.endswith(">>")))
+                if op.startswith("2"):
+                    err = buffer
+                else:
+                    out = buffer
+        return stdin, out, err, targets
+
+    def close_redirects(self, targets, err):
+        for path, buffer, append in targets:
+            if not self.device.can_write(path, self.uid) or self.device.is_dir(path):
+                err += f"sh: can't create {path}: Read-only file system\n".encode()
+                return 1
+            old = self.device.files.get(path, b"") if append else b""
+            meta = self.device.meta.get(path, {})
+            self.device.write_file(path, old + bytes(buffer), meta.get("mode", 0o644),
+                                   meta.get("context", "u:object_r:shell_data_file:s0"))
+        return 0
+
+    def exec_command(self, node, stdin, out, err):
+        kind = node[0]
+        if kind == "simple":
+            return self.exec_simple(node, stdin, out, err)
+        redirects = node[-1]
+        stdin, out2, err2, targets = self.open_redirects(redirects, stdin, out, err)
+        if kind == "if":
+            status = 0
+            for cond, body in node[1]:
+                if self.exec_list(cond, stdin, out2, err2) == 0:
+                    status = self.exec_list(body, stdin, out2, err2)
+                    break
+            else:
+                if node[2] is not None:
+                    status = self.exec_list(node[2], stdin, out2, err2)
+        elif kind == "for":
+            status = 0
+            items = []
+            for token in node[2]:
+                items.extend(self.expand_word(token, stdin))
+            for item in items:
+                self.env[node[1]] = item
+                status = self.exec_list(node[3], stdin, out2, err2)
+        elif kind == "while":
+            status = 0
+            for _ in range(10000):
+                if self.exec_list(node[1], stdin, out2, err2) != 0:
+                    break
+                status = self.exec_list(node[2], stdin, out2, err2)
+        elif kind == "group":
+            status = self.exec_list(node[1], stdin, out2, err2)
+        else:
+            sub = Shell(self.device, self.uid, self.env, self.args)
+            try:
+                status = sub.exec_list(node[1], stdin, out2, err2)
+            except ShellExit as e:
+                status = e.code
+        return self.close_redirects(targets, err) or status
+
+    def exec_simple(self, node, stdin, out, err):
+        _, assigns, words, redirects = node
+        argv = []
+        for token in words:
+            argv.extend(self.expand_word(token, stdin))
+        for name, value in assigns:
+            expanded = " ".join(self.expand_word(value, stdin)) if value[1] else ""
+            self.env[name] = expanded
+        if not argv:
+            return 0
+        stdin, out, err, targets = self.open_redirects(redirects, stdin, out, err)
+        try:
+            status = self.call(argv, stdin, out, err)
+        except ShellExit:
+            self.close_redirects(targets, err)
+            raise
+        return self.close_redirects(targets, err) or status
+
+    def call(self, argv, stdin, out, err):
+        name = argv[0]
+        if name == ":":
+            return 0
+        handler = getattr(self, "cmd_" + name.replace("-", "_").replace("[", "test"), None)
+        if handler is None and name.startswith("/system/bin/"):
+            handler = getattr(self, "cmd_" + posixpath.basename(name), None)
+        if handler is None:
+            if name.startswith("/") and name in self.device.files:
+                return self.cmd_sh(["sh", name] + argv[1:], stdin, out, err)
+            err += f"sh: {name}: not found\n".encode()
+            return 127
+        return handler(argv, stdin, out, err)
+
+    # commands
+    def cmd_echo(self, argv, stdin, out, err):
+        args = argv[1:]
+        newline = True
+        if args[:1] == ["-n"]:
+            newline = False
+            args = args[1:]
+        out += (" ".join(args) + ("\n" if newline else "")).encode()
+        return 0
+
+    def cmd_printf(self, argv, stdin, out, err):
+        fmt = argv[1] if len(argv) > 1 else ""
+        fmt = re.sub(r"\\0?([0-7]{1,3})", lambda m: chr(int(m.group(1), 8)), fmt)
+        fmt = fmt.replace("\\n", "\n").replace("\\t", "\t").replace("\\\\", "\\")
+        values = argv[2:]
+        conversions = len(re.findall(r"%[sd]", fmt))
+        chunks = []
+        while True:
+            take, values = values[:conversions], values[conversions:]
+            take += [""] * (conversions - len(take))
+            chunks.append(fmt.replace("%d", "%s") % tuple(take) if conversions else fmt)
+            if not values or not conversions:
+                break
+        out += "".join(chunks).encode()
+        return 0
+
+    def cmd_true(self, argv, stdin, out, err):
+        return 0
+
+    cmd_sync = cmd_true
+
+    def cmd_false(self, argv, stdin, out, err):
+        return 1
+
+    def cmd_exit(self, argv, stdin, out, err):
+        raise ShellExit(int(argv[1]) if len(argv) > 1 else self.status)
+
+    def cmd_sleep(self, argv, stdin, out, err):
+        try:
+            time.sleep(min(float(argv[1]), 30.0))
+        except (IndexError, ValueError):
+            pass
+        return 0
+
+    def cmd_cd(self, argv, stdin, out, err):
+        return 0
+
+    def cmd_test(self, argv, stdin, out, err):
+        args = argv[1:-1] if argv[0] == "[" else argv[1:]
+        negate = False
+        if args[:1] == ["!"]:
+            negate = True
+            args = args[1:]
+        result = False
+        if len(args) == 1:
+            result = args[0] != ""
+        elif len(args) == 2:
+            flag, value = args
+            path = self.path(value) if value else ""
+            result = {"-f": path in self.device.files, "-d": self.device.is_dir(path),
+                      "-e": self.device.exists(path), "-z": value == "", "-n": value != "",
+                      "-s": bool(self.device.files.get(path)),
+                      "-w": self.device.can_write(path, self.uid)}.get(flag, False)
+        elif len(args) == 3:
+            a, op, b = args
+            if op in ("=", "=="):
+                result = a == b
+            elif op == "!=":
+                result = a != b
+            else:
+                try:
+                    x, y = int(a), int(b)
+                except ValueError:
+                    return 2
+                result = {"-eq": x == y, "-ne": x != y, "-gt": x > y, "-ge": x >= y,
+                          "-lt": x < y, "-le": x <= y}.get(op, False)
+        return 0 if result != negate else 1
+
+    def cmd_id(self, argv, stdin, out, err):
+        if "-u" in argv:
+            out += f"{self.uid}\n".encode()
+        else:
+            out += (b"uid=0(root) gid=0(root)\n" if self.uid == 0 else b"uid=2000(shell) gid=2000(shell)\n")
+        return 0
+
+    def cmd_whoami(self, argv, stdin, out, err):
+        out += b"root\n" if self.uid == 0 else b"shell\n"
+        return 0
+
+    def cmd_command(self, argv, stdin, out, err):
+        if len(argv) == 3 and argv[1] == "-v":
+            known = hasattr(self, "cmd_" + argv[2]) and not (argv[2] == "su" and self.device.root != "su")
+            if known:
+                out += f"/system/bin/{argv[2]}\n".encode()
+            return 0 if known else 1
+        return self.call(argv[1:], stdin, out, err)
+
+    def cmd_su(self, argv, stdin, out, err):
+        if self.device.root != "su":
+            err += b"sh: su: not found\n"
+            return 127
+        args = argv[1:]
+        if args[:1] in (["0"], ["root"]):
+            args = args[1:]
+        sub = Shell(self.device, 0, self.env)
+        if args[:1] == ["-c"]:
+            status = sub.run(" ".join(args[1:]), stdin)
+        elif args:
+            try:
+                status = sub.call(args, stdin, sub.out, sub.err)
+            except ShellExit as e:
+                status = e.code
+        else:
+            status = sub.run(stdin.decode(errors="replace"))
+        out += sub.out
+        err += sub.err
+        return status
+
+    def cmd_sh(self, argv, stdin, out, err):
+        args = argv[1:]
+        if args[:1] == ["-c"]:
+            sub = Shell(self.device, self.uid, self.env, args[2:])
+            status = sub.run(args[1] if len(args) > 1 else "", stdin)
+        elif args and args[0] != "-s":
+            path = self.path(args[0])
+            if path not in self.device.files:
+                err += f"sh: {args[0]}: No such file or directory\n".encode()
+                return 127
+            sub = Shell(self.device, self.uid, {}, args[1:])
+            status = sub.run(self.device.files[path].decode(errors="replace"))
+        else:
+            sub = Shell(self.device, self.uid, {}, args[1:])
+            status = sub.run(stdin.decode(errors="replace"))
+        out += sub.out
+        err += sub.err
+        return status
+
+    def cmd_mkdir(self, argv, stdin, out, err):
+        for arg in argv[1:]:
+            if arg.startswith("-"):
+                continue
+            path = self.path(arg)
+            if self.device.is_dir(path):
+                continue
+            if not self.device.can_write(path, self.uid):
+                err += f"mkdir: '{arg}': Read-only file system\n".encode()
+                return 1
+            parts = path.split("/")
+            for i in range(2, len(parts) + 1):
+                self.device.dirs.add("/".join(parts[:i]))
+        return 0
+
+    def _copy(self, src, dst, err, tool):
+        src, dst = self.path(src), self.path(dst)
+        if self.device.is_dir(dst):
+            dst = posixpath.join(dst, posixpath.basename(src))
+        if src not in self.device.files:
+            err += f"{tool}: {src}: No such file or directory\n".encode()
+            return 1
+        if not self.device.can_write(dst, self.uid):
+            err += f"{tool}: {dst}: Read-only file system\n".encode()
+            return 1
+        context = "u:object_r:system_file:s0" if dst.startswith("/system/") else "u:object_r:shell_data_file:s0"
+        self.device.write_file(dst, self.device.files[src], self.device.meta[src]["mode"], context)
+        return 0
+
+    def cmd_cp(self, argv, stdin, out, err):
+        args = [a for a in argv[1:] if not a.startswith("-")]
+        status = 0
+        for src in args[:-1]:
+            status |= self._copy(src, args[-1], err, "cp")
+        return status
+
+    def cmd_mv(self, argv, stdin, out, err):
+        args = [a for a in argv[1:] if not a.startswith("-")]
+        status = self._copy(args[0], args[1], err, "mv")
+        if status == 0:
+            self.device.remove(self.path(args[0]))
+        return status
+
+    def cmd_dd(self, argv, stdin, out, err):
+        opts = dict(a.split("=", 1) for a in argv[1:] if "=" in a)
+        data = self.device.files.get(self.path(opts["if"])) if "if" in opts else stdin
+        if data is None:
+            err += b"dd: can't open input\n"
+            return 1
+        if "of" in opts:
+            path = self.path(opts["of"])
+            if not self.device.can_write(path, self.uid):
+                err += f"dd: {path}: Read-only file system\n".encode()
+                return 1
+            self.device.write_file(path, data)
+        else:
+            out += data
+        return 0
+
+    def cmd_cat(self, argv, stdin, out, err):
+        paths = argv[1:]
+        if not paths or paths == ["-"]:
+            out += stdin
+            return 0
+        status = 0
+        for p in paths:
+            if self.path(p) == UPTIME:
+                self.device.update_uptime()
+            data = self.device.files.get(self.path(p))
+            if data is None:
+                err += f"cat: {p}: No such file or directory\n".encode()
+                status = 1
+            else:
+                out += data
+        return status
+
+    def cmd_chmod(self, argv, stdin, out, err):
+        mode = int(argv[1], 8)
+        for p in argv[2:]:
+            path = self.path(p)
+            if path not in self.device.files and not self.device.is_dir(path):
+                err += f"chmod: {p}: No such file or directory\n".encode()
+                return 1
+            if not self.device.can_write(path, self.uid):
+                err += f"chmod: {p}: Read-only file system\n".encode()
+                return 1
+            if path in self.device.meta:
+                self.device.meta[path]["mode"] = mode
+        return 0
+
+    def cmd_chown(self, argv, stdin, out, err):
+        return 0 if self.uid == 0 else 1
+
+    def _set_context(self, path, context):
+        if path in self.device.meta and (self.uid == 0):
+            self.device.meta[path]["context"] = context
+            return 0
+        return 1
+
+    def cmd_restorecon(self, argv, stdin, out, err):
+        status = 0
+        for p in [a for a in argv[1:] if not a.startswith("-")]:
+            path = self.path(p)
+            context = "u:object_r:system_file:s0" if path.startswith("/system/") else "u:object_r:shell_data_file:s0"
+            status |= self._set_context(path, context)
+        return status
+
+    def cmd_chcon(self, argv, stdin, out, err):
+        args = [a for a in argv[1:] if not a.startswith("-")]
+        status = 0
+        for p in args[1:]:
+            status |= self._set_context(self.path(p), args[0])
+        return status
+
+    def cmd_rm(self, argv, stdin, out, err):
+        force = any(a.startswith("-") and "f" in a for a in argv[1:])
+        status = 0
+        for p in [a for a in argv[1:] if not a.startswith("-")]:
+            path = self.path(p)
+            if not self.device.exists(path):
+                if not force:
+                    err += f"rm: {p}: No such file or directory\n".encode()
+                    status = 1
+                continue
+            if not self.device.can_write(path, self.uid):
+                err += f"rm: {p}: Read-only file system\n".encode()
+                status = 1
+                continue
+            self.device.remove(path)
+        return status
+
+    def cmd_touch(self, argv, stdin, out, err):
+        for p in argv[1:]:
+            path = self.path(p)
+            if not self.device.can_write(path, self.uid) or not self.device.is_dir(posixpath.dirname(path)):
+                err += f"touch: '{p}': Read-only file system\n".encode()
+                return 1
+            if path not in self.device.files:
+                self.device.write_file(path, b"")
+        return 0
+
+    def _ls_line(self, path, name):
+        meta = self.device.meta.get(path, {"mode": 0o755, "context": "u:object_r:system_file:s0"})
+        kind = "d" if self.device.is_dir(path) else "-"
+        perms = "".join(c if meta["mode"] & (1 << (8 - i)) else "-" for i, c in enumerate("rwxrwxrwx"))
+        size = len(self.device.files.get(path, b""))
+        return f"{kind}{perms} 1 root root {size} 2024-01-01 00:00 {name}"
+
+    def cmd_ls(self, argv, stdin, out, err):
+        flags = "".join(a[1:] for a in argv[1:] if a.startswith("-"))
+        paths = [a for a in argv[1:] if not a.startswith("-")] or ["/"]
+        status = 0
+        for p in paths:
+            path = self.path(p)
+            if self.device.is_dir(path) and "d" not in flags:
+                for name in self.device.listdir(path):
+                    out += ((self._ls_line(posixpath.join(path, name), name) if "l" in flags else name) + "\n").encode()
+            elif self.device.exists(path):
+                out += ((self._ls_line(path, p) if "l" in flags else p) + "\n").encode()
+            else:
+                err += f"ls: {p}: No such file or directory\n".encode()
+                status = 1
+        return status
+
+    def cmd_stat(self, argv, stdin, out, err):
+        fmt = argv[argv.index("-c") + 1] if "-c" in argv else "%n"
+        status = 0
+        for p in [a for a in argv[1:] if not a.startswith("-") and a != fmt]:
+            path = self.path(p)
+            if not self.device.exists(path):
+                status = 1
+                continue
+            meta = self.device.meta.get(path, {"mode": 0o755, "context": "u:object_r:system_file:s0"})
+            line = (fmt.replace("%a", f"{meta['mode']:o}").replace("%s", str(len(self.device.files.get(path, b""))))
+                    .replace("%C", meta["context"]).replace("%n", p).replace("%Y", str(int(meta.get("mtime", 0)))))
+            out += (line + "\n").encode()
+        return status
+
+    def cmd_cmp(self, argv, stdin, out, err):
+        args = [a for a in argv[1:] if not a.startswith("-")]
+        a, b = (self.device.files.get(self.path(p)) for p in args[:2])
+        if a is None or b is None:
+            return 2
+        return 0 if a == b else 1
+
+    def _digest(self, argv, stdin, out, err, algorithm):
+        paths = [a for a in argv[1:] if not a.startswith("-")]
+        if not paths:
+            out += f"{hashlib.new(algorithm, stdin).hexdigest()}  -\n".encode()
+            return 0
+        status = 0
+        for p in paths:
+            data = self.device.files.get(self.path(p))
+            if data is None:
+                err += f"{argv[0]}: {p}: No such file or directory\n".encode()
+                status = 1
+                continue
+            out += f"{hashlib.new(algorithm, data).hexdigest()}  {p}\n".encode()
+        return status
+
+    def cmd_sha256sum(self, argv, stdin, out, err):
+        return self._digest(argv, stdin, out, err, "sha256")
+
+    def cmd_md5sum(self, argv, stdin, out, err):
+        return self._digest(argv, stdin, out, err, "md5")
+
+    def cmd_mount(self, argv, stdin, out, err):
+        args = argv[1:]
+        if not args:
+            mode = "rw" if self.device.system_rw else "ro"
+            out += f"/dev/block/dm-0 on / type ext4 ({mode},seclabel,relatime)\n".encode()
+            for point in sorted(set(self.device.tmpfs) | set(self.device.binds.get(self.device.namespace, {}))):
+                out += f"tmpfs on {point} type tmpfs (rw,seclabel,relatime)\n".encode()
+            return 0
+        if self.uid == 0 and args[:2] == ["-t", "tmpfs"] and len(args) == 4:
+            self.device.mount_tmpfs(self.path(args[3]))
+            return 0
+        if self.uid == 0 and args[0] == "--bind" and len(args) == 3:
+            source, target = self.path(args[1]), posixpath.normpath(args[2])
+            if not (self.device.is_dir(source) and self.device.is_dir(target)):
+                err += f"mount: '{args[2]}': No such file or directory\n".encode()
+                return 1
+            self.device.binds.setdefault(self.device.namespace, {})[target] = source
+            return 0
+        if self.device.remount(" ".join(argv), self.uid):
+            return 0
+        err += f"mount: '{args[-1]}' not in /proc/mounts\n".encode() if self.uid == 0 else b"mount: Permission denied\n"
+        return 1
+
+    def cmd_umount(self, argv, stdin, out, err):
+        if self.uid != 0:
+            return 1
+        point = posixpath.normpath(argv[-1])
+        binds = self.device.binds.get(self.device.namespace, {})
+        if point in binds:
+            del binds[point]
+        elif point in self.device.tmpfs:
+            self.device.unmount_tmpfs(point)
+        return 0
+
+    def cmd_nsenter(self, argv, stdin, out, err):
+        args, pid = argv[1:], None
+        while args and args[0] != "--" and args[0].startswith("-"):
+            arg = args.pop(0)
+            m = re.match(r"--mount=/proc/(\d+)/ns/mnt$", arg)
+            if m:
+                pid = int(m.group(1))
+            elif arg == "-t" and args:
+                pid = int(args.pop(0))
+        if args[:1] == ["--"]:
+            args = args[1:]
+        if self.uid != 0:
+            err += b"nsenter: Permission denied\n"
+            return 1
+        if pid not in self.device.processes:
+            err += f"nsenter: cannot open /proc/{pid}/ns/mnt: No such file or directory\n".encode()
+            return 1
+        outer, self.device.namespace = self.device.namespace, self.device.namespace_of(pid)
+        try:
+            return self.call(args, stdin, out, err) if args else 0
+        finally:
+            self.device.namespace = outer
+
+    def cmd_kill(self, argv, stdin, out, err):
+        status = 0
+        for arg in [a for a in argv[1:] if not a.startswith("-")]:
+            pid = int(arg) if arg.isdigit() else None
+            if pid not in self.device.processes:
+                err += f"kill: {arg}: No such process\n".encode()
+                status = 1
+            elif self.uid != 0 or pid < 1000:
+                err += f"kill: {arg}: Operation not permitted\n".encode()
+                status = 1
+            else:
+                del self.device.processes[pid]
+                self.device.binds.pop(pid, None)
+        return status
+
+    def cmd_am(self, argv, stdin, out, err):
+        if argv[1:2] != ["force-stop"] or len(argv) < 3:
+            err += b"am: only force-stop is simulated\n"
+            return 1
+        for pid in [pid for pid, (name, _) in self.device.processes.items() if name == argv[-1]]:
+            del self.device.processes[pid]
+            self.device.binds.pop(pid, None)
+        return 0
+
+    def cmd_pidof(self, argv, stdin, out, err):
+        pids = [str(pid) for pid, (name, _) in sorted(self.device.processes.items()) if name in argv[1:]]
+        if pids:
+            out += (" ".join(pids) + "\n").encode()
+        return 0 if pids else 1
+
+    def cmd_ps(self, argv, stdin, out, err):
+        parents = {int(p) for p in argv[argv.index("-P") + 1].split(",")} if "-P" in argv else None
+        rows = [(pid, ppid, name) for pid, (name, ppid) in sorted(self.device.processes.items())
+                if parents is None or ppid in parents]
+        if "-o" in argv and argv[argv.index("-o") + 1] == "PID":
+            out += b"  PID\n" + "".join(f"{pid:>5}\n" for pid, _, _ in rows).encode()
+        else:
+            out += b"USER       PID  PPID NAME\n" + "".join(
+                f"{'root' if pid < 1000 else 'u0_a1':<8}{pid:>5} {ppid:>5} {name}\n" for pid, ppid, name in rows).encode()
+        return 0
+
+    def cmd_getprop(self, argv, stdin, out, err):
+        if len(argv) > 1:
+            out += (self.device.props.get(argv[1], argv[2] if len(argv) > 2 else "") + "\n").encode()
+        else:
+            for key in sorted(self.device.props):
+                out += f"[{key}]: [{self.device.props[key]}]\n".encode()
+        return 0
+
+    def cmd_setprop(self, argv, stdin, out, err):
+        self.device.props[argv[1]] = argv[2] if len(argv) > 2 else ""
+        return 0
+
+    def cmd_settings(self, argv, stdin, out, err):
+        if len(argv) < 4:
+            err += b"usage: settings [--user N] get|put|delete NAMESPACE KEY [VALUE]\n"
+            return 1
+        verb, namespace, key = argv[1], argv[2], argv[3]
+        slot = f"{namespace}:{key}"
+        if verb == "put":
+            self.device.settings[slot] = " ".join(argv[4:])
+        elif verb == "get":
+            out += (self.device.settings.get(slot, "null") + "\n").encode()
+        elif verb == "delete":
+            self.device.settings.pop(slot, None)
+        else:
+            err += f"Invalid command: {verb}\n".encode()
+            return 1
+        return 0
+
+    def cmd_tar(self, argv, stdin, out, err):
+        import io
+        import tarfile
+        args = argv[1:]
+        flags = args[0].lstrip("-") if args else ""
+        directory = args[args.index("-C") + 1] if "-C" in args else "/"
+        source = args[args.index("-f") + 1] if "-f" in args else ("-" if "f" in flags else "-")
+        if "x" not in flags and "-x" not in args:
+            err += b"tar: only extraction is simulated\n"
+            return 1
+        data = stdin if source == "-" else self.device.files.get(self.path(source), b"")
+        try:
+            archive = tarfile.open(fileobj=io.BytesIO(data), mode="r:*")
+        except tarfile.TarError as e:
+            err += f"tar: {e}\n".encode()
+            return 1
+        for member in archive.getmembers():
+            target = self.path(posixpath.join(directory, member.name))
+            if member.isdir():
+                self.device.dirs.add(target)
+                continue
+            if not self.device.can_write(target, self.uid):
+                err += f"tar: {target}: Read-only file system\n".encode()
+                return 1
+            self.device.write_file(target, archive.extractfile(member).read(), member.mode & 0o777)
+        return 0
+
+    def cmd_head(self, argv, stdin, out, err):
+        count = int(argv[argv.index("-n") + 1]) if "-n" in argv else 10
+        out += b"".join(stdin.splitlines(keepends=True)[:count])
+        return 0
+
+    def cmd_grep(self, argv, stdin, out, err):
+        args = [a for a in argv[1:] if not a.startswith("-")]
+        quiet = "-q" in argv
+        invert = "-v" in argv
+        lines = [line for line in stdin.splitlines(keepends=True) if args and (args[0].encode() in line) != invert]
+        if not quiet:
+            out += b"".join(lines)
+        return 0 if lines else 1
+
+    def cmd_basename(self, argv, stdin, out, err):
+        out += (posixpath.basename(argv[1]) + "\n").encode()
+        return 0
+
+    def cmd_reboot(self, argv, stdin, out, err):
+        return 0 if self.uid == 0 else 1
+
+
+# -- adb server protocol -----------------------------------------------------------
+
+def _read_exact(rfile, size):
+    data = rfile.read(size)
+    if data is None or len(data) < size:
+        raise EOFError
+    return data
+
+
+class FakeAdbHandler(socketserver.StreamRequestHandler):
+    def send_okay(self, payload=None):
+        self.wfile.write(b"OKAY")
+        if payload is not None:
+            data = payload.encode() if isinstance(payload, str) else payload
+            self.wfile.write(b"%04x" % len(data) + data)
+        self.wfile.flush()
+
+    def send_fail(self, message):
+        data = message.encode()
+        self.wfile.write(b"FAIL" + b"%04x" % len(data) + data)
+        self.wfile.flush()
+
+    def read_request(self):
+        length = int(_read_exact(self.rfile, 4), 16)
+        return _read_exact(self.rfile, length).decode()
+
+    def handle(self):
+        server = self.server
+        try:
+            service = self.read_request()
+            device = None
+            while True:
+                server.stats["services"] += 1
+                if service == "host:version":
+                    return self.send_okay("0029")
+                if service in ("host:devices", "host:devices-l"):
+                    return self.send_okay("".join(f"{d.serial}\t{d.state}\n" for d in server.device_list()))
+                if service == "host:track-devices":
+                    return self.handle_track()
+                if service.startswith("host-serial:") and ":wait-for-" in service:
+                    return self.handle_wait(service.split(":")[1])
+                if service.startswith(("host:connect:", "host:disconnect:")):
+                    verb, _, address = service[len("host:"):].partition(":")
+                    return self.send_okay(getattr(server, verb)(address))
+                if service == "host:mdns:check":
+                    return self.send_okay("mdns daemon version [fakeadb]")
+                if service == "host:mdns:services":
+                    return self.send_okay("".join(f"adb-{d.props['ro.serialno']}\t_adb-tls-connect._tcp\t{a}\n"
+                                                  for a, d in server.network_list() if d.props.get("mdns") == "1"))
+                if service == "host:features":
+                    return self.send_okay("shell_v2,cmd,stat_v2")
+                if service.startswith("host-serial:") and service.endswith(":features"):
+                    device = server.find(service[len("host-serial:"):-len(":features")])
+                    if isinstance(device, str):
+                        return self.send_fail(device)
+                    return self.send_okay(device.features)
+                if service.startswith("host:transport"):
+                    device = server.find(service.split(":", 2)[2] if service.startswith("host:transport:") else None)
+                    if isinstance(device, str):
+                        return self.send_fail(device)
+                    self.send_okay()
+                    service = self.read_request()
+                    continue
+                if device is None:
+                    return self.send_fail(f"unknown host service '{service}'")
+                if device.latency or device.jitter:
+                    time.sleep(device.latency + random.uniform(0, device.jitter))
+                device.counters["services"] += 1
+                if service.startswith("shell,v2"):
+                    return self.handle_shell_v2(device, service.split(":", 1)[1])
+                if service.startswith("shell:"):
+                    self.send_okay()
+                    code, out, err = device.shell(service[len("shell:"):])
+                    self.wfile.write(out + err)
+                    return
+                if service == "sync:":
+                    self.send_okay()
+                    return self.handle_sync(device)
+                if service.startswith("exec:"):
+                    self.send_okay()
+                    code, out, err = device.shell(service[len("exec:"):])
+                    self.wfile.write(out)
+                    return
+                if service.startswith("reboot"):
+                    self.send_okay()
+                    server.reboot(device)
+                    return
+                if service == "root:":
+                    self.send_okay()
+                    self.wfile.write(server.restart_as_root(device).encode())
+                    return
+                if service == "remount:":
+                    self.send_okay()
+                    if device.verity and device.root:
+                        device.verity = "off after reboot"
+                        self.wfile.write(b"Successfully disabled verification\n"
+                                         b"Now reboot your device for settings to take effect\n")
+                        return
+                    ok = device.remount("adb", 0 if device.root else 2000)
+                    self.wfile.write(b"remount succeeded\n" if ok else b"remount failed\n")
+                    return
+                return self.send_fail(f"unknown service '{service}'")
+        except (EOFError, ConnectionError, ValueError):
+            return
+
+    def handle_track(self):
+        """track-devices: OKAY, then the full device list now and after every change until the client leaves"""
+        self.send_okay()
+        last = None
+        while True:
+            listing = "".join(f"{d.serial}\t{d.state}\n" for d in self.server.device_list())
+            if listing != last:
+                data = listing.encode()
+                self.wfile.write(b"%04x" % len(data) + data)
+                self.wfile.flush()
+                last = listing
+            time.sleep(0.02)
+
+    def handle_wait(self, serial, limit=300):
+        """wait-for-device: OKAY now, OKAY again once the device is online"""
+        self.send_okay()
+        deadline = time.monotonic() + limit
+        while time.monotonic() < deadline:
+            device = self.server.find(serial)
+            if not isinstance(device, str):
+                self.send_okay()
+                return
+            time.sleep(0.05)
+        self.send_fail("timeout expired while waiting for device")
+
+    def handle_shell_v2(self, device, command):
+        self.send_okay()
+        stdin = bytearray()
+        while True:
+            packet_id, length = struct.unpack("<BI", _read_exact(self.rfile, 5))
+            data = _read_exact(self.rfile, length) if length else b""
+            if packet_id == 0:
+                stdin += data
+            elif packet_id == 4:
+                break
+        device.counters["bytes_in"] += len(stdin)
+        code, out, err = device.shell(command, bytes(stdin))
+        if out:
+            self.wfile.write(struct.pack("<BI", 1, len(out)) + out)
+        if err:
+            self.wfile.write(struct.pack("<BI", 2, len(err)) + err)
+        self.wfile.write(struct.pack("<BI", 3, 1) + bytes([code & 0xFF]))
+        self.wfile.flush()
+
+    def handle_sync(self, device):
+        while True:
+            command, length = struct.unpack("<4sI", _read_exact(self.rfile, 8))
+            if command == b"QUIT":
+                return
+            path = _read_exact(self.rfile, length).decode()
+            if command == b"STAT":
+                with device.lock:
+                    if device.is_dir(path):
+                        reply = struct.pack("<III", stat.S_IFDIR | 0o755, 4096, 0)
+                    elif path in device.files:
+                        reply = struct.pack("<III", stat.S_IFREG | device.meta[path]["mode"], len(device.files[path]), 0)
+                    else:
+                        reply = struct.pack("<III", 0, 0, 0)
+                self.wfile.write(b"STAT" + reply)
+                self.wfile.flush()
+            elif command == b"SEND":
+                remote, _, mode = path.rpartition(",")
+                data = bytearray()
+                while True:
+                    kind, size = struct.unpack("<4sI", _read_exact(self.rfile, 8))
+                    if kind == b"DATA":
+                        data += _read_exact(self.rfile, size)
+                    elif kind == b"DONE":
+                        break
+                    else:
+                        return
+                device.counters["bytes_in"] += len(data)
+                with device.lock:
+                    uid = 0 if device.root == "adb-root" else 2000
+                    if not device.can_write(remote, uid):
+                        message = "couldn't create file: Read-only file system".encode()
+                        self.wfile.write(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    else:
+                        parts = remote.split("/")
+                        for i in range(2, len(parts)):
+                            device.dirs.add("/".join(parts[:i]))
+                        context = "u:object_r:system_file:s0" if remote.startswith("/system/") else "u:object_r:shell_data_file:s0"
+                        device.write_file(remote, data, int(mode) & 0o777, context)
+                        self.wfile.write(b"OKAY" + struct.pack("<I", 0))
+                self.wfile.flush()
+            else:
+                return
+
+
+class FakeAdbdHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        """Answer one adb CNXN packet the way adbd on tcpip port 5555 does, then hang up"""
+        try:
+            header = self.request.recv(24)
+            if len(header) == 24 and header[:4] == b"CNXN":
+                banner = b"device::ro.product.model=Fake Phone;features=shell_v2,cmd\0"
+                self.request.sendall(struct.pack("<6I", 0x4e584e43, 0x01000001, 256 * 1024, len(banner),
+                                                 sum(banner) & 0xffffffff, 0x4e584e43 ^ 0xffffffff) + banner)
+        except OSError:
+            pass
+
+
+class FakeAdbd(socketserver.ThreadingTCPServer):
+    """adbd listening for 'adb connect' on 127.0.0.1:<port>; pairs with a FakeDevice named after its address"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(("127.0.0.1", port), FakeAdbdHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def address(self):
+        return "%s:%d" % self.server_address
+
+
+class FakeConsoleHandler(socketserver.StreamRequestHandler):
+    def reply(self, text):
+        self.wfile.write(text.replace("\n", "\r\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        """The emulator console: greeting, optional auth, one command per line, OK or KO: after each"""
+        console = self.server
+        authed = not console.token
+        if authed:
+            self.reply("Android Console: type 'help' for a list of commands\nOK\n")
+        else:
+            self.reply("Android Console: Authentication required\n"
+                       "Android Console: type 'auth <auth_token>' to authenticate\n"
+                       "Android Console: you can find your <auth_token> in \n"
+                       "'~/.emulator_console_auth_token'\nOK\n")
+        for raw in self.rfile:
+            words = raw.decode(errors="replace").split()
+            if not words:
+                continue
+            if words[0] in ("quit", "exit"):
+                return
+            if words[0] == "auth":
+                authed = words[1:] == [console.token]
+                self.reply("Android Console: type 'help' for a list of commands\nOK\n" if authed else
+                           "KO: authentication token does not match ~/.emulator_console_auth_token\n")
+            elif not authed:
+                self.reply("KO: unknown command, try 'help'\n")
+            else:
+                self.reply(console.command(words))
+
+
+class FakeEmulatorConsole(socketserver.ThreadingTCPServer):
+    """Console of one emulator on 127.0.0.1:<port>; its device is emulator-<port>
+
+    snapshots maps snapshot name -> saved device state and is shared by every emulator
+    started from the same AVD, like the snapshots stored in the AVD directory.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, avd, snapshots=None, token=None, load_seconds=0.0):
+        super().__init__(("127.0.0.1", 0), FakeConsoleHandler)
+        self.avd = avd
+        self.snapshots = {} if snapshots is None else snapshots
+        self.token = token
+        self.load_seconds = load_seconds
+        self.device = None
+        self.stats = {"saved": 0, "loaded": 0}
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def command(self, words):
+        if words[:2] == ["avd", "name"]:
+            return f"{self.avd}\nOK\n"
+        if words[:3] == ["avd", "snapshot", "list"]:
+            if not self.snapshots:
+                return "There is no snapshot available\nOK\n"
+            rows = "".join(f"--        {name:<20}{'512M':>8} 2026-01-01 00:00:00   00:00:10.000\n"
+                           for name in sorted(self.snapshots))
+            return ("List of snapshots present on all disks:\n"
+                    "ID        TAG                 VM SIZE                DATE       VM CLOCK\n" + rows + "OK\n")
+        if words[:2] == ["avd", "snapshot"] and len(words) == 4 and words[2] in ("save", "load", "delete"):
+            verb, name = words[2:]
+            if verb == "save":
+                self.snapshots[name] = self.device.save_state()
+                self.stats["saved"] += 1
+            elif name not in self.snapshots:
+                return f"KO: snapshot '{name}' does not exist\n"
+            elif verb == "delete":
+                del self.snapshots[name]
+            else:
+                time.sleep(self.load_seconds)
+                self.device.load_state(self.snapshots[name])
+                self.stats["loaded"] += 1
+            return "OK\n"
+        return "KO: unknown command, try 'help'\n"
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """adb server protocol on 127.0.0.1:<port> in front of a set of FakeDevice objects"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices, port=0, reboot_seconds=0.5):
+        super().__init__(("127.0.0.1", port), FakeAdbHandler)
+        self.devices = {device.serial: device for device in devices}
+        self.network = {}                     # "host:port" -> device reachable with 'adb connect'
+        self.reboot_seconds = reboot_seconds
+        self.stats = {"services": 0}
+        self.devices_lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def device_list(self):
+        with self.devices_lock:
+            return list(self.devices.values())
+
+    def network_list(self):
+        with self.devices_lock:
+            return list(self.network.items())
+
+    def add_wireless(self, device):
+        """Make a device reachable over TCP; it shows up in 'adb devices' only after a connect"""
+        with self.devices_lock:
+            self.network[device.serial] = device
+        return device
+
+    def connect(self, address):
+        if ":" not in address:
+            address += ":5555"
+        with self.devices_lock:
+            device = self.network.get(address)
+            if device is None or device.props.get("adbd") == "off":
+                return f"failed to connect to '{address}': Connection refused"
+            if address in self.devices:
+                return f"already connected to {address}"
+            self.devices[address] = device
+        return f"connected to {address}"
+
+    def disconnect(self, address):
+        with self.devices_lock:
+            gone = [serial for serial in self.devices if serial in self.network and address in ("", serial)]
+            for serial in gone:
+                del self.devices[serial]
+        return "disconnected everything" if not address else (
+            f"disconnected {address}" if gone else f"error: no such device '{address}'")
+
+    def attach(self, device):
+        """Plug a device in (e.g. a hub coming up); drop() unplugs it again"""
+        with self.devices_lock:
+            self.devices[device.serial] = device
+        return device
+
+    def drop(self, serial):
+        """Simulate the Wi-Fi link going away: the device leaves 'adb devices' until reconnected"""
+        with self.devices_lock:
+            self.devices.pop(serial, None)
+
+    def find(self, serial):
+        """Return the device for a serial, or an error string like the real server"""
+        devices = self.device_list()
+        if serial is None:
+            online = [d for d in devices if d.state == "device"]
+            if len(online) != 1:
+                return "more than one device/emulator" if online else "no devices/emulators found"
+            return online[0]
+        device = next((d for d in devices if d.serial == serial), None)
+        if device is None:
+            return f"device '{serial}' not found"
+        if device.state != "device":
+            return f"device {device.state}"
+        return device
+
+    def reboot(self, device):
+        device.state = "offline"
+        device.props["sys.boot_completed"] = ""
+
+        def come_back():
+            time.sleep(self.reboot_seconds)
+            device.system_rw = False
+            device.root = device.boot_root
+            if device.verity == "off after reboot":
+                device.verity = False
+            device.reset_mounts()
+            device.new_boot_id()
+            device.state = "device"
+            device.props["sys.boot_completed"] = "1"
+        threading.Thread(target=come_back, daemon=True).start()
+
+    def restart_as_root(self, device):
+        """'adb root': adbd restarts as root, so the device is offline for a moment"""
+        if device.root == "adb-root":
+            return "adbd is already running as root\n"
+        if not device.root_allowed:
+            return "adbd cannot run as root in production builds\n"
+        device.state = "offline"
+
+        def come_back():
+            time.sleep(0.05)
+            device.root = "adb-root"
+            device.state = "device"
+        threading.Thread(target=come_back, daemon=True).start()
+        return "restarting adbd as root\n"
+
+    def start(self):
+        """Serve in a background thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def make_fleet(count, prefix="FAKE", failures=None, **options):
+    """count devices; failures maps FAILURE_MODES names to how many of them misbehave that way"""
+    modes = [mode for mode, n in (failures or {}).items() for _ in range(n)]
+    modes += ["ok"] * (count - len(modes))
+    return [FakeDevice(f"{prefix}{i:03d}", **dict(options, **FAILURE_MODES[mode]))
+            for i, mode in enumerate(modes[:count], 1)]
+
+
+def make_wireless(server, count, prefix="WIFI", mdns=True, **options):
+    """count devices behind their own FakeAdbd listeners, registered on server's network but not connected"""
+    devices = []
+    for i in range(1, count + 1):
+        adbd = FakeAdbd()
+        device = FakeDevice(adbd.address, **options)
+        device.adbd = adbd
+        device.props.update({"ro.serialno": f"{prefix}{i:03d}", "mdns": "1" if mdns else "0"})
+        devices.append(server.add_wireless(device))
+    return devices
+
+
+def make_emulators(server, count, avd="Fake_API_30", writable=True, verity=True, snapshots=None, token=None,
+                   **options):
+    """count emulators of one AVD (shared snapshots), attached to server as emulator-<console port>
+
+    Like the Google APIs images: adbd starts as shell and allows 'adb root'; /system can be
+    remounted only when started with -writable-system, after a one-time verity reboot.
+    """
+    snapshots = {} if snapshots is None else snapshots
+    sdk = options.pop("sdk", 30)
+    devices = []
+    for _ in range(count):
+        console = FakeEmulatorConsole(avd, snapshots, token)
+        device = FakeDevice(f"emulator-{console.port}", root=None, remount_methods=["adb"] if writable else [],
+                            sdk=sdk, props={"ro.kernel.qemu": "1", "ro.build.fingerprint":
+                                            f"google/sdk_gphone/{avd}:{sdk}/FAKE.{sdk}/1:userdebug/dev-keys"},
+                            **options)
+        device.root_allowed = True
+        device.verity = verity and writable
+        device.console = console
+        console.device = device
+        devices.append(server.attach(device))
+    return devices
+
+
+def parse_failures(text):
+    """'ro-system=2,no-su=1' -> {'ro-system': 2, 'no-su': 1}"""
+    failures = {}
+    for part in filter(None, (text or "").split(",")):
+        mode, _, count = part.partition("=")
+        if mode not in FAILURE_MODES:
+            raise ValueError(f"unknown failure mode '{mode}' (choose from {', '.join(FAILURE_MODES)})")
+        failures[mode] = int(count or 1)
+    return failures
+
+
+def adb_main(argv):
+    """Act as the adb binary for one command, forwarding it to the (fake) server"""
+    import adbclient
+    serial = None
+    if len(argv) >= 2 and argv[0] == "-s":
+        serial, argv = argv[1], argv[2:]
+    counter = os.environ.get("FAKEADB_COUNT")
+    if counter:
+        with open(counter, "ab") as f:
+            f.write(b".")
+    if not argv or argv[0] == "--version":
+        print("Android Debug Bridge version 1.0.41 (fakeadb)")
+        return 0
+    if argv[0] == "devices":
+        print("List of devices attached")
+        for device_serial, state in adbclient.get_client().devices():
+            print(f"{device_serial}\t{state}")
+        return 0
+    stdin = b"" if sys.stdin is None or sys.stdin.isatty() else sys.stdin.buffer.read()
+    result = adbclient.run_socket(argv, serial, 60, stdin or None)
+    sys.stdout.write(result.stdout)
+    sys.stderr.write(result.stderr)
+    return result.returncode
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["adb"]:
+        return adb_main(argv[1:])
+    parser = argparse.ArgumentParser(description="Run a fake adb server backed by simulated devices")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="serve the adb protocol until interrupted")
+    serve.add_argument("--port", type=int, default=5037)
+    serve.add_argument("--devices", type=int, default=2)
+    serve.add_argument("--latency", type=float, default=0.0, help="seconds added to every device service")
+    serve.add_argument("--root", choices=["su", "adb-root", "none"], default="su")
+    serve.add_argument("--sdk", type=int, default=30)
+    serve.add_argument("--jitter", type=float, default=0.0, help="extra random 0..N seconds per service")
+    serve.add_argument("--failures", default="", help="problem devices, e.g. ro-system=2,no-su=1,offline=1")
+    serve.add_argument("--emulators", type=int, default=0,
+                       help="extra emulators (emulator-<console port>) with a console for AVD snapshots")
+    serve.add_argument("--wireless", type=int, default=0,
+                       help="extra devices behind their own adbd listeners, reachable with 'adb connect'")
+    sub.add_parser("adb", help="act as the adb binary: fakeadb.py adb [-s SERIAL] COMMAND...")
+    args = parser.parse_args(argv)
+
+    devices = make_fleet(args.devices, latency=args.latency, sdk=args.sdk, jitter=args.jitter,
+                         root=None if args.root == "none" else args.root, failures=parse_failures(args.failures))
+    server = FakeAdbServer(devices, args.port)
+    wireless = make_wireless(server, args.wireless, latency=args.latency, sdk=args.sdk, jitter=args.jitter)
+    emulators = make_emulators(server, args.emulators, latency=args.latency, sdk=args.sdk, jitter=args.jitter)
+    print(f"fake adb server on 127.0.0.1:{server.port} with {len(devices)} device(s)", flush=True)
+    for device in wireless:
+        print(f"  adbd for {device.props['ro.serialno']} on {device.serial}", flush=True)
+    for device in emulators:
+        print(f"  {device.serial}: console on 127.0.0.1:{device.console.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
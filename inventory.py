@@ -0,0 +1,350 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import concurrent.futures
+from colorama import init, Fore, Style
+import cert
+import phssl
+from certcache import default_cache_dir
+
+init()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    serial TEXT PRIMARY KEY, build TEXT, store TEXT, listing TEXT, scanned REAL, changed REAL);
+CREATE TABLE IF NOT EXISTS certs (
+    fingerprint TEXT PRIMARY KEY, hash TEXT, subject TEXT, issuer TEXT, not_before TEXT, not_after TEXT,
+    serial_number TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    serial TEXT, name TEXT, hash TEXT, fingerprint TEXT, size INTEGER, mtime INTEGER, first_seen REAL,
+    last_seen REAL, PRIMARY KEY (serial, name));
+CREATE TABLE IF NOT EXISTS changes (serial TEXT, name TEXT, fingerprint TEXT, change TEXT, ts REAL);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+CREATE INDEX IF NOT EXISTS files_fingerprint ON files (fingerprint);
+CREATE INDEX IF NOT EXISTS certs_hash ON certs (hash);
+CREATE INDEX IF NOT EXISTS changes_serial ON changes (serial, ts);
+"""
+
+# One adb call: which store conscrypt reads, the build, and name/size/mtime of every file in it
+PROBE_COMMAND = (f'D={phssl.CACERTS_DIR}; [ -d {phssl.APEX_CACERTS_DIR} ] && D={phssl.APEX_CACERTS_DIR}; '
+                 'echo "KB STORE $D $(getprop ro.build.fingerprint)"; stat -c "%n %s %Y" $D/*')
+
+
+class Inventory:
+    """SQLite index of the CA files seen on each device, with subject and expiry per certificate
+
+    Files are keyed by serial and name; certificates by SHA-256 fingerprint, so the same CA
+    on a hundred devices is parsed and stored once. Every add, remove or change a scan finds
+    is kept in the changes table.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), "inventory.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def known(self, serial):
+        """(stored listing, {name: (size, mtime)}) for a device; (None, {}) if never scanned"""
+        row = self.db.execute("SELECT listing FROM devices WHERE serial = ?", (serial,)).fetchone()
+        files = {r["name"]: (r["size"], r["mtime"])
+                 for r in self.db.execute("SELECT name, size, mtime FROM files WHERE serial = ?", (serial,))}
+        return (row["listing"] if row else None), files
+
+    def update(self, scan):
+        """Apply one device's scan result; returns {'added': [...], 'removed': [...], 'changed': [...]}"""
+        now = time.time()
+        serial, report = scan["serial"], {"added": [], "removed": [], "changed": []}
+        with self.db:
+            self.db.execute("INSERT INTO devices (serial, build, store, listing, scanned, changed) "
+                            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (serial) DO UPDATE SET build = excluded.build, "
+                            "store = excluded.store, listing = excluded.listing, scanned = excluded.scanned",
+                            (serial, scan["build"], scan["store"], scan["listing"] if scan["complete"] else None,
+                             now, now))
+            if scan["previous"] is not None and scan["listing"] == scan["previous"]:
+                self.db.execute("UPDATE files SET last_seen = ? WHERE serial = ?", (now, serial))
+                return report
+            old = {r["name"]: r["fingerprint"]
+                   for r in self.db.execute("SELECT name, fingerprint FROM files WHERE serial = ?", (serial,))}
+            for name in sorted(set(old) - set(scan["files"])):
+                self.db.execute("DELETE FROM files WHERE serial = ? AND name = ?", (serial, name))
+                self._change(serial, name, old[name], "removed", now, report)
+            for name, (size, mtime) in scan["files"].items():
+                if name not in scan["contents"]:
+                    self.db.execute("UPDATE files SET last_seen = ? WHERE serial = ? AND name = ?", (now, serial, name))
+                    continue
+                fingerprint = self._store_cert(scan["contents"][name])
+                self.db.execute("INSERT INTO files (serial, name, hash, fingerprint, size, mtime, first_seen, last_seen) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (serial, name) DO UPDATE SET "
+                                "fingerprint = excluded.fingerprint, size = excluded.size, mtime = excluded.mtime, "
+                                "last_seen = excluded.last_seen",
+                                (serial, name, name.split(".")[0], fingerprint, size, mtime, now, now))
+                if name not in old:
+                    self._change(serial, name, fingerprint, "added", now, report)
+                elif old[name] != fingerprint:
+                    self._change(serial, name, fingerprint, "changed", now, report)
+            if any(report.values()):
+                self.db.execute("UPDATE devices SET changed = ? WHERE serial = ?", (now, serial))
+        return report
+
+    def _store_cert(self, data):
+        """Index one file's certificate; files that don't parse are keyed by the SHA-256 of their bytes"""
+        try:
+            info = cert.certificate_info(data)
+        except ValueError:
+            return hashlib.sha256(data).hexdigest()
+        self.db.execute("INSERT OR IGNORE INTO certs (fingerprint, hash, subject, issuer, not_before, not_after, "
+                        "serial_number) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (info["fingerprint"], info["hash"], info["subject"], info["issuer"], info["not_before"],
+                         info["not_after"], info["serial"]))
+        return info["fingerprint"]
+
+    def _change(self, serial, name, fingerprint, change, now, report):
+        self.db.execute("INSERT INTO changes (serial, name, fingerprint, change, ts) VALUES (?, ?, ?, ?, ?)",
+                        (serial, name, fingerprint, change, now))
+        report[change].append(name)
+
+    def _files(self, where, params=()):
+        return [dict(row) for row in self.db.execute(
+            "SELECT f.serial, f.name, f.fingerprint, f.last_seen, c.subject, c.issuer, c.not_after "
+            "FROM files f LEFT JOIN certs c ON c.fingerprint = f.fingerprint "
+            f"WHERE {where} ORDER BY f.serial, f.name", params)]
+
+    def find(self, query):
+        """Files matching a <hash>[.N] name, a fingerprint (prefix) or a subject/issuer substring"""
+        text = query.strip().lower().replace(":", "")
+        if re.fullmatch(r"[0-9a-f]{8}(\.\d+)?", text):
+            if "." in text:
+                return self._files("f.name = ?", (text,))
+            return self._files("f.hash = ?", (text,))
+        if re.fullmatch(r"[0-9a-f]{12,64}", text):
+            # Range instead of LIKE so the fingerprint index is used
+            return self._files("f.fingerprint >= ? AND f.fingerprint < ?", (text, text + "g"))
+        pattern = f"%{query.strip()}%"
+        return self._files("c.subject LIKE ? OR c.issuer LIKE ?", (pattern, pattern))
+
+    def device(self, serial):
+        return self._files("f.serial = ?", (serial,))
+
+    def expiring(self, before):
+        """Files whose certificate expires before an ISO timestamp"""
+        return self._files("c.not_after < ?", (before,))
+
+    def diff(self, serial_a, serial_b):
+        """Certificates (by fingerprint) only on a, and only on b"""
+        a, b = self.device(serial_a), self.device(serial_b)
+        in_a, in_b = {f["fingerprint"] for f in a}, {f["fingerprint"] for f in b}
+        return [f for f in a if f["fingerprint"] not in in_b], [f for f in b if f["fingerprint"] not in in_a]
+
+    def changes(self, serial=None, since=0):
+        where, params = "ch.ts >= ?", [since]
+        if serial:
+            where, params = where + " AND ch.serial = ?", params + [serial]
+        return [dict(row) for row in self.db.execute(
+            "SELECT ch.serial, ch.name, ch.fingerprint, ch.change, ch.ts, c.subject FROM changes ch "
+            f"LEFT JOIN certs c ON c.fingerprint = ch.fingerprint WHERE {where} ORDER BY ch.ts, ch.serial, ch.name",
+            params)]
+
+    def devices(self):
+        return [dict(row) for row in self.db.execute(
+            "SELECT d.serial, d.build, d.store, d.scanned, d.changed, COUNT(f.name) AS files FROM devices d "
+            "LEFT JOIN files f ON f.serial = d.serial GROUP BY d.serial ORDER BY d.serial")]
+
+
+def parse_listing(text):
+    """Split the probe output into (store, build, {name: (size, mtime)})"""
+    store, build, files = None, "", {}
+    for line in text.splitlines():
+        if line.startswith("KB STORE "):
+            fields = line.split(" ", 3)
+            store = fields[2]
+            build = fields[3] if len(fields) > 3 else ""
+            continue
+        parts = line.rsplit(" ", 2)
+        if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+            files[os.path.basename(parts[0])] = (int(parts[1]), int(parts[2]))
+    return store, build, files
+
+
+def parse_dump(output):
+    """Split "KB CERT <name>" + file text blocks into {name: bytes}"""
+    contents, name = {}, None
+    for line in output.splitlines(keepends=True):
+        if line.startswith("KB CERT "):
+            name = line[8:].strip()
+            contents[name] = ""
+        elif name is not None:
+            contents[name] += line
+    return {name: text.encode() for name, text in contents.items()}
+
+
+def read_files(serial, store, names):
+    """Read several files from the store in one adb call; returns {name: bytes}"""
+    if not names:
+        return {}
+    run = phssl.run_adb(["shell", f'for f in {" ".join(names)}; do echo "KB CERT $f"; cat {store}/$f; done'],
+                        serial, timeout=30, op="inventory")
+    return parse_dump(run.stdout)
+
+
+def scan_device(serial, previous, known, full=False):
+    """Probe one device and read only the files that are new or whose size/mtime moved (worker)"""
+    probe = phssl.run_adb(["shell", PROBE_COMMAND], serial, timeout=30, op="inventory")
+    store, build, files = parse_listing(probe.stdout)
+    if probe.returncode not in (0, 1) or store is None:
+        return {"serial": serial, "error": (probe.stderr or "no answer").strip()}
+    listing = "\n".join(f"{name} {size} {mtime}" for name, (size, mtime) in sorted(files.items()))
+    if full:
+        previous = None
+    stale = [] if listing == previous else [name for name in files if full or known.get(name) != files[name]]
+    contents = read_files(serial, store, sorted(stale))
+    # A file that could not be read keeps the listing unsaved, so the next scan tries it again
+    return {"serial": serial, "store": store, "build": build, "listing": listing, "previous": previous,
+            "files": files, "contents": contents, "complete": all(name in contents for name in stale)}
+
+
+def scan(inventory, serials, workers=8, full=False, on_result=None):
+    """Scan devices in parallel; the database is only written from this thread"""
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {}
+        for serial in serials:
+            previous, known = inventory.known(serial)
+            futures[pool.submit(scan_device, serial, previous, known, full)] = serial
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"serial": futures[future], "error": str(e)}
+            if "error" not in result:
+                result["report"] = inventory.update(result)
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return sorted(results, key=lambda result: result["serial"])
+
+
+def print_scan_result(result):
+    if "error" in result:
+        print(Fore.RED + f"✗ {result['serial']}: {result['error']}" + Style.RESET_ALL)
+        return
+    report = result["report"]
+    if result["listing"] == result["previous"]:
+        detail, color = "unchanged", Fore.CYAN
+    else:
+        detail = (f"+{len(report['added'])} -{len(report['removed'])} ~{len(report['changed'])}, "
+                  f"{len(result['contents'])} file(s) read")
+        color = Fore.YELLOW if any(report.values()) else Fore.GREEN
+    print(color + f"✓ {result['serial']}: {len(result['files'])} cert(s) in {result['store']}, {detail}"
+          + Style.RESET_ALL)
+    for change in ("added", "removed", "changed"):
+        for name in report[change]:
+            print(f"    {change:<8} {name}")
+
+
+def print_files(files):
+    for f in files:
+        expires = (f["not_after"] or "?")[:10]
+        print(f"{f['serial']:<24}{f['name']:<14}{expires:<12}{f['subject'] or '(not a certificate)'}")
+
+
+def stamp(ts):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts)) if ts else "-"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Certificate inventory: which CA files are on which device")
+    parser.add_argument("command", choices=["scan", "devices", "find", "show", "diff", "changes", "expiring"],
+                        help="scan devices; list devices; find HASH|FINGERPRINT|TEXT; show SERIAL; "
+                             "diff SERIAL_A SERIAL_B; changes; expiring")
+    parser.add_argument("terms", nargs="*", help="query or serial(s) for find, show and diff")
+    parser.add_argument("-s", "--serial", action="append", help="scan or list changes for this serial (repeatable)")
+    parser.add_argument("--workers", type=int, default=8, help="devices scanned in parallel (default: 8)")
+    parser.add_argument("--full", action="store_true", help="re-read every file, even if size and mtime match")
+    parser.add_argument("--days", type=float, default=30, help="expiring: within this many days (default: 30)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--db", help="inventory database (default: inventory.sqlite in the cache directory)")
+    args = parser.parse_args(argv)
+    wanted = {"find": 1, "show": 1, "diff": 2}.get(args.command, 0)
+    if len(args.terms) != wanted:
+        parser.error(f"{args.command} takes {wanted} argument(s)")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    inventory = Inventory(args.db)
+    try:
+        return run_command(inventory, args)
+    finally:
+        inventory.close()
+
+
+def run_command(inventory, args):
+    if args.command == "scan":
+        if not phssl.check_adb_installed():
+            return 1
+        serials = args.serial or [serial for serial, state in phssl.get_connected_devices() if state == "device"]
+        if not serials:
+            print(Fore.RED + "No devices connected." + Style.RESET_ALL)
+            return 1
+        results = scan(inventory, serials, args.workers, args.full,
+                       on_result=None if args.json else print_scan_result)
+        if args.json:
+            print(json.dumps([{key: result.get(key) for key in ("serial", "store", "build", "report", "error")}
+                              for result in results], indent=1))
+        return 1 if any("error" in result for result in results) else 0
+
+    if args.command == "devices":
+        rows = [d for d in inventory.devices() if not args.serial or d["serial"] in args.serial]
+        if args.json:
+            print(json.dumps(rows, indent=1))
+        for d in [] if args.json else rows:
+            print(Fore.CYAN + f"{d['serial']:<24}{d['files']:>4} file(s)  {d['store']}" + Style.RESET_ALL)
+            print(f"    scanned {stamp(d['scanned'])}, last change {stamp(d['changed'])}, {d['build'] or '?'}")
+        return 0
+
+    if args.command == "diff":
+        only_a, only_b = inventory.diff(*args.terms)
+        if args.json:
+            print(json.dumps({args.terms[0]: only_a, args.terms[1]: only_b}, indent=1))
+            return 0
+        for serial, files in ((args.terms[0], only_a), (args.terms[1], only_b)):
+            print(Fore.YELLOW + f"Only on {serial}: {len(files)}" + Style.RESET_ALL)
+            print_files(files)
+        return 0
+
+    if args.command == "changes":
+        rows = [row for serial in (args.serial or [None]) for row in inventory.changes(serial)]
+        if args.json:
+            print(json.dumps(rows, indent=1))
+        for row in [] if args.json else rows:
+            print(f"{stamp(row['ts'])}  {row['serial']:<24}{row['change']:<9}{row['name']:<14}"
+                  f"{row['subject'] or ''}")
+        return 0
+
+    if args.command == "find":
+        files = inventory.find(args.terms[0])
+    elif args.command == "show":
+        files = inventory.device(args.terms[0])
+    else:
+        files = inventory.expiring(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + args.days * 86400)))
+    if args.json:
+        print(json.dumps(files, indent=1))
+    else:
+        print_files(files)
+        print(Fore.CYAN + f"{len(files)} file(s) on {len({f['serial'] for f in files})} device(s)" + Style.RESET_ALL)
+    return 0 if files else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from colorama import init, Fore, Style
+import cert
+from certcache import default_cache_dir
+
+init()
+
+# A directory walk picks up convertible inputs (cert.CERT_EXTENSIONS) and installed-style <hash>.N files;
+# only findings at level "error" block an install, warnings and notes are reported
+INSTALLED_NAME = re.compile(r"^[0-9a-f]{8}\.\d+$")
+
+DEFAULT_WARN_DAYS = 30
+CACHE_ENTRIES = 5000
+
+
+class LintCache:
+    """Parsed certificate facts by SHA-256 of the file bytes (lint.json in the cache directory)
+
+    Only facts are cached, never verdicts: expiry is judged against the clock on every run.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir or default_cache_dir(), "lint.json")
+        self.entries = self._load()
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def facts(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = dict(certificate_facts(data), checked=time.time())
+            self.dirty = True
+        return entry
+
+    def save(self):
+        if not self.dirty:
+            return
+        # Oldest first out once the file gets big
+        for key in sorted(self.entries, key=lambda k: self.entries[k].get("checked", 0))[:-CACHE_ENTRIES]:
+            del self.entries[key]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def certificate_facts(data):
+    """Everything the checks need from one file, or {'error': ...} if it does not parse"""
+    try:
+        facts = dict(cert.certificate_info(data), **cert.certificate_constraints(data))
+    except ValueError as e:
+        return {"error": str(e)}
+    facts["count"] = max(1, data.count(b"-----BEGIN CERTIFICATE-----"))
+    return facts
+
+
+def check_facts(facts, name=None, now=None, warn_days=DEFAULT_WARN_DAYS):
+    """Findings for one certificate on its own: [(level, code, message)]"""
+    if "error" in facts:
+        return [("error", "parse", facts["error"])]
+    now = now or datetime.now(timezone.utc)
+    stamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    findings = []
+    if facts["count"] > 1:
+        findings.append(("warning", "bundle", f"{facts['count']} certificates in one file, only the first is used"))
+    if facts["ca"] is False:
+        findings.append(("error", "not-ca", "basicConstraints CA:FALSE, this is not a CA certificate"))
+    elif facts["ca"] is None:
+        findings.append(("warning", "no-basic-constraints", "v1 certificate, no basicConstraints"
+                         if facts["version"] < 3 else "no basicConstraints extension"))
+    if facts["key_cert_sign"] is False:
+        findings.append(("error", "key-usage", "keyUsage does not allow keyCertSign"))
+    if facts["not_after"] < stamp:
+        findings.append(("error", "expired", f"expired {facts['not_after']}"))
+    elif facts["not_before"] > stamp:
+        findings.append(("error", "not-yet-valid", f"not valid before {facts['not_before']}"))
+    elif facts["not_after"] < (now + timedelta(days=warn_days)).strftime("%Y-%m-%dT%H:%M:%SZ"):
+        findings.append(("warning", "expiring", f"expires {facts['not_after']}"))
+    if name and INSTALLED_NAME.match(name) and name.split(".")[0] != facts["hash"]:
+        findings.append(("error", "name-mismatch",
+                         f"named {name} but the subject hash is {facts['hash']}; Android will never look it up"))
+    return findings
+
+
+def install_name(path, facts):
+    """Name the file gets in cacerts: its own for <hash>.N files, <hash>.0 for converted inputs"""
+    name = os.path.basename(path)
+    return name if INSTALLED_NAME.match(name) else f"{facts['hash']}.0"
+
+
+def find_lint_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                files += [os.path.join(dirpath, name) for name in sorted(filenames)
+                          if name.lower().endswith(cert.CERT_EXTENSIONS) or INSTALLED_NAME.match(name)]
+        else:
+            files.append(path)
+    return files
+
+
+def load_target(against=None, device=None, cache=None):
+    """{name: {fingerprint, subject}} of the store the files will go into, without touching a device
+
+    against is a local directory of cacerts files; device is a serial looked up in the
+    inventory database from its last scan.
+    """
+    target = {}
+    if against:
+        for name in sorted(os.listdir(against)):
+            path = os.path.join(against, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    facts = cache.facts(f.read()) if cache else certificate_facts(f.read())
+                if "error" not in facts:
+                    target[name] = {"fingerprint": facts["fingerprint"], "subject": facts["subject"]}
+    if device:
+        import inventory
+        db = inventory.Inventory()
+        try:
+            rows = db.device(device)
+        finally:
+            db.close()
+        if not rows:
+            raise ValueError(f"{device}: not in the inventory, run 'inventory.py scan -s {device}' first")
+        for row in rows:
+            target[row["name"]] = {"fingerprint": row["fingerprint"], "subject": row["subject"]}
+    return target
+
+
+def lint_paths(paths, target=None, cache=None, warn_days=DEFAULT_WARN_DAYS, now=None):
+    """Lint files (directories are walked) against each other and an optional target store
+
+    Returns one {'path', 'name', 'facts', 'findings'} entry per file, in input order.
+    """
+    results, by_name, by_fingerprint, by_hash = [], {}, {}, {}
+    for path in find_lint_files(paths):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            results.append({"path": path, "name": None, "facts": {}, "findings": [("error", "read", str(e))]})
+            continue
+        facts = cache.facts(data) if cache else certificate_facts(data)
+        findings = check_facts(facts, os.path.basename(path), now, warn_days)
+        name = None
+        if "error" not in facts:
+            name = install_name(path, facts)
+            fingerprint = facts["fingerprint"]
+            if fingerprint in by_fingerprint:
+                findings.append(("note", "duplicate-file", f"same certificate as {by_fingerprint[fingerprint]}"))
+            elif name in by_name:
+                findings.append(("error", "name-collision", f"{by_name[name]} would also be installed as {name}"))
+            elif facts["hash"] in by_hash:
+                findings.append(("warning", "duplicate-subject", f"same subject as {by_hash[facts['hash']]}"))
+            by_fingerprint.setdefault(fingerprint, path)
+            by_name.setdefault(name, path)
+            by_hash.setdefault(facts["hash"], path)
+            findings += check_target(name, facts, target or {})
+        results.append({"path": path, "name": name, "facts": facts, "findings": findings})
+    if cache:
+        cache.save()
+    return results
+
+
+def check_target(name, facts, target):
+    """Findings from comparing one file with what the target store already holds"""
+    findings = []
+    present = [n for n, entry in target.items() if entry["fingerprint"] == facts["fingerprint"]]
+    if present:
+        findings.append(("note", "present", f"already in the target store as {present[0]}"))
+    elif name in target:
+        findings.append(("error", "replaces", f"target {name} is a different certificate "
+                                              f"({target[name]['subject'] or 'unparsed'}); it would be overwritten"))
+    else:
+        same = [n for n in target if n.split(".")[0] == facts["hash"]]
+        if same:
+            findings.append(("warning", "duplicate-subject", f"target already has {same[0]} for this subject"))
+    return findings
+
+
+def failed(results):
+    return [result for result in results if any(level == "error" for level, _, _ in result["findings"])]
+
+
+def print_results(results, verbose=False):
+    colors = {"error": Fore.RED, "warning": Fore.YELLOW, "note": Fore.CYAN}
+    for result in results:
+        levels = [level for level, _, _ in result["findings"]]
+        if "error" in levels:
+            mark = Fore.RED + "✗"
+        elif "warning" in levels:
+            mark = Fore.YELLOW + "!"
+        else:
+            mark = Fore.GREEN + "✓"
+        if not verbose and not levels:
+            continue
+        label = f" -> {result['name']}" if result["name"] and result["name"] != os.path.basename(result["path"]) else ""
+        print(mark + f" {result['path']}{label}" + Style.RESET_ALL)
+        for level, code, message in result["findings"]:
+            print(colors[level] + f"    {level}: {code}: {message}" + Style.RESET_ALL)
+
+
+def preflight(paths, log=print, cache=None, target=None):
+    """Lint files before any device time is spent; logs the problems and returns True when none is an error"""
+    results = lint_paths(paths, target, cache if cache is not None else LintCache())
+    for result in results:
+        for level, code, message in result["findings"]:
+            if level != "note":
+                color = Fore.RED if level == "error" else Fore.YELLOW
+                log(color + f"{result['path']}: {level}: {message}" + Style.RESET_ALL)
+    return not failed(results)
+
+
+def check_bytes(data, label="certificate", warn_days=DEFAULT_WARN_DAYS):
+    """Raise ValueError for certificate bytes that fail a check; returns the warning messages"""
+    findings = check_facts(certificate_facts(data), warn_days=warn_days)
+    errors = [message for level, _, message in findings if level == "error"]
+    if errors:
+        raise ValueError(f"{label}: {'; '.join(errors)}")
+    return [message for level, _, message in findings if level == "warning"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-flight checks for CA certificates before they go to devices")
+    parser.add_argument("paths", nargs="+", help="certificate files or directories (.der/.pem/.crt/.cer/<hash>.N)")
+    parser.add_argument("--against", metavar="DIR", help="compare with a local copy of the target cacerts directory")
+    parser.add_argument("--device", metavar="SERIAL",
+                        help="compare with a device's trust store as of its last inventory scan")
+    parser.add_argument("--warn-days", type=int, default=DEFAULT_WARN_DAYS,
+                        help="warn about certificates expiring within this many days (default: %(default)s)")
+    parser.add_argument("--strict", action="store_true", help="treat warnings as errors")
+    parser.add_argument("--no-cache", action="store_true", help="parse every file again")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also list files without findings")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    cache = None if args.no_cache else LintCache()
+    try:
+        target = load_target(args.against, args.device, cache)
+    except (OSError, ValueError) as e:
+        print(Fore.RED + str(e) + Style.RESET_ALL)
+        return 2
+    results = lint_paths(args.paths, target, cache, args.warn_days)
+    bad = failed(results)
+    if args.strict:
+        bad = [r for r in results if any(level in ("error", "warning") for level, _, _ in r["findings"])]
+    if args.json:
+        print(json.dumps([dict(r, findings=[{"level": l, "code": c, "message": m} for l, c, m in r["findings"]])
+                          for r in results], indent=1))
+    else:
+        print_results(results, args.verbose)
+        print(Fore.CYAN + f"{len(results)} file(s), {len(bad)} rejected, "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms" + Style.RESET_ALL)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,98 @@
 import os
-import subprocess
-import shutil
-import random
 import sys
-import time
-from colorama import init, Fore, Style
+import random
+import hashlib
+import importlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
 
-init()
+# Third-party libraries the suite needs (checked once per interpreter, see ensure_dependencies)
+REQUIREMENTS = ['colorama']
 
-logo = f"""
+# Subcommand -> (module, entry function, description). Modules are imported only when their
+# command runs, so the menu and 'main.py <command>' never pay for tools they do not use.
+COMMANDS = {
+    'convert': ('cert', 'cli', 'Convert DER/PEM certificates to <hash>.0 files'),
+    'install': ('phssl', 'cli', 'Install .0 certificates on devices'),
+    'pipeline': ('pipeline', 'main', 'Headless DER/PEM -> installed, verified cert (JSON result)'),
+    'proxy': ('setup_wifi', 'main', 'Set or clear the Wi-Fi proxy on devices'),
+    'wireless': ('wireless', 'main', 'Discover, connect and keep alive adb-over-TCP devices'),
+    'lint': ('lint', 'main', 'Pre-flight checks for certificates before they go to devices'),
+    'emulator': ('emulator', 'main', 'List or delete the AVD snapshots saved with the certs'),
+    'inventory': ('inventory', 'main', 'Index, search and diff the CA certs on devices'),
+    'rotate': ('rotate', 'main', 'Remove or rotate CA certs across devices'),
+    'provisiond': ('provisiond', 'main', 'Provisioning service with a job queue and local API'),
+    'watch': ('watch', 'main', 'Provision devices automatically as they are plugged in'),
+    'cache': ('certcache', 'main', 'Inspect or prune the conversion cache'),
+    'profiles': ('devprofile', 'main', 'Inspect or reset stored device profiles'),
+    'trace': ('tracing', 'main', 'Aggregate install traces'),
+    'bench': ('bench', 'main', 'Offline benchmarks against simulated devices'),
+    'fakeadb': ('fakeadb', 'main', 'Run the fake adb server'),
+}
+
+def logo():
+    from colorama import Fore, Style
+    return f"""
 {random.choice([Fore.RED, Fore.GREEN, Fore.YELLOW, Fore.BLUE, Fore.MAGENTA, Fore.CYAN])}>>===========================================<<
 ||                                           ||
 ||  _  __     _ _         ____  _ _ _        ||
 || | |/ /__ _| | | __ _  | __ )(_) | | __ _  ||
-|| | ' // _` | | |/ _` | |  _ \| | | |/ _` | ||
-|| | . \ (_| | | | (_| | | |_) | | | | (_| | ||
-|| |_|\_\__,_|_|_|\__,_| |____/|_|_|_|\__,_| ||
+|| | ' // _` | | |/ _` | |  _ \\| | | |/ _` | ||
+|| | . \\ (_| | | | (_| | | |_) | | | | (_| | ||
+|| |_|\\_\\__,_|_|_|\\__,_| |____/|_|_|_|\\__,_| ||
 ||                                           ||
 >>===========================================<<{Style.RESET_ALL}
 """
 
-def install_required_library(library):
+def dependency_stamp():
+    # Same directory as certcache.default_cache_dir(), which can't be imported before colorama is
+    base = os.environ.get("KALLA_BILLA_CACHE") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "kalla_billa")
+    key = hashlib.sha1(f"{sys.executable}|{sys.version}|{','.join(REQUIREMENTS)}".encode()).hexdigest()[:12]
+    return os.path.join(base, f"deps-{key}")
+
+def ensure_dependencies(force=False):
+    """Install missing libraries; a stamp file skips the check for this interpreter next time"""
+    stamp = dependency_stamp()
+    if not force and os.path.exists(stamp):
+        return
+    import importlib.util
+    import subprocess
+    for library in REQUIREMENTS:
+        if importlib.util.find_spec(library) is None:
+            print(f"Installing {library}...")
+            subprocess.run([sys.executable, '-m', 'pip', 'install', library], check=True)
+            print(f"{library} installed successfully.")
     try:
-        import importlib
-        importlib.import_module(library)
-    except ImportError:
-        print(Fore.RED + f"Installing {library}..." + Style.RESET_ALL)
-        subprocess.run([sys.executable, '-m', 'pip', 'install', library], check=True)
-        print(Fore.GREEN + f"{library} installed successfully." + Style.RESET_ALL)
+        os.makedirs(os.path.dirname(stamp), exist_ok=True)
+        open(stamp, 'w').close()
+    except OSError:
+        pass
+
+def run_command(name, argv):
+    """Import a tool lazily and run its entry point in this process; returns an exit code"""
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    module_name, function, _ = COMMANDS[name]
+    try:
+        code = getattr(importlib.import_module(module_name), function)(argv)
+    except SystemExit as e:
+        code = e.code
+    return code if isinstance(code, int) else (0 if code is None else 1)
 
 def display_menu():
+    from colorama import Fore, Style
     print(f"\n{Fore.YELLOW}{'='*50}{Style.RESET_ALL}")
     print(f"{Fore.CYAN}{' '*18}MAIN MENU{' '*18}{Style.RESET_ALL}")
     print(f"{Fore.YELLOW}{'='*50}{Style.RESET_ALL}")
     print(f"{Fore.GREEN}1. Convert DER to PEM (cert.py){Style.RESET_ALL}")
     print(f"{Fore.GREEN}2. Install Certificate (phssl.py){Style.RESET_ALL}")
+    print(f"{Fore.GREEN}3. Set/Clear Wi-Fi Proxy (setup_wifi.py){Style.RESET_ALL}")
     print(f"{Fore.RED}0. Exit{Style.RESET_ALL}")
     print(f"{Fore.YELLOW}{'-'*50}{Style.RESET_ALL}")
 
-def run_cert_py():
-    try:
-        subprocess.run([sys.executable, 'cert.py'])
-    except FileNotFoundError:
-        print(f"{Fore.RED}cert.py not found!{Style.RESET_ALL}")
-
-def run_phssl_py():
-    try:
-        subprocess.run([sys.executable, 'phssl.py'])
-    except FileNotFoundError:
-        print(f"{Fore.RED}phssl.py not found!{Style.RESET_ALL}")
-
 def print_welcome():
+    from colorama import Fore, Style
     print(f"{Fore.MAGENTA}{'*'*60}{Style.RESET_ALL}")
     print(f"{Fore.CYAN}{' '*15}WELCOME TO KALLA BILLA SUITE{' '*15}{Style.RESET_ALL}")
     print(f"{Fore.MAGENTA}{'*'*60}{Style.RESET_ALL}")
@@ -58,16 +100,18 @@ def print_welcome():
     print(f"{Fore.GREEN}Tools:{Style.RESET_ALL}")
     print(f"{Fore.CYAN}  • cert.py: Convert DER certificates to PEM format{Style.RESET_ALL}")
     print(f"{Fore.CYAN}  • phssl.py: Install certificates on Android devices{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}  • setup_wifi.py: Point device Wi-Fi at your proxy{Style.RESET_ALL}")
     print(f"{Fore.MAGENTA}{'*'*60}{Style.RESET_ALL}\n")
 
 def check_requirements():
-    required_files = ['cert.py', 'phssl.py']
+    from colorama import Fore, Style
+    required_files = ['cert.py', 'phssl.py', 'setup_wifi.py']
     missing = []
-    
+
     for file in required_files:
-        if not os.path.exists(file):
+        if not os.path.exists(os.path.join(HERE, file)):
             missing.append(file)
-    
+
     if missing:
         print(f"{Fore.RED}Missing required files:{Style.RESET_ALL}")
         for file in missing:
@@ -76,39 +120,44 @@ def check_requirements():
         return False
     return True
 
-def main():
+def print_usage():
+    print("usage: main.py [COMMAND [ARGS...]]\n\nWithout a command, the interactive menu starts.\n\ncommands:")
+    for name, (module, _, description) in COMMANDS.items():
+        print(f"  {name:<10} {description} ({module}.py)")
+
+def menu():
+    from colorama import Fore, Style
     try:
-        install_required_library('colorama')
-        
-        print(logo)
+        print(logo())
         print_welcome()
-        
+
         if not check_requirements():
             print(f"{Fore.RED}Cannot proceed. Required files are missing.{Style.RESET_ALL}")
             input(f"{Fore.YELLOW}Press Enter to exit...{Style.RESET_ALL}")
             return
-        
+
         while True:
             display_menu()
-            choice = input(f"{Fore.CYAN}Select option (0-2): {Style.RESET_ALL}")
-            
+            choice = input(f"{Fore.CYAN}Select option (0-3): {Style.RESET_ALL}")
+
             if choice == "1":
                 print(f"{Fore.YELLOW}Launching Certificate Converter...{Style.RESET_ALL}")
-                time.sleep(1)
-                run_cert_py()
+                run_command('convert', [])
             elif choice == "2":
                 print(f"{Fore.YELLOW}Launching Certificate Installer...{Style.RESET_ALL}")
-                time.sleep(1)
-                run_phssl_py()
+                run_command('install', [])
+            elif choice == "3":
+                print(f"{Fore.YELLOW}Launching Wi-Fi Proxy Setup...{Style.RESET_ALL}")
+                run_command('proxy', [])
             elif choice == "0":
                 print(f"{Fore.GREEN}Thank you for using Kalla Billa Suite!{Style.RESET_ALL}")
                 print(f"{Fore.YELLOW}Goodbye! 👋{Style.RESET_ALL}")
                 break
             else:
-                print(f"{Fore.RED}Invalid option! Please select 0, 1, or 2.{Style.RESET_ALL}")
-            
+                print(f"{Fore.RED}Invalid option! Please select 0, 1, 2 or 3.{Style.RESET_ALL}")
+
             input(f"{Fore.YELLOW}Press Enter to continue...{Style.RESET_ALL}")
-    
+
     except KeyboardInterrupt:
         print(f"\n{Fore.RED}Operation cancelled by user.{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}Goodbye!{Style.RESET_ALL}")
@@ -118,5 +167,27 @@ def main():
         if 'choice' not in locals() or choice != "0":
             input(f"{Fore.YELLOW}Press Enter to exit...{Style.RESET_ALL}")
 
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in ('-h', '--help', 'help'):
+        print_usage()
+        return 0
+    if argv and argv[0] not in COMMANDS:
+        print(f"main.py: unknown command '{argv[0]}'\n")
+        print_usage()
+        return 2
+    ensure_dependencies()
+    try:
+        import colorama
+    except ImportError:
+        # Stamp is stale (library removed since): check again for real
+        ensure_dependencies(force=True)
+        import colorama
+    colorama.init()
+    if argv:
+        return run_command(argv[0], argv[1:])
+    menu()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -2,23 +2,98 @@ import os
 import subprocess
 import sys
 import time
+import shutil
+import io
+import tarfile
+import secrets
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
+import concurrent.futures
 from colorama import init, Fore, Style
+import adbclient
+import adbasync
+import devprofile
+import lint
+import tracing
+import wireless
 
 # Initialize colorama for colored output
 init()
 
-# Function to check and install required library
-def install_required_library(library):
+CACERTS_DIR = "/system/etc/security/cacerts"
+# Android 14+ (SDK 34) reads trust anchors from the conscrypt APEX instead
+APEX_CACERTS_DIR = "/apex/com.android.conscrypt/cacerts"
+# Changes on every boot: tells a finished reboot apart from the old boot still answering
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+# Per-thread state: the device deadline, cancellation session and current step used by run_adb
+_local = threading.local()
+
+# Shell remount commands, tried after 'adb remount' by both install engines
+REMOUNT_COMMANDS = [
+    'mount -o rw,remount /system',
+    'mount -o rw,remount /',
+    'mount -o remount,rw /system'
+]
+
+# Streaming copy: the cert bytes go from host memory through the shell's stdin into the target,
+# and the same call prints the SHA-256 of what landed. No temp file on the host or the device.
+STREAM_COMMANDS = {
+    'stream-su': "su -c 'cat > {path} && chmod 644 {path} && sha256sum {path}'",
+    # adbd already running as root
+    'stream': "cat > {path} && chmod 644 {path} && sha256sum {path}",
+}
+
+# Capability profiles shared by every worker thread (see devprofile.py)
+profiles = None
+
+class DeviceTimeout(Exception):
+    """Raised when a device runs past its overall time budget"""
+
+class DeviceCancelled(Exception):
+    """Raised in a device worker once its session has been cancelled"""
+
+@contextlib.contextmanager
+def device_deadline(seconds):
+    """Limit every adb call made by this thread to an overall time budget"""
+    _local.deadline = time.monotonic() + seconds if seconds else None
     try:
-        import importlib
-        importlib.import_module(library)
-    except ImportError:
-        print(Fore.RED + f"Installing {library}..." + Style.RESET_ALL)
-        subprocess.run([sys.executable, '-m', 'pip', 'install', library], check=True)
-        print(Fore.GREEN + f"{library} installed successfully." + Style.RESET_ALL)
+        yield
+    finally:
+        _local.deadline = None
+
+@contextlib.contextmanager
+def device_session(session):
+    """Stop every adb call made by this thread once session is cancelled"""
+    _local.session = session
+    try:
+        yield
+    finally:
+        _local.session = None
+
+def run_adb(args, serial=None, timeout=10, input=None, op=None):
+    """Run one adb command on the async layer and always return a CompletedProcess (rc 124 on timeout)
+
+    timeout is the starting guess; once an operation has been measured a few times
+    adbasync replaces it with an adaptive one. op defaults to the current install step.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is not None and deadline - time.monotonic() <= 0:
+        raise DeviceTimeout(f"device time budget exhausted before: adb {' '.join(args)}")
+    try:
+        return adbasync.run_sync(args, serial, timeout, input, op or getattr(_local, 'step', None),
+                                 deadline, getattr(_local, 'session', None))
+    except adbasync.Cancelled:
+        raise DeviceCancelled(f"cancelled during: adb {' '.join(args)}")
 
 def check_adb_installed():
     """Check if ADB is installed and available in PATH"""
+    # A running adb server is enough: commands go straight to its socket
+    if adbclient.server_available():
+        return True
     try:
         subprocess.run(['adb', '--version'], capture_output=True, text=True, check=True)
         return True
@@ -26,82 +101,67 @@ def check_adb_installed():
         print(Fore.RED + "ADB is not installed or not in PATH. Please install Android SDK Platform Tools." + Style.RESET_ALL)
         return False
 
+def shell_stdin_supported(serial=None):
+    """True when the device speaks shell v2, the only adb shell protocol that carries stdin"""
+    if adbclient.BACKEND != "subprocess":
+        try:
+            return "shell_v2" in adbclient.get_client().features(serial)
+        except adbclient.AdbServerUnavailable:
+            pass
+    return "shell_v2" in run_adb(['features'], serial, timeout=5).stdout.split()
+
+def get_connected_devices():
+    """Return (serial, state) pairs for every device adb lists"""
+    return adbclient.list_devices()
+
 def check_adb_devices():
-    try:
-        result = subprocess.run(['adb', 'devices'], capture_output=True, text=True, check=True)
-        if "List of devices attached" in result.stdout:
-            devices = [line.strip() for line in result.stdout.split('\n')[1:] if line.strip()]
-            connected_devices = [d for d in devices if not d.endswith('offline') and d != '']
-            
-            if connected_devices:
-                print(Fore.GREEN + "Connected devices:" + Style.RESET_ALL)
-                for device in connected_devices:
-                    parts = device.split('\t')
-                    if len(parts) >= 2:
-                        print(Fore.CYAN + f"  • {parts[0]} ({parts[1]})" + Style.RESET_ALL)
-                return True
-            else:
-                print(Fore.YELLOW + "No active devices found. Please connect your device via USB and enable USB debugging." + Style.RESET_ALL)
-                return False
-        return False
-    except subprocess.CalledProcessError as e:
-        print(Fore.RED + f"Error checking ADB devices: {e}" + Style.RESET_ALL)
-        return False
+    """Print the connected devices and return their serials (empty list if none)"""
+    connected_devices = [d for d in get_connected_devices() if d[1] != 'offline']
+    if connected_devices:
+        print(Fore.GREEN + "Connected devices:" + Style.RESET_ALL)
+        for serial, state in connected_devices:
+            print(Fore.CYAN + f"  • {serial} ({state})" + Style.RESET_ALL)
+        return [serial for serial, state in connected_devices if state == 'device']
+    else:
+        print(Fore.YELLOW + "No active devices found. Please connect your device via USB and enable USB debugging." + Style.RESET_ALL)
+        return []
 
-def check_root_access():
-    """Check if device has root access"""
-    try:
-        result = subprocess.run(['adb', 'shell', 'su', '-c', '"echo root_check"'], 
-                              capture_output=True, text=True, timeout=5, shell=True)
-        if "root_check" in result.stdout:
+def check_root_access(serial=None, profile=None):
+    """Check if device has root access, trying the method that worked last time first"""
+    checks = {
+        'su-c': (['shell', 'su -c "echo root_check"'], "root_check"),
+        # Without su: adbd itself running as root
+        'adb-root': (['shell', 'whoami'], "root")
+    }
+    for method in devprofile.ordered_methods(checks, profile, 'root'):
+        args, expected = checks[method]
+        started = time.monotonic()
+        ok = expected in run_adb(args, serial, timeout=5).stdout
+        note_branch(serial, profile, 'root', method, ok, time.monotonic() - started)
+        if ok:
             return True
-        else:
-            # Try without su
-            result = subprocess.run(['adb', 'shell', 'whoami'], 
-                                  capture_output=True, text=True, timeout=5)
-            return "root" in result.stdout
-    except:
-        return False
+    return False
 
-def remount_system_as_rw():
+def remount_system_as_rw(serial=None, log=print, profile=None):
     """Attempt to remount /system as read-write"""
-    print(Fore.YELLOW + "Attempting to remount /system as read-write..." + Style.RESET_ALL)
-    
-    # Method 1: adb remount
-    try:
-        result = subprocess.run(['adb', 'remount'], capture_output=True, text=True, timeout=10)
+    log(Fore.YELLOW + "Attempting to remount /system as read-write..." + Style.RESET_ALL)
+
+    # Method 1: adb remount, then Method 2: adb shell with su (known failures are skipped)
+    for method in devprofile.ordered_methods(['adb remount'] + REMOUNT_COMMANDS, profile, 'remount'):
+        started = time.monotonic()
+        if method == 'adb remount':
+            result = run_adb(['remount'], serial, timeout=10)
+        else:
+            result = run_adb(['shell', f'su -c "{method}"'], serial, timeout=10)
+        note_branch(serial, profile, 'remount', method, result.returncode == 0, time.monotonic() - started)
         if result.returncode == 0:
-            print(Fore.GREEN + "Successfully remounted /system using 'adb remount'" + Style.RESET_ALL)
+            if method == 'adb remount':
+                log(Fore.GREEN + "Successfully remounted /system using 'adb remount'" + Style.RESET_ALL)
+            else:
+                log(Fore.GREEN + f"Successfully remounted /system using: {method}" + Style.RESET_ALL)
             return True
-    except:
-        pass
-    
-    # Method 2: Using adb shell with su
-    try:
-        commands = [
-            'mount -o rw,remount /system',
-            'mount -o rw,remount /',
-            'mount -o remount,rw /system'
-        ]
-        
-        for cmd in commands:
-            try:
-                result = subprocess.run(f'adb shell su -c "{cmd}"', 
-                                      capture_output=True, text=True, timeout=10, shell=True)
-                if result.returncode == 0:
-                    print(Fore.GREEN + f"Successfully remounted /system using: {cmd}" + Style.RESET_ALL)
-                    return True
-            except:
-                # Try without shell=True
-                result = subprocess.run(['adb', 'shell', 'su', '-c', cmd], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    print(Fore.GREEN + f"Successfully remounted /system using: {cmd}" + Style.RESET_ALL)
-                    return True
-    except:
-        pass
-    
-    print(Fore.RED + "Failed to remount /system as read-write" + Style.RESET_ALL)
+
+    log(Fore.RED + "Failed to remount /system as read-write" + Style.RESET_ALL)
     return False
 
 def list_files_with_numbers(files):
@@ -109,35 +169,1063 @@ def list_files_with_numbers(files):
     for i, file in enumerate(files, start=1):
         print(Fore.CYAN + f"{i}. {file}" + Style.RESET_ALL)
 
-def select_file(files):
+def parse_selection(selection, count):
+    """Turn '1,3,5-7' or 'a' into a list of 0-based indexes, or None if invalid"""
+    selection = selection.strip().lower()
+    if selection in ('a', 'all'):
+        return list(range(count))
+    indexes = []
+    for part in selection.replace(' ', '').split(','):
+        first, _, last = part.partition('-')
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start, end = int(first), int(last or first)
+        if not 1 <= start <= end <= count:
+            return None
+        indexes.extend(i - 1 for i in range(start, end + 1) if i - 1 not in indexes)
+    return indexes or None
+
+def select_files(files):
     while True:
-        selection = input(Fore.YELLOW + f"\nEnter the number (1-{len(files)}) of the file to install: " + Style.RESET_ALL)
-        if selection.isdigit() and 1 <= int(selection) <= len(files):
-            return files[int(selection) - 1]
+        selection = input(Fore.YELLOW + f"\nEnter the number(s) of the files to install (e.g. 1,3-{len(files)} or 'a' for all): " + Style.RESET_ALL)
+        indexes = parse_selection(selection, len(files))
+        if indexes:
+            return [files[i] for i in indexes]
         else:
-            print(Fore.RED + f"Invalid selection. Please enter a number between 1 and {len(files)}" + Style.RESET_ALL)
+            print(Fore.RED + f"Invalid selection. Use numbers between 1 and {len(files)}, ranges like 2-4, or 'a'" + Style.RESET_ALL)
 
-def check_system_cacerts_exists():
+def select_device(serials):
+    for i, serial in enumerate(serials, start=1):
+        print(Fore.CYAN + f"{i}. {serial}" + Style.RESET_ALL)
+    while True:
+        selection = input(Fore.YELLOW + f"\nEnter the number (1-{len(serials)}) of the device to use: " + Style.RESET_ALL)
+        if selection.isdigit() and 1 <= int(selection) <= len(serials):
+            return serials[int(selection) - 1]
+        else:
+            print(Fore.RED + f"Invalid selection. Please enter a number between 1 and {len(serials)}" + Style.RESET_ALL)
+
+def check_system_cacerts_exists(serial=None):
     """Check if /system/etc/security/cacerts directory exists"""
+    result = run_adb(['shell', 'ls', CACERTS_DIR], serial, timeout=5)
+    return result.returncode == 0
+
+def note_branch(serial, profile, kind, method, ok, seconds=0.0, remember_failure=True):
+    """Record which fallback branch ran: as a trace event and in the device profile"""
+    adbasync.emit(type='branch', serial=serial, step=getattr(_local, 'step', None), kind=kind,
+                  method=method, ok=ok, seconds=seconds)
+    if ok or remember_failure:
+        devprofile.note_method(profile, kind, method, ok)
+
+@contextlib.contextmanager
+def timed_step(result, name):
+    """Record the wall time of one install step in result['steps']; adb calls inside are tagged with it"""
+    start = time.monotonic()
+    outer, _local.step = getattr(_local, 'step', None), name
     try:
-        result = subprocess.run(['adb', 'shell', 'ls', '/system/etc/security/cacerts'], 
-                              capture_output=True, text=True, timeout=5)
-        return result.returncode == 0
-    except:
+        yield
+    finally:
+        _local.step = outer
+        seconds = time.monotonic() - start
+        result['steps'][name] = result['steps'].get(name, 0.0) + seconds
+        adbasync.emit(type='step', serial=result.get('serial'), step=name, seconds=seconds)
+
+def stream_copy(local_file, system_path, serial=None, log=print, profile=None):
+    """Write a file into the system store with one adb call and check the digest it reads back"""
+    with open(local_file, 'rb') as f:
+        data = f.read()
+    expected = hashlib.sha256(data).hexdigest()
+    if not shell_stdin_supported(serial):
+        # Shell v1: the command would truncate the target and then wait for stdin that never comes
+        log(Fore.YELLOW + "Device has no shell v2, skipping the streaming copy" + Style.RESET_ALL)
         return False
+    for method in devprofile.ordered_methods(STREAM_COMMANDS, profile, 'stream'):
+        started = time.monotonic()
+        streamed = run_adb(['shell', STREAM_COMMANDS[method].format(path=system_path)], serial, timeout=30,
+                           input=data)
+        ok = streamed.returncode == 0 and expected in streamed.stdout.split()
+        note_branch(serial, profile, 'stream', method, ok, time.monotonic() - started)
+        if ok:
+            log(Fore.GREEN + f"✓ Certificate streamed to system ({method}), SHA-256 matches" + Style.RESET_ALL)
+            return True
+    return False
 
-def execute_shell_command(command):
-    """Execute a shell command with proper quoting"""
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
+def copy_from_temp(temp_path, system_path, serial=None, log=print, profile=None):
+    """Copy a pushed file from /data/local/tmp into cacerts, trying several methods"""
+    commands = {
+        # dd handles binary files better
+        'dd': ['shell', f'su -c "dd if={temp_path} of={system_path} 2>/dev/null"'],
+        'cat': ['shell', f'su -c "cat {temp_path} > {system_path}"'],
+        'cp': ['shell', 'cp', temp_path, system_path]
+    }
+    methods = devprofile.ordered_methods(list(commands) + ['script'], profile, 'copy')
+    copy_result = None
+    for index, method in enumerate(methods):
+        started = time.monotonic()
+        if method == 'script':
+            if copy_result is not None:
+                log(Fore.RED + f"Failed to copy file to system: {copy_result.stderr}" + Style.RESET_ALL)
+            ok = copy_with_script(temp_path, system_path, serial, log)
+        else:
+            if index:
+                log(Fore.YELLOW + f"Trying {method} command..." + Style.RESET_ALL)
+            copy_result = run_adb(commands[method], serial)
+            ok = copy_result.returncode == 0
+        # Only successes are remembered: a copy usually fails because the remount did
+        note_branch(serial, profile, 'copy', method, ok, time.monotonic() - started, remember_failure=False)
+        if ok:
+            return True
+    return False
+
+def copy_with_script(temp_path, system_path, serial=None, log=print):
+    """Last-resort copy: run a small script on the device, fed to sh through stdin"""
+    log(Fore.YELLOW + "Trying interactive shell method..." + Style.RESET_ALL)
+    if not shell_stdin_supported(serial):
+        log(Fore.RED + "Device has no shell v2, the script cannot be sent through stdin" + Style.RESET_ALL)
+        return False
+    # No script file to push, chmod and delete: one round trip, nothing shared between parallel runs
+    script = f'''su -c "cat {temp_path} > {system_path}"
+exit
+'''
+    return run_adb(['shell', 'sh -s'], serial, input=script.encode()).returncode == 0
+
+def install_certificate(selected_file, serial=None, log=print, result=None, profile=None):
+    """Run the seven install steps for one .0 file on one device and return a result dict"""
+    name = os.path.basename(selected_file)
+    system_path = f"{CACERTS_DIR}/{name}"
+    # Callers may pass their own dict so partial step timings survive a DeviceTimeout
+    result = result if result is not None else {}
+    result.update({'serial': serial or 'default', 'file': name, 'status': 'failed', 'steps': {}})
+
+    # Step 1: Check root access
+    with timed_step(result, 'root'):
+        log(Fore.YELLOW + "\n[1/7] Checking root access..." + Style.RESET_ALL)
+        if not check_root_access(serial, profile):
+            log(Fore.RED + "Device does not have root access!" + Style.RESET_ALL)
+            log(Fore.YELLOW + "This operation requires root permissions. Continuing anyway..." + Style.RESET_ALL)
+
+    # Step 2: Remount system as read-write FIRST
+    with timed_step(result, 'remount'):
+        log(Fore.YELLOW + "[2/7] Preparing system partition..." + Style.RESET_ALL)
+        if not remount_system_as_rw(serial, log, profile):
+            log(Fore.YELLOW + "Trying to continue without remount..." + Style.RESET_ALL)
+
+    # Step 3: Check if cacerts directory exists
+    with timed_step(result, 'cacerts'):
+        log(Fore.YELLOW + "[3/7] Checking cacerts directory..." + Style.RESET_ALL)
+        if not check_system_cacerts_exists(serial):
+            log(Fore.YELLOW + "Creating cacerts directory..." + Style.RESET_ALL)
+            # Create directory with proper permissions
+            mkdir_result = run_adb(['shell', f"su -c 'mkdir -p {CACERTS_DIR}'"], serial)
+            if mkdir_result.returncode != 0:
+                log(Fore.YELLOW + "Trying alternative method to create directory..." + Style.RESET_ALL)
+                run_adb(['shell', 'mkdir', '-p', CACERTS_DIR], serial)
+
+    # Step 4: Push file directly to system location (alternative method)
+    with timed_step(result, 'push'):
+        log(Fore.YELLOW + "[4/7] Pushing certificate to system..." + Style.RESET_ALL)
+        # Method 1: Try direct push to system (if remount worked)
+        started = time.monotonic()
+        push_direct = run_adb(['push', selected_file, system_path], serial, timeout=30)
+        note_branch(serial, None, 'push', 'direct', push_direct.returncode == 0, time.monotonic() - started)
+
+    streamed = False
+    if push_direct.returncode != 0:
+        log(Fore.YELLOW + "Direct push failed, streaming through a root shell..." + Style.RESET_ALL)
+        # Method 2: pipe the bytes into the target; copy, chmod and checksum in the same call
+        with timed_step(result, 'copy'):
+            streamed = stream_copy(selected_file, system_path, serial, log, profile)
+
+    if push_direct.returncode != 0 and not streamed:
+        log(Fore.YELLOW + "Streaming failed, trying alternative method..." + Style.RESET_ALL)
+
+        # Method 3: Push to temp and copy with proper shell command
+        temp_path = f"/data/local/tmp/{name}"
+        with timed_step(result, 'push'):
+            started = time.monotonic()
+            push_temp = run_adb(['push', selected_file, temp_path], serial, timeout=30)
+            note_branch(serial, None, 'push', 'temp', push_temp.returncode == 0, time.monotonic() - started)
+
+        if push_temp.returncode != 0:
+            log(Fore.RED + f"Failed to push file: {push_temp.stderr}" + Style.RESET_ALL)
+            result['status'] = 'failed: push'
+            return result
+
+        log(Fore.GREEN + f"✓ File pushed to {temp_path}" + Style.RESET_ALL)
+
+        # Step 5: Copy to the system location
+        with timed_step(result, 'copy'):
+            log(Fore.YELLOW + "[5/7] Copying to system location..." + Style.RESET_ALL)
+            copied = copy_from_temp(temp_path, system_path, serial, log, profile)
+            # Clean up temp file
+            run_adb(['shell', 'rm', temp_path], serial)
+        if not copied:
+            log(Fore.RED + "All copy methods failed!" + Style.RESET_ALL)
+            result['status'] = 'failed: copy'
+            return result
+    elif not streamed:
+        log(Fore.GREEN + f"✓ Certificate pushed directly to system" + Style.RESET_ALL)
+
+    if streamed:
+        # The streaming call already set the mode and matched the SHA-256 of what landed
+        log(Fore.GREEN + f"✓ Certificate successfully installed at: {system_path}" + Style.RESET_ALL)
+        result['status'] = 'installed'
+        return result
+
+    # Step 6: Set permissions
+    with timed_step(result, 'chmod'):
+        log(Fore.YELLOW + "[6/7] Setting permissions..." + Style.RESET_ALL)
+        chmod_result = run_adb(['shell', f'su -c "chmod 644 {system_path}"'], serial)
+
+        if chmod_result.returncode == 0:
+            log(Fore.GREEN + "✓ Permissions set correctly" + Style.RESET_ALL)
+        else:
+            # Try without su
+            run_adb(['shell', 'chmod', '644', system_path], serial)
+            log(Fore.YELLOW + "✓ Permissions set (alternative method)" + Style.RESET_ALL)
+
+    # Step 7: Verify file exists
+    with timed_step(result, 'verify'):
+        log(Fore.YELLOW + "[7/7] Verifying installation..." + Style.RESET_ALL)
+        verify_result = run_adb(['shell', 'ls', '-la', system_path], serial)
+
+    if verify_result.returncode == 0 and name in verify_result.stdout:
+        log(Fore.GREEN + f"✓ Certificate successfully installed at: {system_path}" + Style.RESET_ALL)
+        log(Fore.GREEN + f"✓ File details:\n{verify_result.stdout}" + Style.RESET_ALL)
+        result['status'] = 'installed'
+    else:
+        log(Fore.YELLOW + "⚠ Installation completed but verification failed" + Style.RESET_ALL)
+        result['status'] = 'unverified'
+    return result
+
+# Single-round-trip engine: one push of the staged certs plus one generated script
+# that remounts, copies, fixes mode and SELinux context, and verifies on the device.
+# Every line the script prints that starts with "KB " is a status record.
+
+INSTALL_SCRIPT = """#!/system/bin/sh
+# Generated by phssl.py
+S={staging}
+T={target}
+echo "KB ROOT $1"
+RW=none
+if mount | grep -q " $T type tmpfs"; then
+    RW=overlay-reused
+elif touch $T/.kb_rw 2>/dev/null; then
+    rm -f $T/.kb_rw
+    RW=already
+else
+    for m in {mounts}; do
+        if $m 2>/dev/null && mkdir -p $T 2>/dev/null && touch $T/.kb_rw 2>/dev/null; then
+            rm -f $T/.kb_rw
+            RW="$m"
+            break
+        fi
+    done
+fi
+echo "KB REMOUNT $RW"
+mkdir -p $T 2>/dev/null
+{removals}for f in {names}; do
+    if cp $S/$f $T/$f 2>/dev/null; then
+        HOW=cp
+    elif cat $S/$f > $T/$f 2>/dev/null; then
+        HOW=cat
+    else
+        echo "KB FILE $f copy-failed -"
+        continue
+    fi
+    chmod 644 $T/$f
+    chown root:root $T/$f 2>/dev/null
+    restorecon $T/$f >/dev/null 2>&1 || chcon u:object_r:system_file:s0 $T/$f >/dev/null 2>&1
+    if cmp -s $S/$f $T/$f; then
+        echo "KB FILE $f ok $HOW"
+    else
+        echo "KB FILE $f verify-failed $HOW"
+    fi
+done
+rm -rf $S
+echo "KB DONE"
+exit 0
+"""
+
+# Removes old certs before the new ones are copied, so a rotation can reuse a <hash>.N name
+REMOVE_SNIPPET = """for f in {remove}; do
+    rm -f $T/$f
+    if [ -e $T/$f ]; then
+        echo "KB GONE $f failed"
+    else
+        echo "KB GONE $f ok"
+    fi
+done
+"""
+
+# Runs the script as root whichever way the device allows it
+SCRIPT_LAUNCHER = ('S={script}; if [ "$(id -u)" = 0 ]; then sh $S adb-root; '
+                   '{branches}'
+                   'else echo "KB ROOT none"; rm -rf {staging}; fi')
+
+ROOT_BRANCHES = {
+    'su-c': 'elif su -c "sh $S su-c" 2>/dev/null; then :; ',
+    'su-0': 'elif su 0 sh $S su-0 2>/dev/null; then :; '
+}
+
+# Lists init, zygote and every app zygote forked, and reports per mount namespace whether
+# the new certs are visible there, and removed ones gone ("KB NS <pid> ok|failed core|app")
+NAMESPACE_CHECK = """Z=$(pidof zygote zygote64)
+APPS=""
+for z in $Z; do
+    APPS="$APPS $(ps -o PID -P $z | grep -v PID)"
+done
+for P in 1 $Z $APPS; do
+    KIND=app
+    for c in 1 $Z; do
+        [ "$P" = "$c" ] && KIND=core
+    done
+    N="nsenter --mount=/proc/$P/ns/mnt --"
+    {bind}if {visible}; then
+        echo "KB NS $P ok $KIND"
+    else
+        echo "KB NS $P failed $KIND"
+    fi
+done
+"""
+
+# Runtime overlay, no reboot needed: the script copies the current store plus the new certs
+# onto a tmpfs over /system/etc/security/cacerts. On Android 14+ the APEX store can't be
+# remounted at all, so the tmpfs is also bind-mounted over the APEX path in init's, zygote's
+# and every running app's mount namespace. Older devices with a read-only /system use the
+# same overlay (live mode). It is gone after the next reboot.
+OVERLAY_SCRIPT = """#!/system/bin/sh
+# Generated by phssl.py
+S={staging}
+T={target}
+A={apex}
+echo "KB ROOT $1"
+if mount | grep -q " $T type tmpfs"; then
+    echo "KB REMOUNT overlay-reused"
+else
+    mkdir -p $S/store
+    cp $A/* $S/store/ 2>/dev/null
+    if ! mount -t tmpfs tmpfs $T; then
+        echo "KB REMOUNT none"
+        rm -rf $S
+        echo "KB DONE"
+        exit 0
+    fi
+    cp $S/store/* $T/ 2>/dev/null
+    echo "KB REMOUNT overlay"
+fi
+chmod 755 $T
+chcon u:object_r:system_file:s0 $T 2>/dev/null
+{removals}for f in {names}; do
+    if cp $S/$f $T/$f 2>/dev/null; then
+        chmod 644 $T/$f
+        chown root:root $T/$f 2>/dev/null
+        chcon u:object_r:system_file:s0 $T/$f 2>/dev/null
+    else
+        echo "KB FILE $f copy-failed -"
+    fi
+done
+{namespaces}for f in {names}; do
+    if nsenter --mount=/proc/1/ns/mnt -- cmp -s $S/$f $A/$f; then
+        echo "KB FILE $f ok overlay"
+    elif [ -f $T/$f ]; then
+        echo "KB FILE $f verify-failed overlay"
+    fi
+done
+rm -rf $S
+echo "KB DONE"
+exit 0
+"""
+
+def namespace_check(names, store='system', bind=False, remove=()):
+    """Render NAMESPACE_CHECK for some .0 names (and removed ones); bind=True first bind-mounts the overlay where needed"""
+    directory = trust_store_dir(store)
+    tests = [f"$N ls {' '.join(f'{directory}/{name}' for name in names)} >/dev/null 2>&1"] if names else ["true"]
+    tests += [f"! $N ls {directory}/{name} >/dev/null 2>&1" for name in remove]
+    visible = " && ".join(tests)
+    mount = f"{visible} || $N mount --bind $T $A 2>/dev/null\n    " if bind else ""
+    return NAMESPACE_CHECK.format(visible=visible, bind=mount)
+
+def build_install_script(names, staging, target=CACERTS_DIR, profile=None, overlay=False, remove=()):
+    """Render the on-device install script for a set of .0 file names, first removing the names in remove"""
+    store = (profile or {}).get('store', 'system')
+    removals = REMOVE_SNIPPET.format(remove=" ".join(remove)) if remove else ""
+    if overlay or store == 'apex':
+        return OVERLAY_SCRIPT.format(staging=staging, target=target, apex=trust_store_dir(store), removals=removals,
+                                     names=" ".join(names),
+                                     namespaces=namespace_check(names, store, store == 'apex', remove))
+    mounts = " ".join(f'"{m}"' for m in devprofile.ordered_methods(REMOUNT_COMMANDS, profile, 'remount'))
+    return INSTALL_SCRIPT.format(staging=staging, target=target, names=" ".join(names), mounts=mounts,
+                                 removals=removals)
+
+def build_launcher(script, staging, profile=None):
+    """Render the one-liner that starts the install script as root"""
+    branches = "".join(ROOT_BRANCHES[m] for m in devprofile.ordered_methods(ROOT_BRANCHES, profile, 'root'))
+    return SCRIPT_LAUNCHER.format(script=script, staging=staging, branches=branches)
+
+def parse_script_output(output):
+    """Turn the script's "KB ..." lines into a dict"""
+    report = {'root': None, 'remount': None, 'files': {}, 'methods': {}, 'removed': {}, 'namespaces': {},
+              'core_failed': [], 'app_failed': [], 'done': False}
+    for line in output.splitlines():
+        parts = line.strip().split(' ', 2)
+        if len(parts) < 2 or parts[0] != 'KB':
+            continue
+        if parts[1] == 'ROOT' and len(parts) == 3:
+            report['root'] = parts[2]
+        elif parts[1] == 'REMOUNT' and len(parts) == 3:
+            report['remount'] = parts[2]
+        elif parts[1] == 'FILE' and len(parts) == 3:
+            fields = parts[2].split()
+            if len(fields) == 3:
+                report['files'][fields[0]] = 'installed' if fields[1] == 'ok' else f'failed: {fields[1]}'
+                report['methods'][fields[0]] = fields[2]
+        elif parts[1] == 'GONE' and len(parts) == 3:
+            fields = parts[2].split()
+            if len(fields) == 2:
+                report['removed'][fields[0]] = 'removed' if fields[1] == 'ok' else 'failed: remove'
+        elif parts[1] == 'NS' and len(parts) == 3:
+            fields = parts[2].split()
+            if len(fields) == 3:
+                report['namespaces'][fields[0]] = fields[1]
+                if fields[1] != 'ok':
+                    report['core_failed' if fields[2] == 'core' else 'app_failed'].append(fields[0])
+        elif parts[1] == 'DONE':
+            report['done'] = True
+    return report
+
+def build_payload_tar(files, script_text):
+    """Pack the .0 files and the install script into an in-memory tar archive"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        for file in files:
+            tar.add(file, arcname=os.path.basename(file))
+        data = script_text.encode()
+        info = tarfile.TarInfo('install.sh')
+        info.size = len(data)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def install_with_script(files, serial=None, log=print, result=None, transfer='sync', profile=None, overlay=False,
+                        remove=()):
+    """Install files with one transfer and one script run; returns a result dict
+
+    transfer='sync' pushes a staging directory over one sync session, then runs the script.
+    transfer='tar' streams a tar archive into the shell's stdin, so transfer, unpack and
+    install all happen in a single adb shell call; devices without shell v2 (no stdin)
+    get the sync push instead. overlay=True installs onto a tmpfs
+    overlay instead of remounting /system (always the case for the APEX store). Names in
+    remove are deleted from the store in the same run, before the new files are copied.
+    """
+    names = [os.path.basename(file) for file in files]
+    result = result if result is not None else {}
+    result.update({'serial': serial or 'default', 'file': ", ".join(names), 'engine': 'script',
+                   'store': (profile or {}).get('store', 'system'), 'status': 'failed', 'steps': {}, 'files': {}})
+    result['overlay'] = overlay or result['store'] == 'apex'
+    staging = f"/data/local/tmp/kalla_billa_{secrets.token_hex(4)}"
+    script_text = build_install_script(names, staging, profile=profile, overlay=overlay, remove=remove)
+    launcher = build_launcher(f"{staging}/install.sh", staging, profile)
+
+    if transfer == 'tar' and not shell_stdin_supported(serial):
+        transfer = 'sync'
+    result['transfer'] = transfer
+    if transfer == 'tar':
+        payload = build_payload_tar(files, script_text)
+        with timed_step(result, 'script'):
+            log(Fore.YELLOW + f"[1/1] Streaming {len(names)} certificate(s) and running install script..." + Style.RESET_ALL)
+            command = f"mkdir -p {staging} && tar -xf - -C {staging} && {launcher}"
+            run = run_adb(['shell', command], serial, timeout=60, input=payload)
+    else:
+        with tempfile.TemporaryDirectory() as local_root:
+            local_dir = os.path.join(local_root, os.path.basename(staging))
+            os.mkdir(local_dir)
+            for file in files:
+                shutil.copyfile(file, os.path.join(local_dir, os.path.basename(file)))
+            with open(os.path.join(local_dir, 'install.sh'), 'w', newline='\n') as f:
+                f.write(script_text)
+
+            with timed_step(result, 'push'):
+                log(Fore.YELLOW + f"[1/2] Pushing {len(names)} certificate(s) and install script..." + Style.RESET_ALL)
+                push = run_adb(['push', local_dir, '/data/local/tmp/'], serial, timeout=30)
+            if push.returncode != 0:
+                log(Fore.RED + f"Failed to push payload: {push.stderr.strip()}" + Style.RESET_ALL)
+                return result
+
+        with timed_step(result, 'script'):
+            log(Fore.YELLOW + "[2/2] Running install script on device..." + Style.RESET_ALL)
+            run = run_adb(['shell', launcher], serial, timeout=60)
+    report = parse_script_output(run.stdout)
+    if report['core_failed']:
+        # Without init's or zygote's namespace, conscrypt (and every new app) keeps the old store
+        for done in (report['files'], report['removed']):
+            for name in done:
+                if done[name] in ('installed', 'removed'):
+                    done[name] = 'failed: namespace'
+    result.update({'root': report['root'], 'remount': report['remount'], 'methods': report['methods'],
+                   'files': report['files'], 'removed': report['removed'], 'namespaces': report['namespaces']})
+    # An overlay from an earlier live install is writable but still gone after a reboot
+    result['overlay'] = result['overlay'] or report['remount'] == 'overlay-reused'
+    note_script_methods(serial, profile, report)
+
+    if not report['done']:
+        log(Fore.RED + f"Install script did not complete (root: {report['root'] or 'unknown'})" + Style.RESET_ALL)
         return result
-    except subprocess.TimeoutExpired:
-        return subprocess.CompletedProcess(command, 1, "", "Command timed out")
+    where = "overlay" if result['overlay'] else "/system writable"
+    log(Fore.GREEN + f"✓ Root via {report['root']}, {where}: {report['remount']}" + Style.RESET_ALL)
+    if report['namespaces']:
+        visible = sum(1 for status in report['namespaces'].values() if status == 'ok')
+        color = Fore.GREEN if visible == len(report['namespaces']) else Fore.YELLOW
+        log(color + f"✓ Overlay visible in {visible}/{len(report['namespaces'])} mount namespace(s)"
+            + Style.RESET_ALL)
+    for name in remove:
+        status = report['removed'].get(name, 'failed: remove')
+        log((Fore.GREEN + "✓" if status == 'removed' else Fore.RED + "✗") + f" {name}: {status}" + Style.RESET_ALL)
+    for name in names:
+        status = report['files'].get(name, 'failed: missing')
+        color = Fore.GREEN + "✓" if status == 'installed' else Fore.RED + "✗"
+        log(color + f" {name}: {status}" + Style.RESET_ALL)
+    if (all(report['files'].get(name) == 'installed' for name in names)
+            and all(report['removed'].get(name) == 'removed' for name in remove)):
+        result['status'] = 'installed'
+    return result
+
+def note_script_methods(serial, profile, report):
+    """Copy the root, remount and copy outcomes reported by the install script into the trace and profile"""
+    if report['root'] == 'none':
+        for method in ROOT_BRANCHES:
+            note_branch(serial, profile, 'root', method, False)
+    elif report['root']:
+        note_branch(serial, profile, 'root', report['root'], True)
+    if report['remount'] in REMOUNT_COMMANDS:
+        note_branch(serial, profile, 'remount', report['remount'], True)
+    elif report['remount'] in ('overlay', 'overlay-reused'):
+        adbasync.emit(type='branch', serial=serial, step='script', kind='store',
+                      method=f"{(profile or {}).get('store', 'system')} {report['remount']}",
+                      ok=not report['core_failed'], seconds=0.0)
+    elif report['remount'] == 'none' and (profile or {}).get('store') != 'apex':
+        for method in devprofile.ordered_methods(REMOUNT_COMMANDS, profile, 'remount'):
+            note_branch(serial, profile, 'remount', method, False)
+    for name, how in report['methods'].items():
+        if how != '-':
+            adbasync.emit(type='branch', serial=serial, step='script', kind='copy', method=f'script {how}',
+                          ok=report['files'].get(name) == 'installed', seconds=0.0)
+
+def trust_store_dir(store):
+    """Directory the device's conscrypt reads CA certs from"""
+    return APEX_CACERTS_DIR if store == 'apex' else CACERTS_DIR
+
+def get_profiles():
+    global profiles
+    if profiles is None:
+        profiles = devprofile.DeviceProfiles()
+    return profiles
+
+def detect_store(sdk, has_apex):
+    """Which trust store the device reads: 'apex' on Android 14+ with a conscrypt APEX, else 'system'"""
+    return 'apex' if has_apex and sdk.isdigit() and int(sdk) >= 34 else 'system'
+
+def load_profile(serial, reprobe=False, known=None):
+    """Return (profile, fingerprint) for a device; the profile is empty when unknown, expired or reprobing
+
+    The same adb call detects the trust store, so APEX devices go straight to the overlay script.
+    known is a fresh {'store': <cacerts dir>, 'build': <fingerprint>} from an inventory probe
+    (provisiond keeps one per device); with it no adb call is made.
+    """
+    if not serial:
+        return None, None
+    if known:
+        fingerprint, android, sdk = known['build'], None, None
+        store = 'apex' if known['store'] == APEX_CACERTS_DIR else 'system'
+    else:
+        props = run_adb(['shell', 'getprop ro.build.fingerprint; getprop ro.build.version.release; '
+                                  f'getprop ro.build.version.sdk; [ -d {APEX_CACERTS_DIR} ] && echo apex'],
+                        serial, timeout=5, op='profile').stdout.split('\n')
+        props += [''] * (4 - len(props))
+        fingerprint, android, sdk = (value.strip() for value in props[:3])
+        store = detect_store(sdk, props[3].strip() == 'apex')
+    adbasync.emit(type='device', serial=serial, fingerprint=fingerprint, android=android, sdk=sdk, store=store)
+    profile = {} if reprobe else get_profiles().lookup(serial, fingerprint)
+    if not profile:
+        profile['probed'] = time.time()
+    profile['store'] = store
+    return profile, fingerprint
+
+def store_digests(serial, names, store='system', siblings=False):
+    """sha256 of the named files already in the trust store, in one adb call; missing files are left out
+
+    siblings=True reads every <hash>.N sharing a subject hash with one of the names instead.
+    """
+    if siblings:
+        names = {name.split('.')[0] for name in names}
+        paths = " ".join(f"{trust_store_dir(store)}/{name}.*" for name in sorted(names))
+    else:
+        paths = " ".join(f"{trust_store_dir(store)}/{name}" for name in names)
+    run = run_adb(['shell', f"sha256sum {paths} 2>/dev/null"], serial, timeout=10, op='diff')
+    digests = {}
+    for line in run.stdout.splitlines():
+        parts = line.split()
+        name = os.path.basename(parts[-1]) if len(parts) == 2 else None
+        if name and (name.split('.')[0] if siblings else name) in names:
+            digests[name] = parts[0].lower()
+    return digests
+
+def diff_store(files, serial=None, store='system', log=print, result=None, freed=(), listing=None):
+    """Return the files with no identical copy among the device's <hash>.* files
+
+    Identical files are recorded as installed in result (engine 'diff'), so a re-run over an
+    already provisioned device pushes, remounts and reboots nothing. A certificate that sits
+    in the store as <hash>.1 (another CA with the same subject hash took .0) counts as present.
+    A changed file whose name another CA holds gets the lowest free <hash>.N instead, as
+    rotate.plan_device picks it; names in freed are about to be removed and count as free.
+    result['names'] maps each file stored or to be stored under another name to that name.
+    With a fresh listing of the store's names that has no <hash>.* of any file, nothing can
+    match and the sha256sum call is skipped.
+    """
+    result = result if result is not None else {}
+    result.update({'serial': serial or 'default', 'engine': 'diff', 'store': store, 'status': 'installed',
+                   'steps': {}, 'files': {}, 'names': {}})
+    subjects = {os.path.basename(file).split('.')[0] for file in files}
+    with timed_step(result, 'diff'):
+        if listing is not None and not any(name.split('.')[0] in subjects for name in listing):
+            present = {}
+        else:
+            present = store_digests(serial, [os.path.basename(file) for file in files], store, siblings=True)
+    taken = (set(present) - set(freed)) | {os.path.basename(file) for file in files}
+    changed = []
+    for file in files:
+        name = os.path.basename(file)
+        with open(file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        subject = name.split('.')[0]
+        same = sorted(other for other, found in present.items() if found == digest and other.split('.')[0] == subject)
+        if same:
+            result['files'][name] = 'installed'
+            if name not in same:
+                result['names'][name] = same[0]
+            where = "" if name in same else f" as {same[0]}"
+            log(Fore.GREEN + f"✓ {name}: already installed{where}, unchanged" + Style.RESET_ALL)
+        else:
+            if name in present and name not in freed:
+                # Another CA with the same subject hash: overwriting it would silently untrust it
+                result['names'][name] = next(f"{subject}.{n}" for n in range(len(taken) + 1)
+                                             if f"{subject}.{n}" not in taken)
+                taken.add(result['names'][name])
+                log(Fore.YELLOW + f"{name} holds another certificate, installing as {result['names'][name]}"
+                    + Style.RESET_ALL)
+            changed.append(file)
+    note_branch(serial, None, 'engine', 'diff', not changed, result['steps']['diff'])
+    return changed
+
+def stage_renamed(files, names, work):
+    """Copies of the files diff_store moved to another <hash>.N, named as they go on the device"""
+    staged = []
+    for file in files:
+        name = names.get(os.path.basename(file))
+        if name:
+            staged.append(os.path.join(work, name))
+            shutil.copyfile(file, staged[-1])
+        else:
+            staged.append(file)
+    return staged
+
+def device_names(runs):
+    """{local name: name in the store} for the files installed or found under another <hash>.N"""
+    names = {}
+    for result in runs:
+        names.update(result.get('names', {}))
+    return names
+
+def install_files(files, serial=None, log=print, engine='script', runs=None, transfer='sync', reprobe=False,
+                  live=False, remove=(), known=None):
+    """Install files on one device, falling back to the step-by-step path for files the script missed
+
+    With live=True a read-only /system gets the tmpfs overlay instead of the step-by-step
+    fallback: trusted at once, but only until the next reboot. Files already in the store
+    with the same sha256 are skipped, and a file whose <hash>.0 holds another CA goes in as
+    the next free <hash>.N (see device_names). Names in remove are deleted by the same
+    script run (script engine only). known is a fresh inventory probe of the device
+    ('store', 'build', 'cacerts'): it replaces the profile's getprop call, and its listing
+    lets the diff skip devices that have none of the subject hashes.
+    """
+    runs = runs if runs is not None else []
+    start = time.monotonic()
+    profile, fingerprint = load_profile(serial, reprobe, known)
+    if profile and profile.get('root'):
+        log(Fore.CYAN + f"Using stored profile: root via {profile['root']}, "
+            f"remount via {profile.get('remount', 'unknown')}, copy via {profile.get('copy', 'unknown')}" + Style.RESET_ALL)
+    apex = bool(profile) and profile.get('store') == 'apex'
+    if apex:
+        # Remount and copy into /system would all "work" and change nothing conscrypt reads
+        log(Fore.CYAN + f"Android 14+ trust store in {APEX_CACERTS_DIR}: installing through a tmpfs overlay"
+            + Style.RESET_ALL)
+        engine = 'script'
+    if remove:
+        engine = 'script'
+    work = tempfile.mkdtemp(prefix='kalla_billa_')
+    try:
+        result = {'root': (profile or {}).get('root')}
+        runs.append(result)
+        pending = diff_store(files, serial, (profile or {}).get('store', 'system'), log, result, freed=remove,
+                             listing=None if known is None else known['cacerts'])
+        pending = stage_renamed(pending, result['names'], work)
+        removing = list(remove)
+        if engine == 'script' and (pending or removing):
+            result = {}
+            runs.append(result)
+            install_with_script(pending, serial, log, result, transfer, profile, remove=removing)
+            pending = [file for file in pending if result['files'].get(os.path.basename(file)) != 'installed']
+            removing = [name for name in removing if result['removed'].get(name) != 'removed']
+            note_branch(serial, None, 'engine', 'script', not pending and not removing, sum(result['steps'].values()))
+            if (pending or removing) and live and not apex and result.get('remount') == 'none':
+                log(Fore.YELLOW + "/system is read-only: installing through a tmpfs overlay (lost on reboot)..."
+                    + Style.RESET_ALL)
+                result = {}
+                runs.append(result)
+                install_with_script(pending, serial, log, result, transfer, profile, overlay=True, remove=removing)
+                pending = [file for file in pending if result['files'].get(os.path.basename(file)) != 'installed']
+                removing = [name for name in removing if result['removed'].get(name) != 'removed']
+                note_branch(serial, None, 'engine', 'overlay', not pending and not removing,
+                            sum(result['steps'].values()))
+            if pending and apex:
+                log(Fore.RED + "The step-by-step fallback cannot reach the APEX store; not retrying" + Style.RESET_ALL)
+                pending = []
+            elif pending:
+                log(Fore.YELLOW + "Falling back to step-by-step install..." + Style.RESET_ALL)
+        for selected_file in pending:
+            result = {}
+            runs.append(result)
+            install_certificate(selected_file, serial, log, result, profile)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        # Saved even after a DeviceTimeout so the next run skips what already failed
+        if profile is not None:
+            get_profiles().record(serial, fingerprint, profile)
+        statuses = file_statuses(runs)
+        adbasync.emit(type='install', serial=serial, engine=engine, files=statuses,
+                      status='installed' if statuses and all(v == 'installed' for v in statuses.values()) else 'failed',
+                      seconds=time.monotonic() - start)
+    return runs
+
+def removal_statuses(runs):
+    """Final status per removed name across script runs"""
+    statuses = {}
+    for result in runs:
+        statuses.update(result.get('removed', {}))
+    return statuses
+
+def file_statuses(runs):
+    """Final status per file name across script and step-by-step runs"""
+    statuses = {}
+    for result in runs:
+        if 'files' in result:
+            statuses.update(result['files'])
+        elif 'file' in result:
+            statuses[result['file']] = result['status']
+    return statuses
+
+def install_facts(runs):
+    """(store, overlay, root method) as reported by a device's install runs"""
+    store = next((result['store'] for result in runs if result.get('store')), 'system')
+    overlay = any(result.get('overlay') and result.get('files') for result in runs)
+    root = next((result['root'] for result in runs if result.get('root') not in (None, 'none')), None)
+    return store, overlay, root
+
+def as_root(command, root=None):
+    """Wrap a shell command (no single quotes inside) so it runs as root the way this device allows"""
+    if root == 'adb-root':
+        return command
+    if root == 'su-0':
+        return f"su 0 sh -c '{command}'"
+    return f"su -c '{command}'"
+
+def check_trust(serial, names, store='system', root=None):
+    """Readiness check: can init, zygote and every running app see the new certs in their mount namespace?
+
+    Returns {'trusted', 'namespaces', 'app_failed'}. Without root (no nsenter) it falls
+    back to listing the store as the shell user.
+    """
+    run = run_adb(['shell', as_root(namespace_check(names, store), root)], serial, timeout=15, op='trust')
+    report = parse_script_output(run.stdout)
+    if not report['namespaces']:
+        listing = run_adb(['shell', 'ls ' + " ".join(f"{trust_store_dir(store)}/{name}" for name in names)],
+                          serial, timeout=5, op='trust')
+        return {'trusted': listing.returncode == 0, 'namespaces': {}, 'app_failed': [], 'method': 'listing'}
+    return {'trusted': not report['core_failed'] and not report['app_failed'], 'namespaces': report['namespaces'],
+            'app_failed': report['app_failed'], 'method': 'namespaces'}
+
+def restart_processes(serial, pids, packages=(), root=None):
+    """Kill app processes that can't see the new certs and force-stop packages; zygote relaunches them"""
+    commands = [f"kill {pid}" for pid in pids] + [f"am force-stop {package}" for package in packages]
+    if commands:
+        run_adb(['shell', as_root("; ".join(commands), root)], serial, timeout=15, op='restart')
+
+def apply_live(serial, names, store='system', root=None, packages=(), log=print):
+    """Reboot-free finish: check trust, restart what can't see the certs (plus packages), check again"""
+    trust = check_trust(serial, names, store, root)
+    if trust['app_failed'] or packages:
+        restarted = trust['app_failed'] + list(packages)
+        log(Fore.YELLOW + f"Restarting {len(restarted)} process(es) that hold the old trust store..." + Style.RESET_ALL)
+        restart_processes(serial, trust['app_failed'], packages, root)
+        trust = dict(check_trust(serial, names, store, root), restarted=restarted)
+    return trust
 
-def main():
+def reboot_and_wait(serial, timeout=180, poll=0.5):
+    """Reboot, then wait-for-device and poll sys.boot_completed; returns the seconds taken, or None on timeout"""
+    start = time.monotonic()
+    boot_id = run_adb(['shell', f'cat {BOOT_ID}'], serial, timeout=5, op='boot').stdout.strip()
+    if run_adb(['reboot'], serial, timeout=10).returncode != 0:
+        return None
+    while time.monotonic() - start < timeout:
+        left = timeout - (time.monotonic() - start)
+        if run_adb(['wait-for-device'], serial, timeout=left, op='wait-for-device').returncode == 0:
+            state = run_adb(['shell', f'cat {BOOT_ID}; getprop sys.boot_completed'], serial, timeout=5,
+                            op='boot').stdout.split()
+            # The old boot can still answer for a moment after 'adb reboot'
+            if len(state) == 2 and state[0] != boot_id and state[1] == '1':
+                return time.monotonic() - start
+        time.sleep(poll)
+    return None
+
+def reboot_fleet(serials, workers=8, timeout=180):
+    """Reboot devices and wait for all of them to finish booting at once; returns {serial: seconds or None}"""
+    def one(serial):
+        with device_deadline(timeout):
+            try:
+                return reboot_and_wait(serial, timeout)
+            except DeviceTimeout:
+                return None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(serials, pool.map(one, serials)))
+
+# Step columns shown in the fleet results table
+FLEET_STEPS = ['diff', 'push', 'script', 'root', 'remount', 'cacerts', 'copy', 'chmod', 'verify']
+
+def install_on_device(serial, files, timeout=None, reboot='never', engine='script', transfer='sync', reprobe=False,
+                      session=None, live=False, restart=(), boot_timeout=180, known=None):
+    """Install every file on one device within an overall time budget (fleet worker)
+
+    live=True finishes without a reboot: overlay for a read-only /system, restart of the
+    processes that can't see the certs, and a trust readiness check. reboot is 'never',
+    'always' or 'auto' (only when the certs are not trusted yet). A reboot gets its own
+    boot_timeout budget and is skipped for overlay installs, which it would undo, and
+    when every file was already on the device. known is passed on to install_files.
+    """
+    start = time.monotonic()
+    summary = {'serial': serial, 'status': 'installed', 'store': 'system', 'steps': {}, 'runs': []}
+    names = [os.path.basename(file) for file in files]
+    quiet = lambda message: None
+    _local.session = session
+    try:
+        with device_deadline(timeout):
+            install_files(files, serial, log=quiet, engine=engine, runs=summary['runs'],
+                          transfer=transfer, reprobe=reprobe, live=live, known=known)
+            # A file can be on the device under another <hash>.N than its local name
+            placed = device_names(summary['runs'])
+            summary['names'] = {name: placed.get(name, name) for name in names}
+            names = list(summary['names'].values())
+            statuses = file_statuses(summary['runs'])
+            installed = len(statuses) >= len(files) and all(s == 'installed' for s in statuses.values())
+            store, overlay, root = install_facts(summary['runs'])
+            # Nothing pushed: no remount happened, so there is nothing a reboot could pick up
+            unchanged = all(result.get('engine') == 'diff' for result in summary['runs'])
+            if installed and live:
+                summary['trust'] = apply_live(serial, names, store, root, restart, log=quiet)
+        trusted = summary.get('trust', {}).get('trusted')
+        if installed and (reboot == 'always' or (reboot == 'auto' and trusted is not True)):
+            if unchanged:
+                summary['reboot'] = 'skipped: unchanged'
+            elif overlay:
+                summary['reboot'] = 'skipped: overlay'
+            else:
+                with device_deadline(boot_timeout):
+                    summary['boot_seconds'] = reboot_and_wait(serial, boot_timeout)
+                summary['reboot'] = 'timeout' if summary['boot_seconds'] is None else 'done'
+                if summary['reboot'] == 'done':
+                    with device_deadline(timeout):
+                        summary['trust'] = check_trust(serial, names, store, root)
+    except DeviceTimeout:
+        summary['status'] = 'timeout'
+    except DeviceCancelled:
+        summary['status'] = 'cancelled'
+    except Exception as e:
+        summary['status'] = f'error: {e}'
+    finally:
+        _local.session = None
+    if summary['status'] == 'installed':
+        statuses = file_statuses(summary['runs'])
+        failed = [status for status in statuses.values() if status != 'installed']
+        if failed or len(statuses) < len(files):
+            summary['status'] = failed[0] if failed else 'failed'
+        elif summary.get('reboot') == 'timeout':
+            summary['status'] = 'boot timeout'
+        elif summary.get('trust', {}).get('trusted') is False:
+            summary['status'] = 'untrusted'
+        elif summary.get('reboot') == 'done':
+            summary['status'] = 'installed, rebooted'
+        elif all(result.get('engine') == 'diff' for result in summary['runs']):
+            summary['status'] = 'installed, unchanged'
+        elif 'trust' in summary:
+            summary['status'] = 'installed, live'
+    for result in summary['runs']:
+        summary['store'] = result.get('store', summary['store'])
+        for step, seconds in result.get('steps', {}).items():
+            summary['steps'][step] = summary['steps'].get(step, 0.0) + seconds
+    summary['total'] = time.monotonic() - start
+    return summary
+
+def install_on_fleet(files, serials, workers=8, timeout=120, reboot='never', on_result=None, engine='script',
+                     transfer='sync', reprobe=False, live=False, restart=(), boot_timeout=180, emulators=True,
+                     load_snapshot='auto'):
+    """Install files on every serial at once using a bounded worker pool
+
+    Workers drive the install steps; their adb I/O runs on the shared adbasync event loop.
+    Ctrl+C cancels every device's session, so in-flight adb calls stop at once. With
+    emulators, emulator serials take the snapshot fast path in emulator.py (load_snapshot
+    is passed through to it).
+    """
+    # emulator.py builds on this module, so it is imported only here
+    import emulator
+    worker = install_on_device
+    if emulators:
+        worker = lambda *args: emulator.install_on_emulator(*args, load_snapshot=load_snapshot)
+    results = []
+    sessions = {serial: adbasync.Session(serial) for serial in serials}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(worker, serial, files, timeout, reboot, engine, transfer, reprobe,
+                               sessions[serial], live, restart, boot_timeout)
+                   for serial in serials]
+        pending = set(futures)
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                pending.discard(future)
+                results.append(future.result())
+                if on_result:
+                    on_result(results[-1])
+        except KeyboardInterrupt:
+            print(Fore.RED + "\nCancelling..." + Style.RESET_ALL)
+            for session in sessions.values():
+                session.cancel()
+            for future in pending:
+                results.append(future.result())
+                if on_result:
+                    on_result(results[-1])
+    results.sort(key=lambda summary: summary['serial'])
+    return results
+
+def print_fleet_table(results):
+    """Print per-device status and step timings"""
+    header = f"{'SERIAL':<24}{'STATUS':<24}" + "".join(f"{step:>9}" for step in FLEET_STEPS) + f"{'TOTAL':>9}"
+    print(Fore.YELLOW + "\n" + header + Style.RESET_ALL)
+    print(Fore.YELLOW + "-" * len(header) + Style.RESET_ALL)
+    for summary in results:
+        color = Fore.GREEN if summary['status'].startswith('installed') else Fore.RED
+        cells = "".join(f"{summary['steps'][step]:>8.2f}s" if step in summary['steps'] else f"{'-':>9}"
+                        for step in FLEET_STEPS)
+        print(color + f"{summary['serial']:<24}{summary['status'][:23]:<24}" + Style.RESET_ALL
+              + cells + f"{summary['total']:>8.2f}s")
+    ok = sum(1 for summary in results if summary['status'].startswith('installed'))
+    print(Fore.CYAN + f"\n{ok}/{len(results)} device(s) installed" + Style.RESET_ALL)
+
+def fleet_main(args, tracer=None):
+    """Non-interactive fleet mode: install the chosen .0 file(s) on every connected device"""
+    if not check_adb_installed():
+        return 2
+    files = args.files or sorted(file for file in os.listdir() if file.endswith(".0"))
+    if not files:
+        print(Fore.RED + "No .0 certificate files given or found in current directory." + Style.RESET_ALL)
+        return 2
+    # A file no device would accept is rejected here, before any device time is spent
+    if args.lint and not lint.preflight(files):
+        print(Fore.RED + "Pre-flight lint failed; fix the files or pass --no-lint." + Style.RESET_ALL)
+        return 2
+    pool = None
+    if args.wireless:
+        # Reconnect the remembered adb-over-TCP devices and keep them up while the fleet installs
+        pool = wireless.WirelessPool(interval=args.keepalive)
+        connected = sum(ok for ok, _ in pool.connect_all().values())
+        print(Fore.CYAN + f"Wireless: {connected}/{len(pool.addresses())} remembered device(s) connected"
+              + Style.RESET_ALL)
+    try:
+        return install_fleet(args, files, tracer, pool)
+    finally:
+        if pool is not None:
+            pool.stop()
+
+def install_fleet(args, files, tracer, pool):
+    """Install on the connected devices that match -s; the wireless pool, if any, heals drops meanwhile"""
+    serials = [serial for serial, state in get_connected_devices() if state == 'device']
+    if args.serial:
+        serials = [serial for serial in serials if serial in args.serial]
+    if not serials:
+        print(Fore.RED + "No matching devices connected." + Style.RESET_ALL)
+        return 2
+    print(Fore.CYAN + f"Installing {len(files)} file(s) on {len(serials)} device(s) "
+          f"with {min(args.workers, len(serials))} worker(s)..." + Style.RESET_ALL)
+    if pool is not None:
+        pool.start()
+    with adbasync.ProgressBoard(serials) as board:
+        def on_result(summary):
+            board.finish(summary['serial'], summary['status'])
+            if not board.live:
+                print(f"  {summary['serial']}: {summary['status']}")
+        # With --live a reboot only happens where the readiness check still fails
+        reboot = ('auto' if args.live else 'always') if args.reboot else 'never'
+        results = install_on_fleet(files, serials, args.workers, args.timeout, reboot, on_result,
+                                   engine=args.engine, transfer=args.transfer, reprobe=args.reprobe,
+                                   live=args.live, restart=args.restart or (), boot_timeout=args.boot_timeout,
+                                   emulators=args.emulators, load_snapshot=args.load_snapshot)
+    print_fleet_table(results)
+    if tracer is not None:
+        tracing.print_summary(tracing.summarize(tracer.records), limit=10)
+    return 0 if all(summary['status'].startswith('installed') for summary in results) else 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Install .0 certificates into the Android system store")
+    parser.add_argument("--fleet", action="store_true",
+                        help="install on every connected device at once (no prompts)")
+    parser.add_argument("files", nargs="*", help=".0 files to install (default: all .0 files here)")
+    parser.add_argument("-s", "--serial", action="append",
+                        help="only use this device serial (repeatable)")
+    parser.add_argument("--workers", type=int, default=8, help="devices handled in parallel (default: 8)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="overall seconds allowed per device (default: 120)")
+    parser.add_argument("--reboot", action="store_true",
+                        help="reboot each device after a successful install and wait until it has booted "
+                             "(with --live: only devices that still don't trust the CA)")
+    parser.add_argument("--live", action="store_true",
+                        help="finish without a reboot: tmpfs overlay if /system is read-only, restart processes "
+                             "that can't see the CA, then check every mount namespace trusts it")
+    parser.add_argument("--restart", metavar="PACKAGE", action="append",
+                        help="with --live: also force-stop this app so it reloads the trust store (repeatable)")
+    parser.add_argument("--boot-timeout", type=float, default=180,
+                        help="seconds to wait for a rebooted device to finish booting (default: 180)")
+    parser.add_argument("--engine", choices=["script", "steps"], default="script",
+                        help="script: one push + one on-device script (default); steps: one adb call per step")
+    parser.add_argument("--transfer", choices=["sync", "tar"], default="sync",
+                        help="script engine payload: one sync push (default) or a tar stream into the install shell")
+    parser.add_argument("--no-emulator-snapshots", dest="emulators", action="store_false",
+                        help="treat emulators like phones: no adb root/remount preparation and no AVD snapshot "
+                             "(by default an emulator loads the snapshot saved for these certs, or gets one)")
+    parser.add_argument("--load-snapshot", choices=["auto", "always", "never"], default="auto",
+                        help="when an emulator lacks the certs and their snapshot exists: load it only right after "
+                             "boot (auto, default), always (discards the running state) or never (live install)")
+    parser.add_argument("--wireless", action="store_true",
+                        help="connect the remembered adb-over-TCP devices first (see wireless.py) and reconnect "
+                             "any that drop during the install")
+    parser.add_argument("--keepalive", type=float, default=10,
+                        help="with --wireless: seconds between health checks (default: 10)")
+    parser.add_argument("--no-lint", dest="lint", action="store_false",
+                        help="skip the pre-flight certificate checks (CA flag, expiry, hash name, see lint.py)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="append JSON-lines records of every adb call, step and fallback branch to FILE")
+    parser.add_argument("--reprobe", action="store_true",
+                        help="ignore stored device profiles and probe root/remount/copy methods again")
+    parser.add_argument("--profile-ttl", type=float, default=devprofile.DEFAULT_TTL_DAYS,
+                        help="days before a stored device profile is re-probed (default: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(reprobe=False, tracer=None, check=True):
     try:
-        install_required_library('colorama')
-        
         # Banner
         print(Fore.GREEN + ">>===========================================<<")
         print("||                                           ||")
@@ -148,179 +1236,95 @@ def main():
         print("|| |_|\_\__,_|_|_|\__,_| |____/|_|_|_|\__,_| ||")
         print("||                                           ||")
         print(">>===========================================<<" + Style.RESET_ALL)
-        
+
         # Check if ADB is installed
         if not check_adb_installed():
             input(Fore.RED + "\nPress Enter to exit..." + Style.RESET_ALL)
             return
-        
+
         while True:
             print(Fore.YELLOW + "\n" + "="*50 + Style.RESET_ALL)
             print(Fore.CYAN + "1. Check if device is connected" + Style.RESET_ALL)
             print(Fore.CYAN + "2. Install certificate" + Style.RESET_ALL)
             print(Fore.CYAN + "3. Exit" + Style.RESET_ALL)
             choice = input(Fore.YELLOW + "\nSelect option (1-3): " + Style.RESET_ALL)
-            
+
             if choice == '1':
                 check_adb_devices()
                 continue
             elif choice == '2':
-                if not check_adb_devices():
+                serials = check_adb_devices()
+                if not serials:
                     print(Fore.RED + "\nPlease connect a device first!" + Style.RESET_ALL)
                     continue
-                
+                serial = serials[0] if len(serials) == 1 else select_device(serials)
+
                 # Check for .0 files
                 files = [file for file in os.listdir() if file.endswith(".0")]
                 if not files:
                     print(Fore.RED + "\nNo .0 certificate files found in current directory." + Style.RESET_ALL)
                     print(Fore.YELLOW + "Please place certificate files (.0 format) in the same directory as this script." + Style.RESET_ALL)
                     continue
-                
+
                 list_files_with_numbers(files)
-                selected_file = select_file(files)
-                
+                selected_files = select_files(files)
+
                 # Ask for confirmation
-                print(Fore.YELLOW + f"\nYou selected: {selected_file}" + Style.RESET_ALL)
+                print(Fore.YELLOW + f"\nYou selected: {', '.join(selected_files)}" + Style.RESET_ALL)
                 confirm = input(Fore.YELLOW + "Proceed with installation? (yes/no): " + Style.RESET_ALL)
                 if confirm.lower() not in ['yes', 'y']:
                     print(Fore.YELLOW + "Installation cancelled." + Style.RESET_ALL)
                     continue
-                
-                # Step 1: Check root access
-                print(Fore.YELLOW + "\n[1/7] Checking root access..." + Style.RESET_ALL)
-                if not check_root_access():
-                    print(Fore.RED + "Device does not have root access!" + Style.RESET_ALL)
-                    print(Fore.YELLOW + "This operation requires root permissions. Continuing anyway..." + Style.RESET_ALL)
-                
-                # Step 2: Remount system as read-write FIRST
-                print(Fore.YELLOW + "[2/7] Preparing system partition..." + Style.RESET_ALL)
-                if not remount_system_as_rw():
-                    print(Fore.YELLOW + "Trying to continue without remount..." + Style.RESET_ALL)
-                
-                # Step 3: Check if cacerts directory exists
-                print(Fore.YELLOW + "[3/7] Checking cacerts directory..." + Style.RESET_ALL)
-                if not check_system_cacerts_exists():
-                    print(Fore.YELLOW + "Creating cacerts directory..." + Style.RESET_ALL)
-                    # Create directory with proper permissions
-                    mkdir_result = execute_shell_command('adb shell "su -c \'mkdir -p /system/etc/security/cacerts\'"')
-                    if mkdir_result.returncode != 0:
-                        print(Fore.YELLOW + "Trying alternative method to create directory..." + Style.RESET_ALL)
-                        execute_shell_command('adb shell mkdir -p /system/etc/security/cacerts')
-                
-                # Step 4: Push file directly to system location (alternative method)
-                print(Fore.YELLOW + "[4/7] Pushing certificate to system..." + Style.RESET_ALL)
-                
-                # Method 1: Try direct push to system (if remount worked)
-                system_path = f"/system/etc/security/cacerts/{selected_file}"
-                push_direct = subprocess.run(['adb', 'push', selected_file, system_path], 
-                                           capture_output=True, text=True)
-                
-                if push_direct.returncode != 0:
-                    print(Fore.YELLOW + "Direct push failed, trying alternative method..." + Style.RESET_ALL)
-                    
-                    # Method 2: Push to temp and copy with proper shell command
-                    temp_path = f"/data/local/tmp/{selected_file}"
-                    push_temp = subprocess.run(['adb', 'push', selected_file, temp_path], 
-                                             capture_output=True, text=True)
-                    
-                    if push_temp.returncode != 0:
-                        print(Fore.RED + f"Failed to push file: {push_temp.stderr}" + Style.RESET_ALL)
-                        continue
-                    
-                    print(Fore.GREEN + f"✓ File pushed to {temp_path}" + Style.RESET_ALL)
-                    
-                    # Step 5: Copy using dd command (more reliable)
-                    print(Fore.YELLOW + "[5/7] Copying to system location..." + Style.RESET_ALL)
-                    
-                    # Using dd command which handles binary files better
-                    copy_cmd = f'adb shell "su -c \\"dd if={temp_path} of={system_path} 2>/dev/null\\""'
-                    copy_result = execute_shell_command(copy_cmd)
-                    
-                    if copy_result.returncode != 0:
-                        # Try cat command
-                        print(Fore.YELLOW + "Trying cat command..." + Style.RESET_ALL)
-                        copy_cmd = f'adb shell "su -c \\"cat {temp_path} > {system_path}\\""'
-                        copy_result = execute_shell_command(copy_cmd)
-                    
-                    if copy_result.returncode != 0:
-                        # Try simple cp command
-                        print(Fore.YELLOW + "Trying cp command..." + Style.RESET_ALL)
-                        copy_cmd = f'adb shell cp {temp_path} {system_path}'
-                        copy_result = execute_shell_command(copy_cmd)
-                    
-                    if copy_result.returncode != 0:
-                        print(Fore.RED + f"Failed to copy file to system: {copy_result.stderr}" + Style.RESET_ALL)
-                        
-                        # Try one more method - use adb shell in interactive mode
-                        print(Fore.YELLOW + "Trying interactive shell method..." + Style.RESET_ALL)
-                        try:
-                            # Create a script file
-                            with open('temp_script.sh', 'w') as f:
-                                f.write(f'''#!/system/bin/sh
-su -c "cat {temp_path} > {system_path}"
-exit
-''')
-                            
-                            subprocess.run(['adb', 'push', 'temp_script.sh', '/data/local/tmp/temp_script.sh'])
-                            subprocess.run(['adb', 'shell', 'chmod', '755', '/data/local/tmp/temp_script.sh'])
-                            script_result = subprocess.run(['adb', 'shell', '/data/local/tmp/temp_script.sh'], 
-                                                         capture_output=True, text=True)
-                            os.remove('temp_script.sh')
-                            subprocess.run(['adb', 'shell', 'rm', '/data/local/tmp/temp_script.sh'])
-                            
-                            if script_result.returncode != 0:
-                                raise Exception("Script method failed")
-                        except:
-                            print(Fore.RED + "All copy methods failed!" + Style.RESET_ALL)
-                            continue
-                    
-                    # Clean up temp file
-                    subprocess.run(['adb', 'shell', 'rm', temp_path], capture_output=True, text=True)
-                else:
-                    print(Fore.GREEN + f"✓ Certificate pushed directly to system" + Style.RESET_ALL)
-                
-                # Step 6: Set permissions
-                print(Fore.YELLOW + "[6/7] Setting permissions..." + Style.RESET_ALL)
-                chmod_cmd = f'adb shell "su -c \\"chmod 644 {system_path}\\""'
-                chmod_result = execute_shell_command(chmod_cmd)
-                
-                if chmod_result.returncode == 0:
-                    print(Fore.GREEN + "✓ Permissions set correctly" + Style.RESET_ALL)
-                else:
-                    # Try without su
-                    subprocess.run(['adb', 'shell', 'chmod', '644', system_path], capture_output=True, text=True)
-                    print(Fore.YELLOW + "✓ Permissions set (alternative method)" + Style.RESET_ALL)
-                
-                # Step 7: Verify file exists
-                print(Fore.YELLOW + "[7/7] Verifying installation..." + Style.RESET_ALL)
-                verify_result = subprocess.run(['adb', 'shell', 'ls', '-la', system_path], 
-                                             capture_output=True, text=True)
-                
-                if verify_result.returncode == 0 and selected_file in verify_result.stdout:
-                    print(Fore.GREEN + f"✓ Certificate successfully installed at: {system_path}" + Style.RESET_ALL)
-                    print(Fore.GREEN + f"✓ File details:\n{verify_result.stdout}" + Style.RESET_ALL)
-                else:
-                    print(Fore.YELLOW + "⚠ Installation completed but verification failed" + Style.RESET_ALL)
-                
+                if check and not lint.preflight(selected_files):
+                    print(Fore.RED + "Pre-flight lint failed; nothing was pushed." + Style.RESET_ALL)
+                    continue
+
+                # One transfer, one privileged step and one verify pass for all selected files
+                runs = install_files(selected_files, serial, reprobe=reprobe)
+                statuses = file_statuses(runs)
+                if tracer is not None and tracer.path:
+                    tracing.print_summary(tracing.summarize(tracer.records), limit=10)
+                if all(statuses.get(file, 'failed').startswith('failed') for file in selected_files):
+                    continue
+
+                # Readiness check: no reboot needed once every mount namespace sees the certs
+                placed = device_names(runs)
+                names = [placed.get(os.path.basename(file), os.path.basename(file)) for file in selected_files
+                         if statuses.get(file) == 'installed']
+                store, overlay, root = install_facts(runs)
+                trust = check_trust(serial, names, store, root)
+                if trust['trusted']:
+                    print(Fore.GREEN + "✓ The device already trusts the certificate(s); no reboot needed." + Style.RESET_ALL)
+                    break
+                if overlay:
+                    print(Fore.YELLOW + "Some apps can't see the certificate(s) yet; restart them (a reboot would "
+                          "remove the overlay)." + Style.RESET_ALL)
+                    break
+
                 # Ask about reboot
                 reboot_choice = input(Fore.YELLOW + "\nReboot device now? (yes/no): " + Style.RESET_ALL)
-                
+
                 if reboot_choice.lower() in ['yes', 'y']:
-                    print(Fore.YELLOW + "Rebooting device..." + Style.RESET_ALL)
-                    subprocess.run(['adb', 'reboot'], capture_output=True, text=True)
-                    print(Fore.GREEN + "Device is rebooting. You're all done!" + Style.RESET_ALL)
-                    time.sleep(2)
+                    print(Fore.YELLOW + "Rebooting device and waiting for it to finish booting..." + Style.RESET_ALL)
+                    seconds = reboot_and_wait(serial)
+                    if seconds is None:
+                        print(Fore.RED + "Device did not finish booting in time." + Style.RESET_ALL)
+                    elif check_trust(serial, names, store, root)['trusted']:
+                        print(Fore.GREEN + f"✓ Device booted in {seconds:.0f}s and trusts the certificate(s). "
+                              "You're all done!" + Style.RESET_ALL)
+                    else:
+                        print(Fore.RED + f"Device booted in {seconds:.0f}s but can't see the certificate(s)." + Style.RESET_ALL)
                 else:
                     print(Fore.YELLOW + "Please reboot your device manually for changes to take effect." + Style.RESET_ALL)
-                
+
                 break
-                
+
             elif choice == '3':
                 print(Fore.YELLOW + "Goodbye!" + Style.RESET_ALL)
                 break
             else:
                 print(Fore.RED + "Invalid option. Please try again." + Style.RESET_ALL)
-                
+
     except KeyboardInterrupt:
         print(Fore.RED + "\n\nOperation cancelled by user." + Style.RESET_ALL)
     except Exception as e:
@@ -330,5 +1334,16 @@ exit
     finally:
         input(Fore.YELLOW + "\nPress Enter to exit..." + Style.RESET_ALL)
 
+def cli(argv=None):
+    """Command-line entry point (also used by main.py); returns an exit code"""
+    global profiles
+    args = parse_args(argv)
+    profiles = devprofile.DeviceProfiles(ttl_days=args.profile_ttl)
+    with tracing.Tracer(args.trace) as tracer:
+        if args.fleet:
+            return fleet_main(args, tracer)
+        main(args.reprobe, tracer, args.lint)
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
\ No newline at end of file
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import contextlib
+from colorama import init, Fore, Style
+import cert
+import lint
+import phssl
+import setup_wifi
+
+init()
+
+# Exit codes: scripts can tell "bad input" from "device said no"
+EXIT_OK = 0
+EXIT_FAILED = 1          # install, trust, verify, proxy or reboot failed on at least one device
+EXIT_USAGE = 2           # bad arguments or unreadable certificate
+EXIT_NO_DEVICES = 3      # adb missing, or no device matched the selectors
+
+
+def read_certificate(source, check=True, log=print):
+    """Return (hash, pem) for a DER/PEM file, or for stdin when source is '-'
+
+    With check, a certificate that fails the pre-flight lint raises ValueError.
+    """
+    if source == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+    if check:
+        for warning in lint.check_bytes(data, source):
+            log(Fore.YELLOW + f"{source}: {warning}" + Style.RESET_ALL)
+    return cert.convert_bytes(data)
+
+
+def select_serials(selectors, all_devices):
+    """Resolve -s/--all against the connected devices; returns (serials, error)"""
+    connected = [serial for serial, state in phssl.get_connected_devices() if state == "device"]
+    if selectors:
+        missing = [serial for serial in selectors if serial not in connected]
+        if missing:
+            return [], f"not connected: {', '.join(missing)}"
+        return list(dict.fromkeys(selectors)), None
+    if all_devices or len(connected) == 1:
+        return connected, None
+    if not connected:
+        return [], "no devices connected"
+    return [], f"{len(connected)} devices connected; pick with -s SERIAL or --all"
+
+
+def verify_installed(serial, name, pem, store="system"):
+    """Read the installed file back from the store conscrypt uses and compare it with what was pushed"""
+    read = phssl.run_adb(["shell", f"cat {phssl.trust_store_dir(store)}/{name}"], serial, op="verify")
+    return read.returncode == 0 and read.stdout.replace("\r\n", "\n").strip() == pem.strip()
+
+
+def run_pipeline(source, serials, reboot="never", proxy=None, workers=8, timeout=120, engine="script",
+                 transfer="tar", log=print, restart=(), boot_timeout=180, check=True):
+    """Convert, push, check trust, verify, optionally reboot and set the proxy; returns a result dict
+
+    The install is live: it ends with a readiness check of every mount namespace, so
+    reboot="auto" only reboots devices that still don't trust the certificate.
+    """
+    start = time.monotonic()
+    new_hash, pem = read_certificate(source, check, log)
+    name = f"{new_hash}.0"
+    result = {"source": source, "hash": new_hash, "name": name,
+              "sha256": hashlib.sha256(cert.certificate_der(pem.encode())).hexdigest(), "devices": []}
+    log(Fore.CYAN + f"{source} -> {name}, installing on {len(serials)} device(s)..." + Style.RESET_ALL)
+
+    # The .0 file only lives in a private temp dir; with transfer='tar' it streams into the install shell
+    with tempfile.TemporaryDirectory(prefix="kalla_billa_") as work:
+        path = os.path.join(work, name)
+        with open(path, "w", newline="\n") as f:
+            f.write(pem)
+        summaries = phssl.install_on_fleet([path], serials, workers, timeout, reboot, engine=engine,
+                                           transfer=transfer, live=True, restart=restart, boot_timeout=boot_timeout)
+
+    for summary in summaries:
+        serial = summary["serial"]
+        installed = summary["status"].startswith("installed")
+        # <hash>.N when another CA already holds <hash>.0 on this device
+        stored = summary.get("names", {}).get(name, name)
+        verified = installed and verify_installed(serial, stored, pem, summary["store"])
+        log((Fore.GREEN + "✓" if verified else Fore.RED + "✗") + f" {serial}: {summary['status']}"
+            + ("" if stored == name else f" as {stored}")
+            + ("" if verified or not installed else ", read-back mismatch") + Style.RESET_ALL)
+        result["devices"].append({"serial": serial, "name": stored, "status": summary["status"],
+                                  "store": summary["store"],
+                                  "verified": verified, "trusted": summary.get("trust", {}).get("trusted"),
+                                  "proxy": None, "rebooted": summary.get("reboot") == "done",
+                                  "boot_seconds": summary.get("boot_seconds"), "seconds": round(summary["total"], 3)})
+
+    verified = [device["serial"] for device in result["devices"] if device["verified"]]
+    if proxy and verified:
+        host, _, port = proxy.rpartition(":")
+        outcome = asyncio.run(setup_wifi.apply_proxy(verified, "s", host, port, workers, timeout, log=log))
+        for device in result["devices"]:
+            if device["serial"] in outcome:
+                device["proxy"] = outcome[device["serial"]]
+
+    result["ok"] = bool(result["devices"]) and all(
+        device["verified"] and device["proxy"] is not False for device in result["devices"])
+    result["seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless install: certificate in, installed and verified "
+                                                 "<hash>.0 out, JSON result on stdout")
+    parser.add_argument("cert", help="DER or PEM certificate file, or - for stdin")
+    parser.add_argument("-s", "--serial", action="append", help="target this device serial (repeatable)")
+    parser.add_argument("--all", action="store_true", help="target every connected device")
+    parser.add_argument("--reboot", choices=["never", "always", "auto"], default="never",
+                        help="reboot after the install and wait for boot; auto: only devices that don't trust "
+                             "the certificate yet (default: never)")
+    parser.add_argument("--restart", metavar="PACKAGE", action="append",
+                        help="force-stop this app after the install so it reloads the trust store (repeatable)")
+    parser.add_argument("--boot-timeout", type=float, default=180,
+                        help="seconds to wait for a rebooted device to finish booting (default: 180)")
+    parser.add_argument("--proxy", metavar="HOST:PORT", help="also point the device's Wi-Fi proxy here")
+    parser.add_argument("--workers", type=int, default=8, help="devices handled in parallel (default: 8)")
+    parser.add_argument("--timeout", type=float, default=120, help="overall seconds allowed per device (default: 120)")
+    parser.add_argument("--engine", choices=["script", "steps"], default="script")
+    parser.add_argument("--transfer", choices=["sync", "tar"], default="tar",
+                        help="script engine payload (default: tar, streamed into the install shell)")
+    parser.add_argument("--no-lint", dest="lint", action="store_false",
+                        help="skip the pre-flight certificate checks (CA flag, expiry, see lint.py)")
+    parser.add_argument("-o", "--output", metavar="FILE", help="also write the JSON result to FILE")
+    args = parser.parse_args(argv)
+    if args.proxy and not args.proxy.rpartition(":")[2].isdigit():
+        parser.error("--proxy must be HOST:PORT")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = {"ok": False, "devices": []}
+    # stdout carries only the JSON result; progress goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        if not phssl.check_adb_installed():
+            result["error"], code = "adb not available", EXIT_NO_DEVICES
+        else:
+            serials, error = select_serials(args.serial, args.all)
+            if error:
+                print(Fore.RED + error + Style.RESET_ALL)
+                result["error"], code = error, EXIT_NO_DEVICES
+            else:
+                try:
+                    result = run_pipeline(args.cert, serials, args.reboot, args.proxy, args.workers, args.timeout,
+                                          args.engine, args.transfer, restart=args.restart or (),
+                                          boot_timeout=args.boot_timeout, check=args.lint)
+                    code = EXIT_OK if result["ok"] else EXIT_FAILED
+                except (OSError, ValueError) as e:
+                    print(Fore.RED + f"Cannot use certificate {args.cert}: {e}" + Style.RESET_ALL)
+                    result["error"], code = str(e), EXIT_USAGE
+    result["exit_code"] = code
+    text = json.dumps(result, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,519 @@
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import collections
+import http.client
+import http.server
+import socketserver
+import concurrent.futures
+from colorama import init, Fore, Style
+import cert
+import lint
+import phssl
+import rotate
+import pipeline
+import inventory
+import adbasync
+import devprofile
+import setup_wifi
+
+init()
+
+DEFAULT_PORT = 8765
+JOB_KINDS = ("install", "remove", "proxy")
+FINISHED = ("done", "failed", "cancelled")
+# Finished jobs kept for status queries; older ones are forgotten
+HISTORY = 1000
+# A device's state from its last refresh stands in for the install's own probes this long
+WARM_SECONDS = 300
+
+
+class Provisioner:
+    """Job queue in front of the device rack: one task per (job, device)
+
+    Tasks for the same device run one at a time in submission order, so two pipelines
+    never remount or push on one phone at once; different devices run in parallel on
+    a shared worker pool. Per-device state (store, cacerts listing, capability profile)
+    stays in memory between jobs.
+    """
+
+    def __init__(self, workers=8, timeout=120, boot_timeout=180):
+        self.timeout = timeout
+        self.boot_timeout = boot_timeout
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()
+        self.queues = collections.defaultdict(collections.deque)   # serial -> job ids waiting for it
+        self.busy = {}                                              # serial -> (job id, session)
+        self.devices = {}                                           # serial -> warm state
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers),
+                                                          thread_name_prefix="provisiond")
+        self.work = tempfile.mkdtemp(prefix="kalla_billa_provisiond_")
+        self.started = time.time()
+        self.next_id = 1
+        self.finished = collections.deque(maxlen=10000)             # (time, kind, seconds, ok) per task
+        self.totals = collections.defaultdict(lambda: {"tasks": 0, "failed": 0, "seconds": 0.0})
+
+    # -- jobs ---------------------------------------------------------------
+
+    def submit(self, request):
+        """Validate a job request, queue one task per device and return the job; ValueError if invalid"""
+        kind = request.get("kind")
+        if kind not in JOB_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(JOB_KINDS)}")
+        serials = request.get("serials")
+        serials, error = pipeline.select_serials([serials] if isinstance(serials, str) else serials,
+                                                 request.get("all", False))
+        if error:
+            raise ValueError(error)
+        params = getattr(self, f"_prepare_{kind}")(request)
+        with self.lock:
+            job_id = str(self.next_id)
+            self.next_id += 1
+            job = {"id": job_id, "kind": kind, "client": request.get("client"), "serials": serials,
+                   "params": {k: v for k, v in params.items() if not k.startswith("_")}, "state": "queued",
+                   "submitted": time.time(), "started": None, "finished": None, "results": {}}
+            self.jobs[job_id] = dict(job, _params=params)
+            if kind == "install":
+                path = os.path.join(self.work, job_id, params["name"])
+                os.makedirs(os.path.dirname(path))
+                with open(path, "w", newline="\n") as f:
+                    f.write(params["_pem"])
+                params["_path"] = path
+            for serial in serials:
+                self.queues[serial].append(job_id)
+            self._prune()
+        for serial in serials:
+            self._schedule(serial)
+        return self.job(job_id)
+
+    def _prepare_install(self, request):
+        if request.get("certificate_b64"):
+            data = base64.b64decode(request["certificate_b64"])
+        elif request.get("certificate"):
+            data = request["certificate"].encode()
+        else:
+            raise ValueError("install needs 'certificate' (PEM text) or 'certificate_b64' (DER/PEM bytes)")
+        if request.get("lint", True):
+            lint.check_bytes(data)
+        cert_hash, pem = cert.convert_bytes(data)
+        reboot = request.get("reboot", "never")
+        if reboot not in ("never", "always", "auto"):
+            raise ValueError("reboot must be never, always or auto")
+        return {"name": f"{cert_hash}.0", "reboot": reboot, "live": request.get("live", True),
+                "restart": list(request.get("restart") or ()), "_pem": pem}
+
+    def _prepare_remove(self, request):
+        specs = request.get("targets") or []
+        if not specs:
+            raise ValueError("remove needs 'targets': <hash>, <hash>.N or SHA-256 fingerprints")
+        return {"targets": specs, "live": request.get("live", False),
+                "_targets": [rotate.resolve_target(spec) for spec in specs]}
+
+    def _prepare_proxy(self, request):
+        if request.get("clear"):
+            return {"clear": True}
+        host, port = request.get("host"), str(request.get("port", ""))
+        if not host or not port.isdigit():
+            raise ValueError("proxy needs 'host' and 'port', or 'clear': true")
+        return {"host": host, "port": port}
+
+    def _schedule(self, serial):
+        """Start the next queued task for a device unless one is already running on it"""
+        with self.lock:
+            if serial in self.busy:
+                return
+            queue = self.queues.get(serial)
+            while queue and self.jobs.get(queue[0], {}).get("state") in (None,) + FINISHED:
+                queue.popleft()
+            if not queue:
+                return
+            job_id = queue.popleft()
+            session = adbasync.Session(serial)
+            self.busy[serial] = (job_id, session)
+            job = self.jobs[job_id]
+            if job["state"] == "queued":
+                job["state"], job["started"] = "running", time.time()
+        self.pool.submit(self._run, job, serial, session)
+
+    def _run(self, job, serial, session):
+        start = time.monotonic()
+        result = {"status": "error: worker stopped", "ok": False}
+        try:
+            try:
+                result = getattr(self, f"_execute_{job['kind']}")(job["_params"], serial, session)
+            except Exception as e:
+                result = {"status": f"error: {e}", "ok": False}
+            if job["kind"] != "proxy" and session.cancelled:
+                # Stopped part-way: the last listing may no longer be true
+                with self.lock:
+                    self.devices.pop(serial, None)
+            elif job["kind"] != "proxy":
+                self.refresh(serial)
+        finally:
+            # Whatever went wrong above, the device must leave busy or its queue stalls for good
+            result["seconds"] = round(time.monotonic() - start, 3)
+            with self.lock:
+                job["results"][serial] = result
+                totals = self.totals[job["kind"]]
+                totals["tasks"] += 1
+                totals["failed"] += not result["ok"]
+                totals["seconds"] += result["seconds"]
+                self.finished.append((time.time(), job["kind"], result["seconds"], result["ok"]))
+                if len(job["results"]) == len(job["serials"]) and job["state"] == "running":
+                    job["state"] = "done" if all(r["ok"] for r in job["results"].values()) else "failed"
+                    job["finished"] = time.time()
+                del self.busy[serial]
+            self._schedule(serial)
+
+    def _execute_install(self, params, serial, session):
+        summary = phssl.install_on_device(serial, [params["_path"]], self.timeout, params["reboot"], transfer="tar",
+                                          session=session, live=params["live"], restart=params["restart"],
+                                          boot_timeout=self.boot_timeout, known=self.warm(serial))
+        return {"status": summary["status"], "ok": summary["status"].startswith("installed"),
+                "store": summary["store"], "trusted": summary.get("trust", {}).get("trusted"),
+                "reboot": summary.get("reboot"), "steps": {k: round(v, 3) for k, v in summary["steps"].items()}}
+
+    def _execute_remove(self, params, serial, session):
+        summary = rotate.rotate_device(serial, params["_targets"], timeout=self.timeout, live=params["live"],
+                                       session=session)
+        return {"status": summary["status"], "ok": summary["status"] in rotate.OK_STATUSES,
+                "removed": summary["remove"]}
+
+    def _execute_proxy(self, params, serial, session):
+        if params.get("clear"):
+            change = setup_wifi.clear_wifi_proxy(serial)
+        else:
+            change = setup_wifi.set_wifi_proxy(serial, params["host"], params["port"])
+        try:
+            # On the shared adb loop so that cancelling the session stops the call in flight
+            ok = adbasync.get_loop_thread().call(asyncio.wait_for(change, self.timeout), session)
+        except adbasync.Cancelled:
+            return {"status": "cancelled", "ok": False}
+        return {"status": ("cleared" if params.get("clear") else "set") if ok else "failed", "ok": ok}
+
+    def cancel(self, job_id):
+        """Drop a job's queued tasks and cancel its running ones; returns the job or None"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["state"] not in FINISHED:
+                for serial, (running, session) in self.busy.items():
+                    if running == job_id:
+                        session.cancel()
+                for serial in job["serials"]:
+                    job["results"].setdefault(serial, {"status": "cancelled", "ok": False})
+                job["state"], job["finished"] = "cancelled", time.time()
+        return self.job(job_id)
+
+    def _prune(self):
+        done = [job_id for job_id, job in self.jobs.items() if job["state"] in FINISHED]
+        for job_id in done[:max(0, len(done) - HISTORY)]:
+            shutil.rmtree(os.path.join(self.work, job_id), ignore_errors=True)
+            del self.jobs[job_id]
+
+    def job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            view = {k: v for k, v in job.items() if not k.startswith("_")}
+            view["results"] = dict(job["results"])
+            view["queued"] = [s for s in job["serials"] if s not in job["results"] and self.busy.get(s, ("",))[0] != job_id]
+            return view
+
+    def job_list(self):
+        with self.lock:
+            ids = list(self.jobs)
+        return [self.job(job_id) for job_id in ids]
+
+    # -- device state -----------------------------------------------------------
+
+    def refresh(self, serial):
+        """Re-read a device's trust store listing (one adb call) and its stored capability profile"""
+        probe = phssl.run_adb(["shell", inventory.PROBE_COMMAND], serial, timeout=30, op="inventory")
+        store, build, files = inventory.parse_listing(probe.stdout)
+        if store is None:
+            # Installs must not go by a listing that could not be re-read
+            with self.lock:
+                self.devices.pop(serial, None)
+            return
+        state = {"store": store, "build": build, "cacerts": sorted(files), "refreshed": time.time(),
+                 "capabilities": phssl.get_profiles().lookup(serial, build)}
+        with self.lock:
+            self.devices[serial] = state
+
+    def warm(self, serial):
+        """The device's refreshed state while it is recent enough to trust, else None"""
+        with self.lock:
+            state = self.devices.get(serial)
+        if state is None or time.time() - state["refreshed"] > WARM_SECONDS:
+            return None
+        return state
+
+    def device_list(self):
+        connected = dict(phssl.get_connected_devices())
+        with self.lock:
+            serials = sorted(set(connected) | set(self.devices))
+            return [dict(self.devices.get(serial, {}), serial=serial, state=connected.get(serial, "gone"),
+                         busy=self.busy.get(serial, (None,))[0], queued=list(self.queues.get(serial, ())))
+                    for serial in serials]
+
+    def metrics(self):
+        now = time.time()
+        with self.lock:
+            states = collections.Counter(job["state"] for job in self.jobs.values())
+            last_minute = [entry for entry in self.finished if now - entry[0] <= 60]
+            tasks = sum(t["tasks"] for t in self.totals.values())
+            return {
+                "uptime": round(now - self.started, 1),
+                "jobs": dict(states),
+                "tasks": {"finished": tasks, "failed": sum(t["failed"] for t in self.totals.values()),
+                          "running": len(self.busy), "queued": sum(len(q) for q in self.queues.values())},
+                "per_minute": len(last_minute),
+                "avg_task_seconds": round(sum(t["seconds"] for t in self.totals.values()) / tasks, 3) if tasks else None,
+                "by_kind": {kind: dict(t, seconds=round(t["seconds"], 3)) for kind, t in self.totals.items()},
+                "devices": {"known": len(self.devices), "busy": len(self.busy)},
+            }
+
+    def close(self):
+        with self.lock:
+            for _, session in self.busy.values():
+                session.cancel()
+        self.pool.shutdown(wait=True)
+        shutil.rmtree(self.work, ignore_errors=True)
+
+
+class ApiHandler(http.server.BaseHTTPRequestHandler):
+    """JSON API: POST /jobs, GET /jobs[/ID], DELETE /jobs/ID, GET /devices, GET /metrics, GET /health"""
+
+    server_version = "kalla-billa-provisiond/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            print(f"{time.strftime('%H:%M:%S')} {format % args}", flush=True)
+
+    def reply(self, code, body):
+        data = json.dumps(body, indent=1).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        provisioner = self.server.provisioner
+        path = self.path.rstrip("/")
+        if path == "/health":
+            return self.reply(200, {"ok": True})
+        if path == "/metrics":
+            return self.reply(200, provisioner.metrics())
+        if path == "/devices":
+            return self.reply(200, provisioner.device_list())
+        if path == "/jobs":
+            return self.reply(200, provisioner.job_list())
+        if path.startswith("/jobs/"):
+            job = provisioner.job(path[len("/jobs/"):])
+            return self.reply(200, job) if job else self.reply(404, {"error": "no such job"})
+        self.reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self.reply(404, {"error": f"unknown path {self.path}"})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("request body must be a JSON object")
+            job = self.server.provisioner.submit(request)
+        except ValueError as e:
+            return self.reply(400, {"error": str(e)})
+        self.reply(202, job)
+
+    def do_DELETE(self):
+        path = self.path.rstrip("/")
+        job = self.server.provisioner.cancel(path[len("/jobs/"):]) if path.startswith("/jobs/") else None
+        self.reply(200, job) if job else self.reply(404, {"error": "no such job"})
+
+
+class HttpApiServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class UnixApiServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) peer
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(provisioner, host="127.0.0.1", port=DEFAULT_PORT, unix=None, verbose=False):
+    """API server bound to host:port or to a Unix socket path (not started)"""
+    if unix:
+        if os.path.exists(unix):
+            os.remove(unix)
+        server = UnixApiServer(unix, ApiHandler)
+        os.chmod(unix, 0o660)
+    else:
+        server = HttpApiServer((host, port), ApiHandler)
+    server.provisioner = provisioner
+    server.verbose = verbose
+    return server
+
+
+# -- client -------------------------------------------------------------------
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def api_call(args, method, path, body=None):
+    """One request to a running daemon; returns (status code, decoded JSON)"""
+    if args.unix:
+        connection = UnixHTTPConnection(args.unix)
+    else:
+        connection = http.client.HTTPConnection(args.host, args.port, timeout=30)
+    try:
+        payload = json.dumps(body).encode() if body is not None else None
+        connection.request(method, path, payload, {"Content-Type": "application/json"} if payload else {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+
+def wait_for_job(args, job):
+    while job["state"] not in FINISHED:
+        time.sleep(args.poll)
+        job = api_call(args, "GET", f"/jobs/{job['id']}")[1]
+    return job
+
+
+def print_job(job):
+    color = {"done": Fore.GREEN, "failed": Fore.RED, "cancelled": Fore.YELLOW}.get(job["state"], Fore.CYAN)
+    print(color + f"job {job['id']} {job['kind']}: {job['state']}" + Style.RESET_ALL)
+    for serial in job["serials"]:
+        result = job["results"].get(serial)
+        status = result["status"] if result else ("queued" if serial in job.get("queued", ()) else "running")
+        print(f"  {serial}: {status}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Provisioning service: install/remove/proxy jobs over a local API")
+    parser.add_argument("--host", default="127.0.0.1", help="API address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="API port (default: %(default)s)")
+    parser.add_argument("--unix", metavar="PATH", help="use a Unix socket instead of TCP")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the service until interrupted")
+    serve.add_argument("--workers", type=int, default=8, help="devices worked on at once (default: 8)")
+    serve.add_argument("--timeout", type=float, default=120, help="seconds allowed per device task (default: 120)")
+    serve.add_argument("--boot-timeout", type=float, default=180, help="seconds allowed per reboot (default: 180)")
+    serve.add_argument("--profile-ttl", type=float, default=devprofile.DEFAULT_TTL_DAYS,
+                       help="days before a stored device profile is re-probed (default: %(default)s)")
+    serve.add_argument("-v", "--verbose", action="store_true", help="log every API request")
+    submit = sub.add_parser("submit", help="queue a job: install CERT | remove TARGET... | proxy HOST:PORT|clear")
+    submit.add_argument("kind", choices=JOB_KINDS)
+    submit.add_argument("terms", nargs="+")
+    submit.add_argument("-s", "--serial", action="append", help="target this device serial (repeatable)")
+    submit.add_argument("--all", action="store_true", help="target every connected device")
+    submit.add_argument("--reboot", choices=["never", "always", "auto"], default="never")
+    submit.add_argument("--live", action="store_true", help="remove: use a tmpfs overlay on read-only /system")
+    submit.add_argument("--wait", action="store_true", help="block until the job has finished")
+    submit.add_argument("--poll", type=float, default=1.0, help="seconds between status polls with --wait")
+    jobs = sub.add_parser("jobs", help="list jobs, or show one")
+    jobs.add_argument("id", nargs="?")
+    jobs.add_argument("--wait", action="store_true", help="block until the job has finished")
+    jobs.add_argument("--poll", type=float, default=1.0)
+    cancel = sub.add_parser("cancel", help="cancel a job")
+    cancel.add_argument("id")
+    sub.add_parser("devices", help="devices with their warm state and queue")
+    sub.add_parser("metrics", help="job counts and throughput")
+    return parser.parse_args(argv)
+
+
+def build_request(args):
+    request = {"kind": args.kind, "serials": args.serial, "all": args.all, "client": f"{socket.gethostname()}:{os.getpid()}"}
+    if args.kind == "install":
+        with open(args.terms[0], "rb") as f:
+            request.update(certificate_b64=base64.b64encode(f.read()).decode(), reboot=args.reboot)
+    elif args.kind == "remove":
+        request.update(targets=args.terms, live=args.live)
+    elif args.terms[0] == "clear":
+        request["clear"] = True
+    else:
+        host, _, port = args.terms[0].rpartition(":")
+        request.update(host=host, port=port)
+    return request
+
+
+def stop_serving(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(args):
+    # SIGTERM (systemd, docker stop) shuts down like Ctrl+C: running tasks cancelled, socket removed
+    signal.signal(signal.SIGTERM, stop_serving)
+    phssl.profiles = devprofile.DeviceProfiles(ttl_days=args.profile_ttl)
+    provisioner = Provisioner(args.workers, args.timeout, args.boot_timeout)
+    server = make_server(provisioner, args.host, args.port, args.unix, args.verbose)
+    where = args.unix or f"http://{args.host}:{server.server_address[1]}"
+    print(Fore.CYAN + f"provisiond listening on {where} with {args.workers} worker(s)" + Style.RESET_ALL, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        provisioner.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        return serve(args)
+    try:
+        if args.command == "submit":
+            code, body = api_call(args, "POST", "/jobs", build_request(args))
+        elif args.command == "jobs":
+            code, body = api_call(args, "GET", f"/jobs/{args.id}" if args.id else "/jobs")
+        elif args.command == "cancel":
+            code, body = api_call(args, "DELETE", f"/jobs/{args.id}")
+        else:
+            code, body = api_call(args, "GET", f"/{args.command}")
+        if code < 300 and getattr(args, "wait", False):
+            body = wait_for_job(args, body)
+    except OSError as e:
+        print(Fore.RED + f"provisiond not reachable: {e}" + Style.RESET_ALL)
+        return pipeline.EXIT_NO_DEVICES
+    if code >= 300:
+        print(Fore.RED + body.get("error", f"HTTP {code}") + Style.RESET_ALL)
+        return pipeline.EXIT_USAGE
+    if args.command in ("submit", "cancel") or (args.command == "jobs" and args.id):
+        print_job(body)
+        return pipeline.EXIT_FAILED if body["state"] in ("failed", "cancelled") else pipeline.EXIT_OK
+    print(json.dumps(body, indent=1))
+    return pipeline.EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import time
+import argparse
+import tempfile
+import concurrent.futures
+from colorama import init, Fore, Style
+import cert
+import phssl
+import pipeline
+import inventory
+
+init()
+
+DONE_STATUSES = ("rotated", "installed", "removed")
+OK_STATUSES = DONE_STATUSES + ("unchanged", "would change")
+
+
+def resolve_target(spec):
+    """Turn a <hash>[.N], a SHA-256 fingerprint or a certificate file into a match spec"""
+    if os.path.isfile(spec):
+        with open(spec, "rb") as f:
+            info = cert.certificate_info(f.read())
+        return {"spec": spec, "hash": info["hash"], "name": None, "fingerprint": info["fingerprint"]}
+    text = spec.strip().lower().replace(":", "")
+    if re.fullmatch(r"[0-9a-f]{8}(\.\d+)?", text):
+        return {"spec": spec, "hash": text.split(".")[0], "name": text if "." in text else None, "fingerprint": None}
+    if re.fullmatch(r"[0-9a-f]{64}", text):
+        return {"spec": spec, "hash": None, "name": None, "fingerprint": text}
+    raise ValueError(f"{spec}: not a <hash>.N name, a SHA-256 fingerprint or a certificate file")
+
+
+def file_fingerprint(data):
+    """SHA-256 of the certificate's DER, or None for files that are not certificates"""
+    try:
+        return cert.certificate_info(data)["fingerprint"]
+    except ValueError:
+        return None
+
+
+def matches(target, name, fingerprint):
+    if target["name"]:
+        return name == target["name"]
+    if target["fingerprint"]:
+        return fingerprint == target["fingerprint"]
+    return name.split(".")[0] == target["hash"]
+
+
+def read_candidates(serial, targets, new=None):
+    """One adb call: the store conscrypt reads plus every file that could match a target or clash with new"""
+    hashes = {target["hash"] for target in targets} | ({new["hash"]} if new else set())
+    # A bare fingerprint could be under any name
+    globs = " ".join(["$D/*"] if None in hashes else [f"$D/{h}.*" for h in sorted(hashes)])
+    command = (f'D={phssl.CACERTS_DIR}; [ -d {phssl.APEX_CACERTS_DIR} ] && D={phssl.APEX_CACERTS_DIR}; '
+               f'echo "KB STORE $D"; for f in {globs}; do [ -f $f ] && echo "KB CERT $(basename $f)" && cat $f; done')
+    run = phssl.run_adb(["shell", command], serial, timeout=30, op="plan")
+    store = next((line.split()[2] for line in run.stdout.splitlines() if line.startswith("KB STORE ")), None)
+    return store, inventory.parse_dump(run.stdout)
+
+
+def plan_device(serial, targets, new=None):
+    """Decide which names to remove and which <hash>.N the new certificate gets on one device"""
+    store, files = read_candidates(serial, targets, new)
+    if store is None:
+        return {"error": "no answer"}
+    fingerprints = {name: file_fingerprint(data) for name, data in files.items()}
+    remove = sorted(name for name, fingerprint in fingerprints.items()
+                    if any(matches(target, name, fingerprint) for target in targets))
+    plan = {"store": store, "remove": remove, "install": None, "present": None}
+    if new:
+        kept = {name: fingerprint for name, fingerprint in fingerprints.items() if name not in remove}
+        present = [name for name, fingerprint in kept.items() if fingerprint == new["fingerprint"]]
+        if present:
+            plan["present"] = present[0]
+        else:
+            # Lowest free <hash>.N once the old files are gone, as Android numbers collisions
+            taken = {name for name in kept if name.split(".")[0] == new["hash"]}
+            plan["install"] = next(f"{new['hash']}.{n}" for n in range(len(taken) + 1)
+                                   if f"{new['hash']}.{n}" not in taken)
+    return plan
+
+
+def rotate_device(serial, targets, new=None, dry_run=False, timeout=120, transfer="tar", live=False, session=None):
+    """Plan, then remove and install in one privileged script run, then verify (fleet worker)
+
+    A cancelled session stops the adb call in flight and the device reports 'cancelled'.
+    """
+    start = time.monotonic()
+    summary = {"serial": serial, "status": "failed", "remove": [], "install": None}
+    quiet = lambda message: None
+    try:
+        with phssl.device_deadline(timeout), phssl.device_session(session):
+            plan = plan_device(serial, targets, new)
+            summary.update(plan)
+            if "error" in plan:
+                summary["status"] = f"failed: {plan['error']}"
+            elif not plan["remove"] and not plan["install"]:
+                summary["status"] = "unchanged"
+            elif dry_run:
+                summary["status"] = "would change"
+            else:
+                with tempfile.TemporaryDirectory(prefix="kalla_billa_") as work:
+                    files = []
+                    if plan["install"]:
+                        files.append(os.path.join(work, plan["install"]))
+                        with open(files[0], "w", newline="\n") as f:
+                            f.write(new["pem"])
+                    runs = phssl.install_files(files, serial, log=quiet, runs=[], transfer=transfer, live=live,
+                                               remove=plan["remove"])
+                    summary["status"] = verify_device(serial, plan, files, runs)
+    except phssl.DeviceTimeout:
+        summary["status"] = "timeout"
+    except phssl.DeviceCancelled:
+        summary["status"] = "cancelled"
+    except Exception as e:
+        summary["status"] = f"error: {e}"
+    summary["seconds"] = round(time.monotonic() - start, 3)
+    return summary
+
+
+def verify_device(serial, plan, files, runs):
+    """Check the script's report, then read back digests: removed names gone, new file identical"""
+    statuses = dict(phssl.removal_statuses(runs), **phssl.file_statuses(runs))
+    failed = [f"{name} {status}" for name, status in statuses.items() if status not in ("installed", "removed")]
+    if failed:
+        return f"failed: {failed[0]}"
+    names = sorted(set(plan["remove"]) | ({plan["install"]} if plan["install"] else set()))
+    store = "apex" if plan["store"] == phssl.APEX_CACERTS_DIR else "system"
+    digests = phssl.store_digests(serial, names, store)
+    for file in files:
+        with open(file, "rb") as f:
+            if digests.pop(os.path.basename(file), None) != hashlib.sha256(f.read()).hexdigest():
+                return f"failed: {os.path.basename(file)} missing or different after install"
+    if digests:
+        return f"failed: {sorted(digests)[0]} still present"
+    if plan["install"]:
+        return "rotated" if plan["remove"] else "installed"
+    return "removed"
+
+
+def run_fleet(serials, targets, new=None, dry_run=False, workers=8, timeout=120, transfer="tar", live=False,
+              on_result=None):
+    """Remove/rotate on every serial at once; returns per-device summaries sorted by serial"""
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(rotate_device, serial, targets, new, dry_run, timeout, transfer, live)
+                   for serial in serials]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+            if on_result:
+                on_result(results[-1])
+    return sorted(results, key=lambda summary: summary["serial"])
+
+
+def print_result(summary):
+    ok = summary["status"] in OK_STATUSES
+    changes = [f"-{name}" for name in summary["remove"]] + ([f"+{summary['install']}"] if summary["install"] else [])
+    if summary.get("present"):
+        changes.append(f"={summary['present']}")
+    print((Fore.GREEN + "✓" if ok else Fore.RED + "✗") + f" {summary['serial']}: {summary['status']}"
+          + (f" ({' '.join(changes)})" if changes else "") + Style.RESET_ALL)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Remove CA certificates from devices, or rotate one for another")
+    parser.add_argument("command", choices=["remove", "rotate"],
+                        help="remove TARGET...; rotate OLD NEW_CERT")
+    parser.add_argument("terms", nargs="+", help="targets: <hash>, <hash>.N, SHA-256 fingerprint or certificate file; "
+                                                 "rotate takes the replacement DER/PEM file last")
+    parser.add_argument("-s", "--serial", action="append", help="target this device serial (repeatable)")
+    parser.add_argument("--all", action="store_true", help="target every connected device")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--workers", type=int, default=8, help="devices handled in parallel (default: 8)")
+    parser.add_argument("--timeout", type=float, default=120, help="overall seconds allowed per device (default: 120)")
+    parser.add_argument("--transfer", choices=["sync", "tar"], default="tar")
+    parser.add_argument("--live", action="store_true", help="use a tmpfs overlay where /system is read-only")
+    parser.add_argument("--json", action="store_true", help="print the per-device results as JSON")
+    args = parser.parse_args(argv)
+    if args.command == "rotate" and len(args.terms) < 2:
+        parser.error("rotate takes OLD... NEW_CERT")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    olds = args.terms[:-1] if args.command == "rotate" else args.terms
+    try:
+        targets = [resolve_target(spec) for spec in olds]
+        new = None
+        if args.command == "rotate":
+            with open(args.terms[-1], "rb") as f:
+                data = f.read()
+            new = dict(cert.certificate_info(data), pem=cert.convert_bytes(data)[1])
+    except (OSError, ValueError) as e:
+        print(Fore.RED + str(e) + Style.RESET_ALL)
+        return pipeline.EXIT_USAGE
+    if not phssl.check_adb_installed():
+        return pipeline.EXIT_NO_DEVICES
+    serials, error = pipeline.select_serials(args.serial, args.all)
+    if error:
+        print(Fore.RED + error + Style.RESET_ALL)
+        return pipeline.EXIT_NO_DEVICES
+
+    results = run_fleet(serials, targets, new, args.dry_run, args.workers, args.timeout, args.transfer, args.live,
+                        on_result=None if args.json else print_result)
+    if args.json:
+        print(json.dumps(results, indent=1))
+    elif any(summary["status"] in DONE_STATUSES for summary in results):
+        print(Fore.YELLOW + "Apps that already loaded the old CA keep trusting it until they restart." + Style.RESET_ALL)
+    failed = [s for s in results if s["status"] not in OK_STATUSES]
+    return pipeline.EXIT_FAILED if failed else pipeline.EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
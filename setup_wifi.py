@@ -1,91 +1,106 @@
-import subprocess
-import socket
 import sys
+import asyncio
+import argparse
+import adbclient
+import adbasync
+import wireless
 
-def adb_shell(command, device=None):
-    """Execute ADB command on specific device"""
-    cmd = ["adb"]
-    if device:
-        cmd.extend(["-s", device])
-    cmd.extend(["shell", command])
-    
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.stdout.strip()
+async def adb_shell(command, device=None):
+    """Execute ADB command on specific device; returns (exit status, stripped stdout)"""
+    result = await adbasync.run(["shell", command], device, op="settings")
+    return result.returncode, result.stdout.strip()
 
 def get_devices():
     """Get list of connected devices"""
-    result = subprocess.run(["adb", "devices"], capture_output=True, text=True)
-    devices = []
-    for line in result.stdout.split('\n')[1:]:
-        if line.strip() and '\tdevice' in line:
-            devices.append(line.split('\t')[0])
-    return devices
+    return [serial for serial, state in adbclient.list_devices() if state == 'device']
 
 def get_ipv4_address():
-    """Get local IP address"""
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            s.connect(("8.8.8.8", 80))
-            return s.getsockname()[0]
-    except:
-        return None
+    """Get local IP address (read from the network interfaces, so it works offline)"""
+    return wireless.primary_address()
 
-def set_wifi_proxy(device, ip, port):
-    """Set proxy on specific device"""
+async def set_wifi_proxy(device, ip, port):
+    """Set proxy on specific device with one shell call and read http_proxy back"""
     commands = [
         f"settings put global http_proxy {ip}:{port}",
         f"settings put global global_http_proxy_host {ip}",
         f"settings put global global_http_proxy_port {port}"
     ]
     
-    for cmd in commands:
-        result = adb_shell(cmd, device)
-        if "Exception" in result:
-            return False
-    return True
+    returncode, output = await adb_shell(" && ".join(commands) + "; settings get global http_proxy", device)
+    return returncode == 0 and output.splitlines()[-1:] == [f"{ip}:{port}"]
 
-def clear_wifi_proxy(device):
-    """Remove proxy settings"""
+async def clear_wifi_proxy(device):
+    """Remove proxy settings with one shell call and check http_proxy is cleared"""
     commands = [
         "settings put global http_proxy :0",
         "settings put global global_http_proxy_host ''",
         "settings put global global_http_proxy_port ''"
     ]
     
-    for cmd in commands:
-        adb_shell(cmd, device)
-    return True
+    returncode, output = await adb_shell("; ".join(commands) + "; settings get global http_proxy", device)
+    # No output means the shell never got to read it back (e.g. the device went away), not cleared
+    return returncode == 0 and output.splitlines()[-1:] in ([":0"], ["null"])
+
+async def apply_proxy(devices, action, ip, port, workers=16, timeout=30, log=print):
+    """Set or clear the proxy on every device at once; returns {device: True/False}"""
+    async def job(device):
+        if action == 's':
+            ok = await set_wifi_proxy(device, ip, port)
+            log(f"[{device}] Proxy set to {ip}:{port}" if ok else f"[{device}] Failed to set proxy")
+        else:
+            ok = await clear_wifi_proxy(device)
+            log(f"[{device}] Proxy cleared" if ok else f"[{device}] Failed to clear proxy")
+        return ok
+
+    results = await adbasync.run_devices(devices, job, limit=workers, budget=timeout)
+    for device, ok in results.items():
+        if isinstance(ok, BaseException):
+            log(f"[{device}] Failed: {type(ok).__name__} {ok}".rstrip())
+    return {device: ok is True for device, ok in results.items()}
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Set or clear the Wi-Fi HTTP proxy on connected devices")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--set", dest="action", action="store_const", const="s", help="set the proxy (no prompts)")
+    action.add_argument("--clear", dest="action", action="store_const", const="c", help="clear the proxy (no prompts)")
+    parser.add_argument("--host", help="proxy host (default: this computer's IP)")
+    parser.add_argument("--port", help="proxy port (default: 5492)")
+    parser.add_argument("-s", "--serial", action="append", help="only this device serial (repeatable)")
+    parser.add_argument("--workers", type=int, default=16, help="devices configured at once (default: 16)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds allowed per device (default: 30)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     # Get computer IP
-    ip = get_ipv4_address()
+    ip = args.host or get_ipv4_address()
     if not ip:
         print("Error: Could not get IP address")
-        return
+        return 2
     
     # Get connected devices
     devices = get_devices()
+    if args.serial:
+        devices = [device for device in devices if device in args.serial]
     if not devices:
         print("Error: No Android devices connected")
-        return
+        return 2
     
     print(f"Found {len(devices)} device(s): {devices}")
     
-    # Get user choice
-    port = input("Enter proxy port (default 5492): ").strip() or "5492"
-    action = input("Set (s) or Clear (c) proxy? ").strip().lower()
+    # Get user choice unless given on the command line
+    if args.action:
+        port = args.port or "5492"
+        action = args.action
+    else:
+        port = args.port or input("Enter proxy port (default 5492): ").strip() or "5492"
+        action = input("Set (s) or Clear (c) proxy? ").strip().lower()
+        if action not in ('s', 'c'):
+            return 2
     
-    for device in devices:
-        if action == 's':
-            if set_wifi_proxy(device, ip, port):
-                print(f"[{device}] Proxy set to {ip}:{port}")
-            else:
-                print(f"[{device}] Failed to set proxy")
-        elif action == 'c':
-            if clear_wifi_proxy(device):
-                print(f"[{device}] Proxy cleared")
-            else:
-                print(f"[{device}] Failed to clear proxy")
+    results = asyncio.run(apply_proxy(devices, action, ip, port, args.workers, args.timeout))
+    return 0 if all(results.values()) else 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
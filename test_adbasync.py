@@ -0,0 +1,78 @@
+import struct
+import asyncio
+import pytest
+import adbclient
+import adbasync
+import fakeadb
+
+V1, V2 = "FAKE001", "FAKE002"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A client for a fake server with one shell-v1-only device and one shell v2 device"""
+    server = fakeadb.FakeAdbServer(fakeadb.make_fleet(2, failures={"shell-v1": 1})).start()
+    client = adbclient.AdbClient(port=server.port)
+    monkeypatch.setattr(adbclient, "_client", client)
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def packet(packet_id, data=b""):
+    return struct.pack("<BI", packet_id, len(data)) + data
+
+
+def test_v2_reader_handles_any_split():
+    stream = (packet(adbclient.SHELL_STDOUT, b"out") + packet(adbclient.SHELL_STDERR, b"err") +
+              packet(adbclient.SHELL_STDOUT, b"put") + packet(adbclient.SHELL_EXIT, b"\x03"))
+    reader = adbclient.ShellV2Reader()
+    for i in range(len(stream)):
+        reader.feed(stream[i:i + 1])
+    assert reader.done and reader.result() == (3, b"output", b"err")
+
+
+def test_v2_reader_without_exit_packet():
+    reader = adbclient.ShellV2Reader()
+    reader.feed(packet(adbclient.SHELL_STDOUT, b"partial") + packet(adbclient.SHELL_STDOUT)[:3])
+    assert not reader.done and reader.result() == (255, b"partial", b"")
+
+
+def test_stdin_packets_chunked_and_closed():
+    packets = list(adbclient.shell_stdin_packets(b"x" * (adbclient.SYNC_CHUNK + 1)))
+    assert [struct.unpack("<BI", p[:5]) for p in packets] == [
+        (adbclient.SHELL_STDIN, adbclient.SYNC_CHUNK), (adbclient.SHELL_STDIN, 1), (adbclient.SHELL_CLOSE_STDIN, 0)]
+    assert list(adbclient.shell_stdin_packets(None)) == [packet(adbclient.SHELL_CLOSE_STDIN)]
+
+
+def test_shell_v1_marker():
+    service = adbclient.shell_service("id", {"cmd"})
+    assert service.startswith("shell:id; ")
+    assert adbclient.parse_shell_v1(b"uid=0\n\x01KB_RC=7\n") == (7, b"uid=0\n", b"")
+    assert adbclient.parse_shell_v1(b"cut off") == (255, b"cut off", b"")
+    assert adbclient.shell_service("id", {"shell_v2"}) == "shell,v2,raw:id"
+
+
+@pytest.mark.parametrize("serial, command, expected", [
+    (V2, "echo out; echo err >&2; false", (1, b"out\n", b"err\n")),
+    # v1 has no stderr channel, and the exit status comes from the marker line
+    (V1, "echo out; false", (1, b"out\n", b"")),
+    (V1, "echo out", (0, b"out\n", b"")),
+])
+def test_blocking_and_async_shell_agree(client, serial, command, expected):
+    assert client.shell(serial, command) == expected
+    assert asyncio.run(adbasync.shell(serial, command)) == expected
+
+
+def test_stdin_over_v2(client):
+    data = bytes(range(256)) * 1000
+    assert client.shell(V2, "cat", stdin=data) == (0, data, b"")
+    assert asyncio.run(adbasync.shell(V2, "cat", stdin=data)) == (0, data, b"")
+
+
+def test_stdin_over_v1_fails_before_running(client):
+    with pytest.raises(adbclient.AdbError):
+        client.shell(V1, "cat", stdin=b"data")
+    with pytest.raises(adbclient.AdbError):
+        asyncio.run(adbasync.shell(V1, "cat", stdin=b"data"))
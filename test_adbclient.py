@@ -0,0 +1,122 @@
+import stat
+import pytest
+import adbclient
+import fakeadb
+
+
+@pytest.fixture
+def fleet():
+    """A fake server with three devices and a client for it"""
+    devices = fakeadb.make_fleet(3, failures={"shell-v1": 1, "offline": 1})
+    server = fakeadb.FakeAdbServer(devices).start()
+    client = adbclient.AdbClient(port=server.port)
+    yield server, client, {device.serial: device for device in devices}
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_features_not_remembered_while_unreachable(fleet):
+    server, client, devices = fleet
+    # FAKE002 is offline: the server answers FAIL
+    assert client.features("FAKE002") == set()
+    devices["FAKE002"].state = "device"
+    assert "shell_v2" in client.features("FAKE002")
+
+
+def test_features_forgotten_when_device_leaves(fleet):
+    server, client, devices = fleet
+    assert "shell_v2" in client.features("FAKE003")
+    devices["FAKE003"].state = "offline"
+    client.devices()
+    devices["FAKE003"].features = "cmd"
+    devices["FAKE003"].state = "device"
+    assert client.features("FAKE003") == {"cmd"}
+
+
+@pytest.fixture
+def single():
+    """A fake server with one shell v2 device, for transport-any"""
+    server = fakeadb.FakeAdbServer(fakeadb.make_fleet(1, prefix="ONLY")).start()
+    client = adbclient.AdbClient(port=server.port)
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_devices_lists_every_state(fleet):
+    server, client, devices = fleet
+    assert client.devices() == [("FAKE001", "device"), ("FAKE002", "offline"), ("FAKE003", "device")]
+
+
+def test_transport_by_serial(fleet):
+    server, client, devices = fleet
+    devices["FAKE003"].props["ro.serialno"] = "FAKE003"
+    assert client.shell("FAKE003", "getprop ro.serialno") == (0, b"FAKE003\n", b"")
+
+
+@pytest.mark.parametrize("serial, reason", [
+    (None, "more than one device"),
+    ("FAKE002", "device offline"),
+    ("NOSUCH", "not found"),
+])
+def test_transport_errors(fleet, serial, reason):
+    server, client, devices = fleet
+    with pytest.raises(adbclient.AdbError, match=reason):
+        client.shell(serial, "true")
+
+
+def test_transport_any_with_one_device(single):
+    assert single.shell(None, "echo any") == (0, b"any\n", b"")
+
+
+@pytest.mark.parametrize("command, expected", [
+    ("true", (0, b"", b"")),
+    ("echo out; echo err >&2; exit 3", (3, b"out\n", b"err\n")),
+    ("false", (1, b"", b"")),
+])
+def test_shell_v2_exit_codes_and_streams(fleet, command, expected):
+    server, client, devices = fleet
+    assert client.shell("FAKE003", command) == expected
+
+
+def test_shell_v1_exit_code_from_marker(fleet):
+    server, client, devices = fleet
+    assert client.shell("FAKE001", "echo v1; false") == (1, b"v1\n", b"")
+    assert client.shell("FAKE001", "echo v1") == (0, b"v1\n", b"")
+
+
+def test_shell_v2_stdin(fleet):
+    server, client, devices = fleet
+    data = b"line one\nline two\n" * 10000
+    assert client.shell("FAKE003", "cat", stdin=data) == (0, data, b"")
+
+
+def test_shell_v2_close_stdin_without_input(fleet):
+    server, client, devices = fleet
+    # cat only returns once stdin has been closed
+    assert client.shell("FAKE003", "cat") == (0, b"", b"")
+
+
+def test_sync_stat_and_send(fleet):
+    server, client, devices = fleet
+    remote = "/data/local/tmp/pushed.0"
+    assert client.stat("FAKE003", remote)[0] == 0
+    data = bytes(range(256)) * 600
+    client.push_bytes("FAKE003", data, remote, mode=0o644, mtime=1700000000)
+    assert devices["FAKE003"].files[remote] == data
+    mode, size, mtime = client.stat("FAKE003", remote)
+    assert stat.S_ISREG(mode) and size == len(data)
+    assert stat.S_ISDIR(client.stat("FAKE003", "/data/local/tmp")[0])
+
+
+def test_sync_send_reuses_the_session(fleet, tmp_path):
+    server, client, devices = fleet
+    local = tmp_path / "a.0"
+    local.write_bytes(b"certificate")
+    assert client.push("FAKE003", [str(local)], "/data/local/tmp/") == len(b"certificate")
+    services = devices["FAKE003"].counters["services"]
+    client.push_bytes("FAKE003", b"again", "/data/local/tmp/b.0")
+    assert devices["FAKE003"].counters["services"] == services
+    assert devices["FAKE003"].files["/data/local/tmp/a.0"] == b"certificate"
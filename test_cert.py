@@ -0,0 +1,141 @@
+import os
+import shutil
+import hashlib
+import subprocess
+import pytest
+import cert
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BURP = os.path.join(HERE, "burp.der")
+
+requires_openssl = pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl is not installed")
+
+# Subjects that exercise the name encoding: plain, UTF-8, multi-valued RDNs, attributes without a short name
+SUBJECTS = {
+    "plain": "/CN=Test Root CA",
+    "full": "/C=DE/ST=Berlin/L=Berlin/O=Example GmbH/OU=Security/CN=Example Root",
+    "utf8": "/C=FR/O=Société Générale/CN=Racine Ünïcödé",
+    "multi-rdn": "/O=Example/CN=Proxy CA+OU=Interception",
+    "email": "/CN=Mail CA/emailAddress=ca@example.com",
+    "serial-number": "/serialNumber=42/CN=Numbered CA",
+}
+
+
+def openssl(*args, input=None):
+    return subprocess.run(["openssl", *args], input=input, capture_output=True, check=True).stdout
+
+
+def make_cert(directory, name, subject, extensions=(), der=False, days=30):
+    """Self-signed P-256 certificate; extensions are -addext values, or None for a v1 certificate"""
+    key = os.path.join(directory, f"{name}.key")
+    path = os.path.join(directory, f"{name}.{'der' if der else 'pem'}")
+    form = ["-outform", "DER"] if der else []
+    if extensions is None:
+        csr = os.path.join(directory, f"{name}.csr")
+        openssl("req", "-new", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256", "-nodes", "-utf8",
+                "-keyout", key, "-subj", subject, "-out", csr)
+        openssl("x509", "-req", "-in", csr, "-signkey", key, "-days", str(days), *form, "-out", path)
+    else:
+        addext = [arg for value in extensions for arg in ("-addext", value)]
+        openssl("req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256", "-nodes", "-utf8",
+                "-keyout", key, "-subj", subject, "-days", str(days), *addext, *form, "-out", path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def generated(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is not installed")
+    directory = str(tmp_path_factory.mktemp("certs"))
+    return {name: make_cert(directory, name, subject, der=name == "full") for name, subject in SUBJECTS.items()}
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def python_hash(path):
+    return cert.subject_hash_old(cert.parse_certificate(cert.load_certificate_der(path))["subject_der"])
+
+
+@requires_openssl
+def test_burp_hash_matches_openssl():
+    assert python_hash(BURP) == cert.openssl_subject_hash(BURP)
+
+
+@requires_openssl
+@pytest.mark.parametrize("name", sorted(SUBJECTS))
+def test_generated_hash_matches_openssl(generated, name):
+    assert python_hash(generated[name]) == cert.openssl_subject_hash(generated[name])
+
+
+@requires_openssl
+def test_check_against_openssl(generated):
+    assert cert.check_against_openssl([BURP] + sorted(generated.values()))
+
+
+def test_der_and_pem_hash_alike(tmp_path):
+    pem = tmp_path / "burp.pem"
+    pem.write_text(cert.der_to_pem(read(BURP)))
+    assert cert.load_certificate_der(str(pem)) == read(BURP)
+    assert python_hash(str(pem)) == python_hash(BURP)
+
+
+def test_parse_rejects_garbage():
+    with pytest.raises(ValueError):
+        cert.parse_certificate(b"not a certificate")
+
+
+def test_certificate_info_rejects_garbage():
+    with pytest.raises(ValueError):
+        cert.certificate_info(b"not a certificate")
+    with pytest.raises(ValueError):
+        cert.certificate_info(b"-----BEGIN CERTIFICATE-----\n!!!!\n-----END CERTIFICATE-----\n")
+
+
+@requires_openssl
+def test_certificate_info_matches_openssl(generated):
+    path = generated["plain"]
+    info = cert.certificate_info(read(path))
+    der = openssl("x509", "-in", path, "-outform", "DER")
+    assert info["hash"] == cert.openssl_subject_hash(path)
+    assert info["fingerprint"] == hashlib.sha256(der).hexdigest()
+    assert info["subject"] == info["issuer"] == "CN=Test Root CA"
+    serial = openssl("x509", "-in", path, "-noout", "-serial").decode().strip().split("=")[1]
+    assert int(info["serial"], 16) == int(serial, 16)
+    assert info["not_before"] < info["not_after"]
+    assert len(info["not_after"]) == 20 and info["not_after"].endswith("Z")
+
+
+@requires_openssl
+def test_certificate_info_names(generated):
+    assert cert.certificate_info(read(generated["utf8"]))["subject"] == \
+        "C=FR, O=Société Générale, CN=Racine Ünïcödé"
+    assert cert.certificate_info(read(generated["email"]))["subject"] == "CN=Mail CA, emailAddress=ca@example.com"
+    # Attributes without a short name keep their dotted OID
+    assert cert.certificate_info(read(generated["serial-number"]))["subject"] == "2.5.4.5=42, CN=Numbered CA"
+
+
+@requires_openssl
+def test_certificate_constraints(tmp_path):
+    directory = str(tmp_path)
+    ca = make_cert(directory, "ca", "/CN=CA", ["basicConstraints=critical,CA:TRUE,pathlen:1",
+                                               "keyUsage=critical,keyCertSign,cRLSign"])
+    leaf = make_cert(directory, "leaf", "/CN=Leaf", ["basicConstraints=critical,CA:FALSE",
+                                                     "keyUsage=digitalSignature"])
+    v1 = make_cert(directory, "v1", "/CN=Old CA", None)
+    constraints = cert.certificate_constraints(read(ca))
+    assert (constraints["version"], constraints["ca"], constraints["path_len"], constraints["key_cert_sign"]) == \
+        (3, True, 1, True)
+    assert set(constraints["critical"]) == {"2.5.29.19", "2.5.29.15"}
+    constraints = cert.certificate_constraints(read(leaf))
+    assert (constraints["ca"], constraints["path_len"], constraints["key_cert_sign"]) == (False, None, False)
+    constraints = cert.certificate_constraints(read(v1))
+    assert (constraints["version"], constraints["ca"], constraints["key_cert_sign"]) == (1, None, None)
+
+
+def test_burp_constraints():
+    constraints = cert.certificate_constraints(read(BURP))
+    assert constraints["ca"] is True
+    assert constraints["key_cert_sign"] in (True, None)
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import hashlib
+import cert
+import certcache
+
+PEM = "-----BEGIN CERTIFICATE-----\nAAAA\n-----END CERTIFICATE-----\n"
+
+
+def fill(cache, count):
+    """count entries, least recently used first"""
+    now = time.time()
+    keys = [certcache.CertCache.key_for(str(i).encode()) for i in range(count)]
+    for i, key in enumerate(keys):
+        cache.put(key, f"{i:08x}", PEM)
+        cache.index[key]["last_used"] = now - count + i
+    return keys
+
+
+def test_save_enforces_max_entries(tmp_path):
+    cache = certcache.CertCache(str(tmp_path), max_entries=3)
+    keys = fill(cache, 5)
+    cache.save()
+    assert sorted(cache.index) == sorted(keys[2:])
+    assert sorted(os.listdir(cache.blob_dir)) == sorted(f"{key}.0" for key in keys[2:])
+    assert sorted(certcache.CertCache(str(tmp_path)).index) == sorted(keys[2:])
+
+
+def test_save_enforces_max_bytes(tmp_path):
+    cache = certcache.CertCache(str(tmp_path), max_bytes=len(PEM) * 2)
+    keys = fill(cache, 4)
+    cache.save()
+    assert sorted(cache.index) == sorted(keys[2:])
+
+
+def test_save_within_limits_keeps_everything(tmp_path):
+    cache = certcache.CertCache(str(tmp_path))
+    keys = fill(cache, 4)
+    cache.save()
+    assert sorted(certcache.CertCache(str(tmp_path)).index) == sorted(keys)
+    assert cache.get(keys[0])[0] == "00000000"
+
+
+def test_prune_spares_fresh_orphans_and_partial_writes(tmp_path):
+    cache = certcache.CertCache(str(tmp_path))
+    keys = fill(cache, 1)
+    old, fresh = (os.path.join(cache.blob_dir, f"{name * 64}.0") for name in "ab")
+    partial = os.path.join(cache.blob_dir, f"{'c' * 64}.0.tmp")
+    for path in (old, fresh, partial):
+        with open(path, "w") as f:
+            f.write(PEM)
+    stale = time.time() - certcache.ORPHAN_GRACE_SECONDS - 60
+    os.utime(old, (stale, stale))
+    os.utime(partial, (stale, stale))
+    cache.prune()
+    assert sorted(os.listdir(cache.blob_dir)) == sorted([f"{keys[0]}.0", os.path.basename(fresh),
+                                                         os.path.basename(partial)])
+
+
+def test_single_conversion_caches_the_fingerprint(tmp_path):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "burp.der"), "rb") as f:
+        data = f.read()
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "burp.der").write_bytes(data)
+    cert.convert_certificate(str(source / "burp.der"), str(tmp_path), cache=certcache.CertCache(str(tmp_path / "cache")))
+    # The batch run is answered from the entry the single conversion cached
+    manifest, manifest_path = cert.batch_convert(str(source), str(tmp_path / "out"),
+                                                 cache=certcache.CertCache(str(tmp_path / "cache")))
+    assert manifest["files"][0]["cached"] is True
+    with open(manifest_path) as f:
+        assert json.load(f)["files"][0]["fingerprint"] == hashlib.sha256(data).hexdigest()
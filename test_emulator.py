@@ -0,0 +1,131 @@
+import os
+import pytest
+import adbclient
+import cert
+import devprofile
+import emulator
+import fakeadb
+import phssl
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """A fake server with nothing attached, the adb layer pointed at it and a throwaway profile cache"""
+    server = fakeadb.FakeAdbServer([], reboot_seconds=0.1).start()
+    client = adbclient.AdbClient(port=server.port)
+    monkeypatch.setattr(adbclient, "_client", client)
+    monkeypatch.setattr(phssl, "profiles", devprofile.DeviceProfiles(str(tmp_path / "cache")))
+    yield server
+    client.close()
+    for device in list(server.devices.values()):
+        console = getattr(device, "console", None)
+        if console is not None:
+            console.shutdown()
+            console.server_close()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def files(tmp_path):
+    """burp.der as an installable <hash>.0"""
+    with open(os.path.join(HERE, "burp.der"), "rb") as f:
+        name, pem = cert.convert_bytes(f.read())
+    path = tmp_path / f"{name}.0"
+    path.write_text(pem)
+    return [str(path)]
+
+
+def fail(monkeypatch, device, verb):
+    """Make the console answer KO to 'avd snapshot <verb>'"""
+    command = device.console.command
+    monkeypatch.setattr(device.console, "command",
+                        lambda words: "KO: broken\n" if words[2:3] == [verb] else command(words))
+
+
+def install(device, files, **options):
+    return emulator.install_on_emulator(device.serial, files, timeout=60, **options)
+
+
+@pytest.mark.parametrize("serial, port", [
+    ("emulator-5554", 5554),
+    ("emulator-5554x", None),
+    ("FAKE001", None),
+    ("127.0.0.1:5555", None),
+    (None, None),
+])
+def test_console_port(serial, port):
+    assert emulator.console_port(serial) == port
+
+
+def test_is_emulator(server):
+    server.attach(fakeadb.FakeDevice("127.0.0.1:5555", props={"ro.kernel.qemu": "1"}))
+    server.attach(fakeadb.FakeDevice("192.168.1.20:5555"))
+    assert emulator.is_emulator("emulator-5554")
+    assert emulator.is_emulator("127.0.0.1:5555")
+    assert not emulator.is_emulator("192.168.1.20:5555")
+    # USB serials are never asked
+    assert not emulator.is_emulator("FAKE001")
+
+
+def test_snapshot_name_ignores_order(tmp_path):
+    paths = []
+    for name in ("9a5ba575.0", "be9135cf.0", "16f22443.0"):
+        (tmp_path / name).write_text(name)
+        paths.append(str(tmp_path / name))
+    name = emulator.snapshot_name(paths)
+    assert name.startswith(emulator.SNAPSHOT_PREFIX)
+    assert emulator.snapshot_name(paths[::-1]) == name
+    (tmp_path / "be9135cf.0").write_text("changed")
+    assert emulator.snapshot_name(paths) != name
+
+
+def test_save_after_install_then_load_when_missing(server, files):
+    first, second = fakeadb.make_emulators(server, 2)
+    summary = install(first, files)
+    assert summary["status"].startswith("installed") and summary["status"].endswith(", snapshot saved")
+    assert summary["emulator"]["action"] == "saved" and summary["emulator"]["avd"] == "Fake_API_30"
+    summary = install(second, files)
+    assert summary["status"] == "installed, snapshot"
+    assert summary["emulator"]["action"] == "loaded" and second.console.stats["loaded"] == 1
+    # Already there: nothing to load or save
+    summary = install(second, files)
+    assert summary["emulator"]["action"] == "none" and second.console.stats["loaded"] == 1
+
+
+def test_running_emulator_is_not_loaded(server, files):
+    first, second, third = fakeadb.make_emulators(server, 3)
+    install(first, files)
+    second.booted_at -= 3600
+    summary = install(second, files)
+    assert summary["emulator"]["action"] == "not loaded: emulator in use"
+    assert summary["status"].startswith("installed") and second.console.stats["loaded"] == 0
+    assert emulator.has_files(second.serial, files)
+    third.booted_at -= 3600
+    assert install(third, files, load_snapshot="always")["emulator"]["action"] == "loaded"
+
+
+def test_never_load(server, files):
+    first, second = fakeadb.make_emulators(server, 2)
+    install(first, files)
+    summary = install(second, files, load_snapshot="never")
+    assert summary["emulator"]["action"] == "not loaded: emulator in use"
+    assert second.console.stats["loaded"] == 0 and emulator.has_files(second.serial, files)
+
+
+@pytest.mark.parametrize("verb, action", [
+    ("list", "snapshot list failed: broken"),
+    ("load", "load failed: broken"),
+    ("save", "save failed: broken"),
+])
+def test_console_failures_fall_back_to_live_install(server, files, monkeypatch, verb, action):
+    first, second = fakeadb.make_emulators(server, 2)
+    if verb != "save":
+        install(first, files)
+    fail(monkeypatch, second, verb)
+    summary = install(second, files)
+    assert summary["emulator"]["action"] == action
+    assert summary["status"].startswith("installed") and "snapshot" not in summary["status"]
+    assert emulator.has_files(second.serial, files)
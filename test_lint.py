@@ -0,0 +1,89 @@
+import os
+from datetime import datetime, timezone
+import pytest
+import cert
+import lint
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def facts(**changes):
+    """A valid CA certificate's facts, with changes"""
+    base = {"hash": "9a5ba575", "fingerprint": "ab" * 32, "subject": "CN=Test CA", "issuer": "CN=Test CA",
+            "not_before": "2020-01-01T00:00:00Z", "not_after": "2030-01-01T00:00:00Z", "serial": "01",
+            "version": 3, "ca": True, "path_len": None, "key_cert_sign": True, "critical": [], "count": 1}
+    base.update(changes)
+    return base
+
+
+def codes(findings, level=None):
+    return [code for found_level, code, _ in findings if level in (None, found_level)]
+
+
+def test_clean_certificate():
+    assert lint.check_facts(facts(), "9a5ba575.0", NOW) == []
+
+
+@pytest.mark.parametrize("changes, level, code", [
+    ({"not_after": "2025-12-31T23:59:59Z"}, "error", "expired"),
+    ({"not_before": "2026-01-02T00:00:00Z"}, "error", "not-yet-valid"),
+    ({"not_after": "2026-01-15T00:00:00Z"}, "warning", "expiring"),
+    ({"ca": False}, "error", "not-ca"),
+    ({"ca": None}, "warning", "no-basic-constraints"),
+    ({"key_cert_sign": False}, "error", "key-usage"),
+    ({"count": 3}, "warning", "bundle"),
+])
+def test_single_finding(changes, level, code):
+    findings = lint.check_facts(facts(**changes), None, NOW)
+    assert [(found_level, found_code) for found_level, found_code, _ in findings] == [(level, code)]
+
+
+def test_v1_certificate_message():
+    (_, code, message), = lint.check_facts(facts(ca=None, version=1), None, NOW)
+    assert code == "no-basic-constraints" and message.startswith("v1 certificate")
+
+
+def test_missing_key_usage_is_fine():
+    assert lint.check_facts(facts(key_cert_sign=None), None, NOW) == []
+
+
+def test_warn_days():
+    expiring = facts(not_after="2026-03-01T00:00:00Z")
+    assert codes(lint.check_facts(expiring, None, NOW)) == []
+    assert codes(lint.check_facts(expiring, None, NOW, warn_days=90)) == ["expiring"]
+
+
+def test_name_mismatch():
+    assert codes(lint.check_facts(facts(), "12345678.0", NOW)) == ["name-mismatch"]
+    assert codes(lint.check_facts(facts(), "9a5ba575.1", NOW)) == []
+    # Inputs that get converted are named by their hash, whatever their file name
+    assert codes(lint.check_facts(facts(), "12345678.pem", NOW)) == []
+
+
+def test_parse_error():
+    findings = lint.check_facts(lint.certificate_facts(b"garbage"), "garbage.der", NOW)
+    assert codes(findings) == ["parse"]
+
+
+def test_certificate_facts_of_burp():
+    with open(os.path.join(HERE, "burp.der"), "rb") as f:
+        data = f.read()
+    found = lint.certificate_facts(data)
+    assert found["hash"] == cert.convert_bytes(data)[0] == "9a5ba575"
+    assert found["count"] == 1 and found["ca"] is True
+    assert codes(lint.check_facts(found, "9a5ba575.0", NOW), "error") == []
+
+
+def test_check_target():
+    present = {"9a5ba575.0": {"fingerprint": "ab" * 32, "subject": "CN=Test CA"}}
+    assert codes(lint.check_target("9a5ba575.0", facts(), present)) == ["present"]
+    other = {"9a5ba575.0": {"fingerprint": "cd" * 32, "subject": "CN=Other"}}
+    assert codes(lint.check_target("9a5ba575.0", facts(), other)) == ["replaces"]
+    assert codes(lint.check_target("9a5ba575.1", facts(), other)) == ["duplicate-subject"]
+    assert lint.check_target("9a5ba575.0", facts(), {}) == []
+
+
+def test_check_bytes_raises_on_errors():
+    with pytest.raises(ValueError):
+        lint.check_bytes(b"garbage", "upload")
@@ -0,0 +1,48 @@
+import os
+import pytest
+import adbclient
+import cert
+import devprofile
+import fakeadb
+import phssl
+import pipeline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BURP = os.path.join(HERE, "burp.der")
+# A different CA that sits under burp's <hash>.0 on the device
+OTHER = "-----BEGIN CERTIFICATE-----\nb3RoZXI=\n-----END CERTIFICATE-----\n"
+
+
+@pytest.fixture
+def device(monkeypatch, tmp_path):
+    """One fake phone, with the adb layer pointed at it and a throwaway profile cache"""
+    server = fakeadb.FakeAdbServer(fakeadb.make_fleet(1)).start()
+    client = adbclient.AdbClient(port=server.port)
+    monkeypatch.setattr(adbclient, "_client", client)
+    monkeypatch.setattr(phssl, "profiles", devprofile.DeviceProfiles(str(tmp_path)))
+    yield server.devices["FAKE001"]
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def run(serial):
+    return pipeline.run_pipeline(BURP, [serial], check=False, log=lambda message: None)
+
+
+def test_other_ca_under_the_same_name_is_kept(device):
+    with open(BURP, "rb") as f:
+        new_hash, pem = cert.convert_bytes(f.read())
+    taken = f"{phssl.CACERTS_DIR}/{new_hash}.0"
+    device.files[taken] = OTHER.encode()
+    result = run(device.serial)
+    assert result["ok"] and result["devices"][0]["name"] == f"{new_hash}.1"
+    assert device.files[taken] == OTHER.encode()
+    assert device.files[f"{phssl.CACERTS_DIR}/{new_hash}.1"] == pem.encode()
+    again = run(device.serial)["devices"][0]
+    assert (again["status"], again["name"], again["verified"]) == ("installed, unchanged", f"{new_hash}.1", True)
+
+
+def test_free_name_is_used_as_is(device):
+    result = run(device.serial)
+    assert result["ok"] and result["devices"][0]["name"] == result["name"]
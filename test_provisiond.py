@@ -0,0 +1,75 @@
+import os
+import time
+import pytest
+import adbclient
+import adbasync
+import cert
+import devprofile
+import fakeadb
+import phssl
+import provisiond
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def provisioner(monkeypatch, tmp_path):
+    """A provisioner for one fake phone, and the op of every adb call it makes"""
+    server = fakeadb.FakeAdbServer(fakeadb.make_fleet(1)).start()
+    client = adbclient.AdbClient(port=server.port)
+    monkeypatch.setattr(adbclient, "_client", client)
+    monkeypatch.setattr(phssl, "profiles", devprofile.DeviceProfiles(str(tmp_path)))
+    ops = []
+
+    def listener(event):
+        if event.get("type") == "adb" and event["state"] == "start":
+            ops.append(event["op"])
+
+    adbasync.subscribe(listener)
+    provisioner = provisiond.Provisioner(workers=2)
+    yield provisioner, ops
+    provisioner.close()
+    adbasync.unsubscribe(listener)
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def run(provisioner, request):
+    job = provisioner.submit(dict(request, serials="FAKE001"))
+    while provisioner.job(job["id"])["state"] in ("queued", "running"):
+        time.sleep(0.01)
+    return provisioner.job(job["id"])["results"]["FAKE001"]
+
+
+def install(provisioner):
+    with open(os.path.join(HERE, "burp.der"), "rb") as f:
+        return run(provisioner, {"kind": "install", "certificate": cert.convert_bytes(f.read())[1]})
+
+
+def test_cold_device_is_probed(provisioner):
+    provisioner, ops = provisioner
+    assert install(provisioner)["ok"]
+    assert "profile" in ops and "diff" in ops
+
+
+def test_warm_state_replaces_the_install_probes(provisioner):
+    provisioner, ops = provisioner
+    # Nothing to remove, but the task ends with a refresh of the device
+    assert run(provisioner, {"kind": "remove", "targets": ["9a5ba575"]})["status"] == "unchanged"
+    del ops[:]
+    assert install(provisioner)["ok"]
+    # The listing has no 9a5ba575.*: no getprop, no sha256sum
+    assert "profile" not in ops and "diff" not in ops
+    del ops[:]
+    assert install(provisioner)["status"] == "installed, unchanged"
+    assert "profile" not in ops and "diff" in ops
+
+
+def test_stale_state_is_not_used(provisioner):
+    provisioner, ops = provisioner
+    install(provisioner)
+    provisioner.devices["FAKE001"]["refreshed"] -= provisiond.WARM_SECONDS + 1
+    del ops[:]
+    assert install(provisioner)["status"] == "installed, unchanged"
+    assert "profile" in ops
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from colorama import init, Fore, Style
+import adbasync
+
+init()
+
+
+class Tracer:
+    """Listens on the adbasync event bus and keeps every finished record
+
+    Records are adb calls (type "adb"), install steps ("step"), fallback branches
+    ("branch"), device info ("device") and per-install results ("install"). With a
+    path they are also appended to that file as JSON lines, so traces from several
+    runs can be aggregated later.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.run = time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        self.records = []
+        self.lock = threading.Lock()
+        self.file = open(path, "a") if path else None
+
+    def __enter__(self):
+        adbasync.subscribe(self)
+        return self
+
+    def __exit__(self, *exc):
+        adbasync.unsubscribe(self)
+        self.close()
+
+    def __call__(self, event):
+        # Only finished adb calls carry timings; starts are for the progress display
+        if event.get("type") == "adb" and event.get("state") == "start":
+            return
+        record = dict(event, run=self.run, ts=round(time.time(), 3))
+        with self.lock:
+            self.records.append(record)
+            if self.file:
+                self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def load(paths):
+    """Read records from JSON-lines trace files, skipping lines that do not parse"""
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def _stats(values, failures=0):
+    return {"count": len(values), "total": sum(values), "p50": percentile(values, 50),
+            "p95": percentile(values, 95), "max": max(values) if values else 0.0, "failed": failures}
+
+
+def summarize(records):
+    """Aggregate records: adb totals, per-step and per-branch timings keyed by Android version"""
+    android = {}
+    for record in records:
+        if record.get("type") == "device":
+            android[(record.get("run"), record.get("serial"))] = record.get("android") or "?"
+
+    adb = [r for r in records if r.get("type") == "adb"]
+    summary = {
+        "adb": {"calls": len(adb),
+                "seconds": sum(r.get("seconds", 0) for r in adb),
+                "bytes_out": sum(r.get("bytes_out", 0) for r in adb),
+                "bytes_in": sum(r.get("bytes_in", 0) for r in adb),
+                "failed": sum(1 for r in adb if r.get("returncode") not in (0, None)),
+                "timeouts": sum(1 for r in adb if r.get("state") == "timeout")},
+        "installs": {},
+        "steps": {},
+        "branches": {},
+    }
+    steps, branches = {}, {}
+    for record in records:
+        version = android.get((record.get("run"), record.get("serial")), "?")
+        if record.get("type") == "step":
+            steps.setdefault((version, record["step"]), []).append(record.get("seconds", 0))
+        elif record.get("type") == "branch":
+            entry = branches.setdefault((version, record["kind"], record["method"]), ([], [0]))
+            entry[0].append(record.get("seconds", 0))
+            entry[1][0] += 0 if record.get("ok") else 1
+        elif record.get("type") == "install":
+            status = record.get("status", "?")
+            summary["installs"][status] = summary["installs"].get(status, 0) + 1
+    summary["steps"] = {f"{v}|{s}": _stats(values) for (v, s), values in steps.items()}
+    summary["branches"] = {f"{v}|{k}|{m}": _stats(values, failed[0])
+                           for (v, k, m), (values, failed) in branches.items()}
+    return summary
+
+
+def print_summary(summary, limit=None):
+    adb = summary["adb"]
+    print(Fore.CYAN + f"\nadb calls: {adb['calls']} in {adb['seconds']:.2f}s, "
+          f"{adb['bytes_out']} bytes out, {adb['bytes_in']} bytes in, "
+          f"{adb['failed']} non-zero exit(s), {adb['timeouts']} timeout(s)" + Style.RESET_ALL)
+    if summary["installs"]:
+        print(Fore.CYAN + "installs: " + ", ".join(f"{n} {status}" for status, n in sorted(summary["installs"].items()))
+              + Style.RESET_ALL)
+
+    if summary["steps"]:
+        print(Fore.YELLOW + f"\n{'ANDROID':<10}{'STEP':<12}{'N':>5}{'P50':>9}{'P95':>9}{'MAX':>9}" + Style.RESET_ALL)
+        rows = sorted(summary["steps"].items(), key=lambda item: -item[1]["p95"])
+        for key, stats in rows[:limit]:
+            version, step = key.split("|", 1)
+            print(f"{version:<10}{step:<12}{stats['count']:>5}{stats['p50']:>8.2f}s{stats['p95']:>8.2f}s{stats['max']:>8.2f}s")
+
+    if summary["branches"]:
+        print(Fore.YELLOW + f"\n{'ANDROID':<10}{'KIND':<9}{'METHOD':<32}{'N':>5}{'FAIL':>6}{'P50':>9}{'P95':>9}"
+              + Style.RESET_ALL)
+        rows = sorted(summary["branches"].items(), key=lambda item: -item[1]["p95"])
+        for key, stats in rows[:limit]:
+            version, kind, method = key.split("|", 2)
+            color = Fore.RED if stats["failed"] else ""
+            print(color + f"{version:<10}{kind:<9}{method[:31]:<32}{stats['count']:>5}{stats['failed']:>6}"
+                  f"{stats['p50']:>8.2f}s{stats['p95']:>8.2f}s" + Style.RESET_ALL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate JSON-lines install traces (phssl.py --trace)")
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("traces", nargs="+", help="trace files written with --trace")
+    parser.add_argument("--json", action="store_true", help="print the aggregate as JSON")
+    parser.add_argument("--top", type=int, help="only the N slowest rows per table")
+    args = parser.parse_args(argv)
+
+    summary = summarize(load(args.traces))
+    if args.json:
+        print(json.dumps(summary, indent=1))
+    else:
+        print_summary(summary, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import concurrent.futures
+from colorama import init, Fore, Style
+import cert
+import lint
+import phssl
+import adbclient
+import setup_wifi
+
+init()
+
+# One call per attached device decides whether there is anything to do: the digests of the
+# wanted <hash>.0 files in the store conscrypt reads, and the current proxy
+STATE_COMMAND = ('D={cacerts}; [ -d {apex} ] && D={apex}; echo "KB STORE $D"; sha256sum {paths} 2>/dev/null; '
+                 'echo "KB PROXY $(settings get global http_proxy)"')
+
+
+def device_updates(heartbeat=1.0):
+    """Device lists from one track-devices stream (None every heartbeat without changes)
+
+    Falls back to polling 'adb devices' when no adb server socket answers.
+    """
+    if adbclient.BACKEND != "subprocess":
+        try:
+            yield from adbclient.get_client().track_devices(heartbeat)
+        except adbclient.AdbServerUnavailable:
+            if adbclient.BACKEND == "socket":
+                raise
+    while True:
+        yield adbclient.list_devices()
+        time.sleep(heartbeat)
+
+
+class Watcher:
+    """Provision devices as they are plugged in
+
+    A serial must stay online for settle seconds before anything runs on it, so a cable
+    that flaps is handled once it is stable, not on every reconnect. Work runs on a
+    bounded pool, so a whole hub coming up at once is worked through at a steady rate.
+    """
+
+    def __init__(self, files, proxy=None, settle=2.0, workers=8, timeout=120, live=True, reboot="never", log=print):
+        self.files = files
+        self.names = {os.path.basename(file): file for file in files}
+        self.digests = {}
+        for name, file in self.names.items():
+            with open(file, "rb") as f:
+                self.digests[name] = hashlib.sha256(f.read()).hexdigest()
+        self.proxy = proxy
+        self.settle = settle
+        self.timeout = timeout
+        self.live = live
+        self.reboot = reboot
+        self.log = log
+        self.lock = threading.Lock()
+        self.online = {}          # serial -> when it came online (this connection)
+        self.handled = set()      # serials already dispatched during their current connection
+        self.active = set()
+        self.results = []
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="watch")
+
+    def update(self, devices, now):
+        """Apply one device list: start the settle timer for new serials, reset it for ones that left"""
+        online = {serial for serial, state in devices if state == "device"}
+        with self.lock:
+            for serial in online - set(self.online):
+                self.online[serial] = now
+            for serial in set(self.online) - online:
+                del self.online[serial]
+                self.handled.discard(serial)
+
+    def dispatch(self, now):
+        """Queue every serial that has been online for settle seconds and is not handled yet"""
+        with self.lock:
+            due = sorted((serial, since) for serial, since in self.online.items()
+                         if now - since >= self.settle and serial not in self.handled and serial not in self.active)
+            for serial, _ in due:
+                self.handled.add(serial)
+                self.active.add(serial)
+        for serial, since in due:
+            self.pool.submit(self.provision, serial, since)
+
+    def idle(self):
+        with self.lock:
+            return not self.active and set(self.online) <= self.handled
+
+    def check_state(self, serial):
+        """(store, {name: sha256}, proxy) read with one adb call"""
+        paths = " ".join(f"$D/{name}" for name in self.names)
+        command = STATE_COMMAND.format(cacerts=phssl.CACERTS_DIR, apex=phssl.APEX_CACERTS_DIR, paths=paths)
+        run = phssl.run_adb(["shell", command], serial, timeout=15, op="watch")
+        store, digests, proxy = None, {}, None
+        for line in run.stdout.splitlines():
+            if line.startswith("KB STORE "):
+                store = line.split()[2]
+            elif line.startswith("KB PROXY"):
+                proxy = line[len("KB PROXY"):].strip()
+            else:
+                parts = line.split()
+                if len(parts) == 2 and os.path.basename(parts[1]) in self.names:
+                    digests[os.path.basename(parts[1])] = parts[0].lower()
+        return store, digests, proxy
+
+    def provision(self, serial, since):
+        """Bring one device to the configured state, doing only what differs (pool worker)"""
+        summary = {"serial": serial, "status": "failed", "installed": [], "proxy": None}
+        try:
+            store, digests, proxy = self.check_state(serial)
+            if store is None:
+                raise RuntimeError("no answer")
+            missing = [file for name, file in self.names.items() if digests.get(name) != self.digests[name]]
+            wanted_proxy = f"{self.proxy[0]}:{self.proxy[1]}" if self.proxy else None
+            if missing:
+                result = phssl.install_on_device(serial, missing, self.timeout, self.reboot, transfer="tar",
+                                                 live=self.live)
+                summary["installed"] = [os.path.basename(file) for file in missing]
+                if not result["status"].startswith("installed"):
+                    raise RuntimeError(result["status"])
+            if wanted_proxy and proxy != wanted_proxy:
+                if not asyncio.run(setup_wifi.set_wifi_proxy(serial, *self.proxy)):
+                    raise RuntimeError("proxy not set")
+                summary["proxy"] = wanted_proxy
+            summary["status"] = "provisioned" if missing or summary["proxy"] else "matched"
+        except Exception as e:
+            summary["status"] = f"failed: {e}"
+        summary["seconds"] = round(time.monotonic() - since, 3)
+        with self.lock:
+            self.active.discard(serial)
+            self.results.append(summary)
+            # Under the lock: lines from parallel workers must not interleave
+            self.report(summary)
+        return summary
+
+    def report(self, summary):
+        ok = not summary["status"].startswith("failed")
+        changes = summary["installed"] + ([f"proxy {summary['proxy']}"] if summary["proxy"] else [])
+        self.log((Fore.GREEN + "✓" if ok else Fore.RED + "✗") + f" {summary['serial']}: {summary['status']}"
+                 + (f" ({', '.join(changes)})" if changes else "") + f" {summary['seconds']:.2f}s after attach"
+                 + Style.RESET_ALL)
+
+    def run(self, stop=None, once=False, heartbeat=0.5):
+        """Follow the device list until stop is set (or, with once, until the first devices are done)"""
+        stop = stop or threading.Event()
+        # Settle timers are only looked at when the stream yields
+        heartbeat = max(0.05, min(heartbeat, self.settle / 4))
+        while not stop.is_set():
+            try:
+                for devices in device_updates(heartbeat):
+                    now = time.monotonic()
+                    if devices is not None:
+                        self.update(devices, now)
+                    self.dispatch(now)
+                    if stop.is_set() or (once and self.idle()):
+                        return
+            except (adbclient.AdbError, OSError) as e:
+                # adb server restarted or went away: every device shows up as new on the next stream
+                self.log(Fore.YELLOW + f"Device stream lost ({e}), reconnecting..." + Style.RESET_ALL)
+                with self.lock:
+                    self.online.clear()
+                    self.handled.clear()
+                stop.wait(1.0)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def prepare_files(sources, work, check=True):
+    """Convert DER/PEM/.0 inputs into <hash>.0 files in work; with check, lint errors raise ValueError"""
+    files = []
+    for source in sources:
+        with open(source, "rb") as f:
+            data = f.read()
+        if check:
+            for warning in lint.check_bytes(data, source):
+                print(Fore.YELLOW + f"{source}: {warning}" + Style.RESET_ALL)
+        cert_hash, pem = cert.convert_bytes(data)
+        path = os.path.join(work, f"{cert_hash}.0")
+        with open(path, "w", newline="\n") as f:
+            f.write(pem)
+        files.append(path)
+    return files
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Watch for devices being plugged in and provision each one")
+    parser.add_argument("certs", nargs="*", help="DER/PEM/.0 certificates every device should trust")
+    parser.add_argument("--proxy", metavar="HOST:PORT", help="Wi-Fi proxy every device should use")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds a device must stay online before it is provisioned (default: 2)")
+    parser.add_argument("--workers", type=int, default=8, help="devices provisioned at once (default: 8)")
+    parser.add_argument("--timeout", type=float, default=120, help="overall seconds allowed per device (default: 120)")
+    parser.add_argument("--reboot", choices=["never", "always", "auto"], default="never")
+    parser.add_argument("--no-live", dest="live", action="store_false",
+                        help="skip the overlay/process restart/trust check of a live install")
+    parser.add_argument("--no-lint", dest="lint", action="store_false",
+                        help="skip the pre-flight certificate checks (CA flag, expiry, see lint.py)")
+    parser.add_argument("--once", action="store_true", help="provision the devices attached now, then exit")
+    args = parser.parse_args(argv)
+    if not args.certs and not args.proxy:
+        parser.error("nothing to apply: give certificates and/or --proxy")
+    if args.proxy and not args.proxy.rpartition(":")[2].isdigit():
+        parser.error("--proxy must be HOST:PORT")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not phssl.check_adb_installed():
+        return 3
+    proxy = args.proxy.rpartition(":")[::2] if args.proxy else None
+    with tempfile.TemporaryDirectory(prefix="kalla_billa_") as work:
+        try:
+            files = prepare_files(args.certs, work, args.lint)
+        except (OSError, ValueError) as e:
+            print(Fore.RED + str(e) + Style.RESET_ALL)
+            return 2
+        watcher = Watcher(files, proxy, args.settle, args.workers, args.timeout, args.live, args.reboot)
+        print(Fore.CYAN + f"Watching for devices: {len(files)} cert(s)"
+              + (f", proxy {args.proxy}" if proxy else "") + (", Ctrl+C to stop" if not args.once else "")
+              + Style.RESET_ALL)
+        start = time.monotonic()
+        try:
+            watcher.run(once=args.once)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+    results = watcher.results
+    failed = [summary for summary in results if summary["status"].startswith("failed")]
+    minutes = max(time.monotonic() - start, 1e-9) / 60
+    print(Fore.CYAN + f"{len(results)} device(s): {sum(s['status'] == 'provisioned' for s in results)} provisioned, "
+          f"{sum(s['status'] == 'matched' for s in results)} already matched, {len(failed)} failed "
+          f"({len(results) / minutes:.1f}/min)" + Style.RESET_ALL)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,465 @@
+import os
+import sys
+import json
+import time
+import struct
+import socket
+import asyncio
+import argparse
+import ipaddress
+import threading
+import concurrent.futures
+from colorama import init, Fore, Style
+import adbclient
+from certcache import default_cache_dir
+
+init()
+
+# Port 'adb tcpip' opens by default; Android 11+ wireless debugging picks a random one (found over mDNS)
+DEFAULT_PORT = 5555
+
+# A CIDR wider than this is almost certainly a typo (a /16 is 65k connects)
+MAX_HOSTS = 4096
+
+# adb transport packets (adb protocol.txt): command, arg0, arg1, data length, data checksum, magic
+A_CNXN, A_AUTH, A_STLS = 0x4e584e43, 0x48545541, 0x534c5453
+A_VERSION = 0x01000001
+MAX_PAYLOAD = 256 * 1024
+
+MDNS_GROUP = ("224.0.0.251", 5353)
+MDNS_SERVICES = ("_adb._tcp.local", "_adb-tls-connect._tcp.local")
+
+# ioctl requests for an interface's IPv4 address and netmask
+SIOCGIFADDR = {"linux": 0x8915, "darwin": 0xc0206921}
+SIOCGIFNETMASK = {"linux": 0x891b, "darwin": 0xc0206925}
+
+
+def _ioctl_ipv4(sock, request, name):
+    import fcntl
+    packed = fcntl.ioctl(sock.fileno(), request, struct.pack("256s", name.encode()[:15]))
+    return socket.inet_ntoa(packed[20:24])
+
+
+def interface_addresses():
+    """[{interface, address, prefix}] for every interface with an IPv4 address, read from the kernel
+
+    Needs no route to the internet, unlike connecting a UDP socket to a public address.
+    """
+    platform = "darwin" if sys.platform == "darwin" or "bsd" in sys.platform else sys.platform
+    addresses = []
+    if platform in SIOCGIFADDR and hasattr(socket, "if_nameindex"):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for _, name in socket.if_nameindex():
+                try:
+                    address = _ioctl_ipv4(sock, SIOCGIFADDR[platform], name)
+                    netmask = _ioctl_ipv4(sock, SIOCGIFNETMASK[platform], name)
+                except (OSError, ImportError):
+                    continue     # down, no IPv4 address, or no fcntl
+                prefix = ipaddress.IPv4Network(f"0.0.0.0/{netmask}").prefixlen
+                addresses.append({"interface": name, "address": address, "prefix": prefix})
+    if not addresses:
+        # Windows and exotic platforms: whatever the host name resolves to, netmask unknown
+        try:
+            infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+        except OSError:
+            infos = []
+        for address in dict.fromkeys(info[4][0] for info in infos):
+            addresses.append({"interface": None, "address": address, "prefix": 24})
+    return addresses
+
+
+def primary_address():
+    """The address devices on the LAN most likely reach this computer at, or None"""
+    candidates = [entry["address"] for entry in interface_addresses()
+                  if not ipaddress.ip_address(entry["address"]).is_loopback]
+    # Prefer private LAN addresses over link-local (169.254/16) and anything else
+    candidates.sort(key=lambda address: (not ipaddress.ip_address(address).is_private,
+                                         ipaddress.ip_address(address).is_link_local))
+    if candidates:
+        return candidates[0]
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+def hosts_for(spec):
+    """Host addresses to probe for an interface name or a CIDR, without this computer's own"""
+    local = interface_addresses()
+    own = {entry["address"] for entry in local}
+    entry = next((entry for entry in local if entry["interface"] == spec), None)
+    try:
+        if entry:
+            network = ipaddress.ip_network(f"{entry['address']}/{entry['prefix']}", strict=False)
+        else:
+            network = ipaddress.ip_network(spec, strict=False)
+    except ValueError:
+        raise ValueError(f"{spec}: not an interface with an IPv4 address or a CIDR like 192.168.1.0/24")
+    if network.num_addresses > MAX_HOSTS:
+        raise ValueError(f"{spec}: {network.num_addresses} addresses, more than the {MAX_HOSTS} allowed")
+    hosts = [str(host) for host in network.hosts()] if network.num_addresses > 1 else [str(network.network_address)]
+    return [host for host in hosts if host not in own or network.is_loopback]
+
+
+def cnxn_packet():
+    """The CNXN packet a host sends first on a device transport"""
+    banner = b"host::\0"
+    return struct.pack("<6I", A_CNXN, A_VERSION, MAX_PAYLOAD, len(banner), sum(banner) & 0xffffffff,
+                       A_CNXN ^ 0xffffffff) + banner
+
+
+async def probe(host, port, timeout=1.0):
+    """True when host:port answers a CNXN like adbd (CNXN, or AUTH/STLS for keys and TLS)"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(cnxn_packet())
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(24), timeout)
+        command, _, _, _, _, magic = struct.unpack("<6I", header)
+        return command in (A_CNXN, A_AUTH, A_STLS) and magic == command ^ 0xffffffff
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        writer.close()
+
+
+async def scan(hosts, ports=(DEFAULT_PORT,), limit=256, timeout=1.0):
+    """Probe every host:port at once (at most limit connects in flight); returns the adbd addresses"""
+    semaphore = asyncio.Semaphore(max(1, limit))
+    targets = [f"{host}:{port}" for host in hosts for port in ports]
+
+    async def one(target):
+        host, _, port = target.rpartition(":")
+        async with semaphore:
+            return await probe(host, int(port), timeout)
+
+    found = await asyncio.gather(*(one(target) for target in targets))
+    return [target for target, ok in zip(targets, found) if ok]
+
+
+# -- mDNS -------------------------------------------------------------------
+
+def _dns_name(packet, offset):
+    """Decode a (possibly compressed) DNS name; returns (name, offset after it)"""
+    labels, end = [], None
+    for _ in range(64):
+        length = packet[offset]
+        if length >= 0xc0:
+            end = end or offset + 2
+            offset = ((length & 0x3f) << 8) | packet[offset + 1]
+        elif length:
+            labels.append(packet[offset + 1:offset + 1 + length].decode(errors="replace"))
+            offset += 1 + length
+        else:
+            return ".".join(labels), end or offset + 1
+    raise ValueError("DNS name loop")
+
+
+def _dns_records(packet):
+    """(name, type, rdata offset, rdata) for every answer/authority/additional record"""
+    _, _, questions, *counts = struct.unpack(">6H", packet[:12])
+    offset = 12
+    for _ in range(questions):
+        offset = _dns_name(packet, offset)[1] + 4
+    for _ in range(sum(counts)):
+        name, offset = _dns_name(packet, offset)
+        kind, _, _, length = struct.unpack(">HHIH", packet[offset:offset + 10])
+        offset += 10
+        yield name, kind, offset, packet[offset:offset + length]
+        offset += length
+
+
+def mdns_query(timeout=2.0):
+    """Ask the LAN for adb services directly; returns (instance, service, 'ip:port') triples"""
+    question = b"".join(
+        b"".join(bytes([len(label)]) + label.encode() for label in service.split(".")) + b"\0"
+        + struct.pack(">HH", 12, 0x8001)   # PTR, class IN with the unicast-response bit
+        for service in MDNS_SERVICES)
+    packet = struct.pack(">6H", 0, 0, len(MDNS_SERVICES), 0, 0, 0) + question
+    pointers, targets, hosts = {}, {}, {}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.settimeout(0.2)
+        try:
+            sock.sendto(packet, MDNS_GROUP)
+        except OSError:
+            return []
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                reply = sock.recvfrom(9000)[0]
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                for name, kind, offset, rdata in _dns_records(reply):
+                    if kind == 12 and name in MDNS_SERVICES:
+                        pointers[_dns_name(reply, offset)[0]] = name
+                    elif kind == 33:
+                        targets[name] = (_dns_name(reply, offset + 6)[0], struct.unpack(">H", rdata[4:6])[0])
+                    elif kind == 1 and len(rdata) == 4:
+                        hosts[name] = socket.inet_ntoa(rdata)
+            except (ValueError, IndexError, struct.error):
+                continue
+    services = []
+    for instance, service in pointers.items():
+        target, port = targets.get(instance, (None, None))
+        if target in hosts:
+            services.append((instance.split(".")[0], service, f"{hosts[target]}:{port}"))
+    return services
+
+
+def mdns_services(timeout=2.0):
+    """adb services on the LAN: the adb server's own mDNS browser first, a direct query otherwise"""
+    try:
+        services = adbclient.get_client().mdns_services()
+    except (adbclient.AdbServerUnavailable, adbclient.AdbError, OSError):
+        services = []
+        for line in adbclient.run_subprocess(["mdns", "services"], timeout=timeout + 5).stdout.splitlines():
+            parts = line.strip().split("\t")
+            if len(parts) == 3:
+                services.append(tuple(parts))
+    return services or mdns_query(timeout)
+
+
+def discover(specs=(), ports=(DEFAULT_PORT,), mdns=False, limit=256, timeout=1.0):
+    """adbd addresses found by probing interfaces/CIDRs and, with mdns, by service discovery"""
+    hosts = list(dict.fromkeys(host for spec in specs for host in hosts_for(spec)))
+    found = asyncio.run(scan(hosts, ports, limit, timeout)) if hosts else []
+    if mdns:
+        # _adb-tls-pairing services need 'adb pair' first; only connect services are useful here
+        found += [address for _, service, address in mdns_services()
+                  if not service.startswith("_adb-tls-pairing")]
+    return list(dict.fromkeys(found))
+
+
+# -- connection pool ----------------------------------------------------------
+
+class WirelessPool:
+    """adb-over-TCP devices this computer keeps connected: remembered addresses, health checks, reconnects
+
+    Addresses live in wireless.json in the cache directory, so a fleet discovered once
+    is reconnected by later runs without scanning again.
+    """
+
+    def __init__(self, cache_dir=None, workers=32, interval=15.0, timeout=5.0):
+        self.path = os.path.join(cache_dir or default_cache_dir(), "wireless.json")
+        self.workers = workers
+        self.interval = interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def _note(self, address, **fields):
+        with self.lock:
+            self.entries.setdefault(address, {"added": time.time(), "reconnects": 0}).update(fields)
+            self._save()
+
+    def addresses(self):
+        with self.lock:
+            return sorted(self.entries)
+
+    def forget(self, address=None):
+        """Drop one remembered address, or all of them; returns how many were dropped"""
+        with self.lock:
+            gone = [a for a in self.entries if address in (None, a)]
+            for a in gone:
+                del self.entries[a]
+            self._save()
+        return len(gone)
+
+    def connect(self, address):
+        """'adb connect' one address and remember it; returns the server's message"""
+        if ":" not in address:
+            address = f"{address}:{DEFAULT_PORT}"
+        result = adbclient.run(["connect", address], timeout=self.timeout)
+        message = (result.stdout + result.stderr).strip()
+        ok = message.startswith(("connected to", "already connected to"))
+        self._note(address, state="connected" if ok else "refused", checked=time.time(), message=message)
+        return ok, message
+
+    def healthy(self, address, states=None):
+        """Listed as 'device' by the server and answering a shell round trip"""
+        states = dict(adbclient.list_devices()) if states is None else states
+        if states.get(address) != "device":
+            return False
+        ping = adbclient.run(["shell", "echo kb-ping"], address, timeout=self.timeout)
+        return ping.returncode == 0 and ping.stdout.strip() == "kb-ping"
+
+    def heal(self, address, states=None):
+        """Health-check one address; reconnect it (disconnect first: a half-dead transport lingers) if it fails"""
+        if self.healthy(address, states):
+            self._note(address, state="connected", checked=time.time())
+            return "ok"
+        adbclient.run(["disconnect", address], timeout=self.timeout)
+        ok, message = self.connect(address)
+        if ok and self.healthy(address):
+            with self.lock:
+                reconnects = self.entries[address].get("reconnects", 0) + 1
+            self._note(address, reconnects=reconnects)
+            return "reconnected"
+        self._note(address, state="down", message=message)
+        return "down"
+
+    def _each(self, function, addresses):
+        addresses = list(addresses)
+        if not addresses:
+            return {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(addresses)))) as pool:
+            return dict(zip(addresses, pool.map(function, addresses)))
+
+    def connect_all(self, addresses=None):
+        """Connect the given (or every remembered) address at once; returns {address: (ok, message)}"""
+        return self._each(self.connect, self.addresses() if addresses is None else addresses)
+
+    def check_all(self):
+        """One health pass over the pool; returns {address: 'ok' | 'reconnected' | 'down'}"""
+        states = dict(adbclient.list_devices())
+        return self._each(lambda address: self.heal(address, states), self.addresses())
+
+    def live(self):
+        """Remembered addresses the server currently lists as online devices"""
+        states = dict(adbclient.list_devices())
+        return [address for address in self.addresses() if states.get(address) == "device"]
+
+    def start(self, on_change=None):
+        """Keep the pool healthy from a background thread until stop(); returns self
+
+        Starting a running pool does nothing, so 'with pool.start(...)' runs one thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        def keepalive():
+            while not self._stop.wait(self.interval):
+                for address, status in self.check_all().items():
+                    if status != "ok" and on_change:
+                        on_change(address, status)
+        self._stop.clear()
+        self._thread = threading.Thread(target=keepalive, name="wireless-keepalive", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def print_statuses(statuses):
+    colors = {"ok": Fore.GREEN, "reconnected": Fore.YELLOW, "connected": Fore.GREEN}
+    for address, status in sorted(statuses.items()):
+        print(colors.get(status, Fore.RED) + f"  {address}: {status}" + Style.RESET_ALL)
+
+
+def report_connects(results):
+    print_statuses({address: "connected" if ok else message for address, (ok, message) in results.items()})
+    return 0 if all(ok for ok, _ in results.values()) else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Find, connect and keep alive adb-over-TCP devices")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="cache directory (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=32, help="connects and health checks at once (default: 32)")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds allowed per adb call (default: 5)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("addresses", help="this computer's IPv4 addresses, read from the network interfaces")
+    discover_parser = sub.add_parser("discover", help="probe interfaces/CIDRs for adbd and/or browse mDNS")
+    discover_parser.add_argument("targets", nargs="*", help="interface names or CIDRs, e.g. wlan0 or 10.0.4.0/24")
+    discover_parser.add_argument("-p", "--port", type=int, action="append",
+                                 help=f"port to probe (repeatable, default: {DEFAULT_PORT})")
+    discover_parser.add_argument("--mdns", action="store_true", help="also browse _adb._tcp/_adb-tls-connect._tcp")
+    discover_parser.add_argument("--probe-timeout", type=float, default=1.0, help="seconds per connect probe")
+    discover_parser.add_argument("--limit", type=int, default=256, help="probes in flight at once (default: 256)")
+    discover_parser.add_argument("--connect", action="store_true", help="connect and remember what was found")
+    connect_parser = sub.add_parser("connect", help="connect and remember addresses (default: remembered ones)")
+    connect_parser.add_argument("addresses", nargs="*", help="HOST[:PORT]")
+    sub.add_parser("status", help="health-check the pool once, reconnecting dropped devices")
+    keepalive_parser = sub.add_parser("keepalive", help="health-check the pool every --interval until interrupted")
+    keepalive_parser.add_argument("--interval", type=float, default=15, help="seconds between checks (default: 15)")
+    disconnect_parser = sub.add_parser("disconnect", help="disconnect and forget addresses (default: all)")
+    disconnect_parser.add_argument("addresses", nargs="*")
+    args = parser.parse_args(argv)
+    if args.command == "discover" and not args.targets and not args.mdns:
+        parser.error("discover needs an interface, a CIDR or --mdns")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pool = WirelessPool(args.cache_dir, args.workers, getattr(args, "interval", 15), args.timeout)
+    if args.command == "addresses":
+        primary = primary_address()
+        for entry in interface_addresses():
+            mark = " (primary)" if entry["address"] == primary else ""
+            print(f"{entry['interface'] or '?':<12} {entry['address']}/{entry['prefix']}{mark}")
+        return 0
+    if args.command == "discover":
+        try:
+            found = discover(args.targets, args.port or (DEFAULT_PORT,), args.mdns, args.limit, args.probe_timeout)
+        except ValueError as e:
+            print(Fore.RED + str(e) + Style.RESET_ALL)
+            return 2
+        print(Fore.CYAN + f"{len(found)} adb device(s) found" + Style.RESET_ALL)
+        if not args.connect:
+            for address in found:
+                print(f"  {address}")
+            return 0
+        return report_connects(pool.connect_all(found))
+    if args.command == "connect":
+        addresses = args.addresses or pool.addresses()
+        if not addresses:
+            print(Fore.RED + "No addresses given or remembered; run 'discover --connect' first." + Style.RESET_ALL)
+            return 2
+        return report_connects(pool.connect_all(addresses))
+    if args.command == "status":
+        statuses = pool.check_all()
+        print_statuses(statuses)
+        return 0 if all(status != "down" for status in statuses.values()) else 1
+    if args.command == "keepalive":
+        print(Fore.CYAN + f"Checking {len(pool.addresses())} device(s) every {args.interval:g}s, "
+              "Ctrl+C to stop" + Style.RESET_ALL)
+        try:
+            with pool.start(on_change=lambda address, status: print_statuses({address: status})):
+                while True:
+                    time.sleep(3600)
+        except KeyboardInterrupt:
+            return 0
+    for address in args.addresses or pool.addresses():
+        adbclient.run(["disconnect", address], timeout=args.timeout)
+        pool.forget(address)
+        print(f"  {address}: disconnected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())